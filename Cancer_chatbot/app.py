@@ -6,15 +6,19 @@ load_dotenv()
 
 import uuid
 import json
+import math
 import re
-from datetime import datetime
+from datetime import datetime, timezone
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 
-from rag import rag
+from rag import rag, rag_stream, finish_streamed_answer, evaluate_relevance_batch, answer_cache, retrieval_cache, question_flight, groq_pool, rate_limiter, index, index_reloader
+from evaluation import EVAL_ASYNC, PENDING, EvaluationQueue
+from rate_limit import RateLimitExceeded
 
 import db
+from rollups import RollupRefresher
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for mobile app
@@ -32,6 +36,12 @@ CANCER_KEYWORDS = [
 ]
 CANCER_KEYWORD_RE = re.compile("|".join(re.escape(k) for k in CANCER_KEYWORDS), re.I)
 
+# Largest page /history returns, whatever ?limit= asks for
+HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", "200"))
+
+# Returned with 503 when the LLM rate limiter sheds a question.
+BUSY_MESSAGE = "The assistant is handling a lot of questions right now. Please try again in a moment."
+
 
 @app.route("/")
 def home():
@@ -558,25 +568,30 @@ def home():
                         const sourceItem = document.createElement('div');
                         sourceItem.className = 'source-item';
                         
-                        const sourceTitle = document.createElement('a');
+                        const sourceTitle = document.createElement(source.link ? 'a' : 'div');
                         sourceTitle.className = 'source-title';
-                        sourceTitle.href = source.link;
-                        sourceTitle.target = '_blank';
+                        if (source.link) {
+                            sourceTitle.href = source.link;
+                            sourceTitle.target = '_blank';
+                        }
                         sourceTitle.textContent = `${index + 1}. ${source.title}`;
                         
                         const sourceSnippet = document.createElement('div');
                         sourceSnippet.className = 'source-snippet';
                         sourceSnippet.textContent = source.snippet;
                         
-                        const sourceLink = document.createElement('a');
-                        sourceLink.className = 'source-link';
-                        sourceLink.href = source.link;
-                        sourceLink.target = '_blank';
-                        sourceLink.textContent = source.link;
-                        
                         sourceItem.appendChild(sourceTitle);
                         sourceItem.appendChild(sourceSnippet);
-                        sourceItem.appendChild(sourceLink);
+                        
+                        // Knowledge base entries have no link
+                        if (source.link) {
+                            const sourceLink = document.createElement('a');
+                            sourceLink.className = 'source-link';
+                            sourceLink.href = source.link;
+                            sourceLink.target = '_blank';
+                            sourceLink.textContent = source.link;
+                            sourceItem.appendChild(sourceLink);
+                        }
                         sourcesContainer.appendChild(sourceItem);
                     });
                     
@@ -634,7 +649,8 @@ def home():
                 addTypingIndicator();
                 
                 try {
-                    const response = await fetch('/question', {
+                    // Answers arrive as server-sent events: sources, then tokens, then done
+                    const response = await fetch('/question/stream', {
                         method: 'POST',
                         headers: {'Content-Type': 'application/json'},
                         body: JSON.stringify({
@@ -642,19 +658,62 @@ def home():
                             conversation_history: conversationHistory
                         })
                     });
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                    
+                    const reader = response.body.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
+                    let answer = '';
+                    let sources = [];
+                    let done = null;
+                    let failed = false;
+                    let errorMessage = 'Sorry, I encountered an error. Please try again.';
+                    let botMessage = null;
                     
-                    const data = await response.json();
+                    while (!done && !failed) {
+                        const chunk = await reader.read();
+                        if (chunk.done) break;
+                        buffer += decoder.decode(chunk.value, {stream: true});
+                        
+                        let boundary;
+                        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                            const frame = buffer.slice(0, boundary);
+                            buffer = buffer.slice(boundary + 2);
+                            const event = (frame.match(/^event: (.*)$/m) || [])[1];
+                            const payload = JSON.parse((frame.match(/^data: (.*)$/m) || [])[1] || 'null');
+                            
+                            if (event === 'sources') {
+                                sources = payload || [];
+                            } else if (event === 'token') {
+                                answer += payload;
+                                if (!botMessage) {
+                                    removeTypingIndicator();
+                                    botMessage = addMessage(answer, false);
+                                } else {
+                                    botMessage.querySelector('.message-content').innerHTML = parseMarkdown(answer);
+                                    chatContainer.scrollTop = chatContainer.scrollHeight;
+                                }
+                            } else if (event === 'done') {
+                                done = payload;
+                            } else if (event === 'error') {
+                                failed = true;
+                                // Only the busy (rate limited) error carries a message worth showing
+                                if (payload && payload.retry_after) errorMessage = payload.error;
+                            }
+                        }
+                    }
                     removeTypingIndicator();
+                    if (botMessage) botMessage.remove();
                     
-                    if (data.error) {
-                        addMessage('Sorry, I encountered an error. Please try again.', false);
+                    if (failed || !done) {
+                        addMessage(errorMessage, false);
                     } else {
-                        addMessage(data.answer, false, data.sources || []);
-                        conversationId = data.conversation_id;
+                        addMessage(answer, false, sources);
+                        conversationId = done.conversation_id;
                         
                         // Update conversation history
                         conversationHistory.push({role: 'user', content: question});
-                        conversationHistory.push({role: 'assistant', content: data.answer});
+                        conversationHistory.push({role: 'assistant', content: answer});
                         
                         // Keep only last 10 messages (5 Q&A pairs) to avoid token limits
                         if (conversationHistory.length > 10) {
@@ -687,27 +746,12 @@ def home():
     """
 
 
-@app.route("/question", methods=["POST"])
-def handle_question():
-    data = request.json
-    question = data["question"]
-    turn_history = data.get("conversation_history", [])
-
-    if not question:
-        return jsonify({"error": "No question provided"}), 400
-
-    conversation_id = data.get("conversation_id") or str(uuid.uuid4())
-    
+def canned_answer(question, turn_history):
+    """Fixed reply for greetings and questions that are not about cancer, or None."""
     # Check for greetings
     greetings = ['hi', 'hello', 'hey', 'hii', 'hiii', 'good morning', 'good afternoon', 'good evening', 'greetings']
     if question.strip().lower() in greetings:
-        result = {
-            "conversation_id": conversation_id,
-            "question": question,
-            "answer": "Hello! 👋 I'm a Cancer Q&A assistant. Ask me anything about cancer types, prevention, diagnosis, or treatment.",
-            "sources": []
-        }
-        return jsonify(result)
+        return "Hello! 👋 I'm a Cancer Q&A assistant. Ask me anything about cancer types, prevention, diagnosis, or treatment."
     
     # Check if question is cancer-related
     is_cancer_related = bool(CANCER_KEYWORD_RE.search(question))
@@ -720,30 +764,48 @@ def handle_question():
         is_cancer_related = bool(CANCER_KEYWORD_RE.search(history_text))
     
     if not is_cancer_related:
-        result = {
-            "conversation_id": conversation_id,
-            "question": question,
-            "answer": "🩺 I'm specifically designed to answer questions about **cancer** only. Please ask me about cancer types, symptoms, diagnosis, treatment, prevention, or related topics. I'm here to help with your cancer-related questions!",
-            "sources": []
-        }
-        return jsonify(result)
+        return "🩺 I'm specifically designed to answer questions about **cancer** only. Please ask me about cancer types, symptoms, diagnosis, treatment, prevention, or related topics. I'm here to help with your cancer-related questions!"
 
-    try:
-        answer_data = rag(question, conversation_history=turn_history)
-    except Exception as e:
-        app.logger.error(f"Error processing question: {type(e).__name__}: {e}")
-        app.logger.error(traceback.format_exc())
-        return jsonify({"error": "Internal server error"}), 500
-    
+    return None
+
+
+def cache_relevance(question, model, answer, relevance, explanation):
+    # Later cache hits on this answer reuse the verdict instead of going to the judge again
+    answer_cache.update(question, model, answer, {"relevance": relevance, "relevance_explanation": explanation})
+
+
+def apply_relevance(results):
+    """Writes background relevance evaluations to the database, the in-memory history and the answer cache."""
+    db.update_relevance(results)
+
+    by_id = {r["conversation_id"]: r for r in results}
+    for conversation in in_memory_conversations:
+        if conversation["id"] in by_id:
+            conversation["relevance"] = by_id[conversation["id"]]["relevance"]
+
+    for r in results:
+        cache_relevance(r["question"], r["model"], r["answer"], r["relevance"], r["relevance_explanation"])
+
+
+evaluation_queue = EvaluationQueue(evaluate=evaluate_relevance_batch, on_result=apply_relevance).drain_at_exit()
 
-    result = {
-        "conversation_id": conversation_id,
-        "question": question,
-        "answer": answer_data["answer"],
-        "sources": answer_data.get("sources", [])
-    }
+
+# Keeps the Grafana rollup tables current while this worker is storing conversations
+rollup_refresher = RollupRefresher()
+
+
+def store_conversation(conversation_id, question, answer_data):
+    # Only fresh answers are pending; cached and shared ones take the verdict of the original
+    evaluate = answer_data.get("relevance") == PENDING and evaluation_queue.sample()
+    if answer_data.get("relevance") == PENDING and not evaluate:
+        answer_data["relevance"] = "UNKNOWN"
+        answer_data["relevance_explanation"] = "Not sampled for evaluation"
+        cache_relevance(question, answer_data.get("model_used", "gpt-oss"), answer_data["answer"],
+                        answer_data["relevance"], answer_data["relevance_explanation"])
 
     # Save to database if enabled
+    if db.USE_DB:
+        rollup_refresher.ensure_started()
     db.save_conversation(
         conversation_id=conversation_id,
         question=question,
@@ -765,9 +827,122 @@ def handle_question():
     if len(in_memory_conversations) > 100:
         in_memory_conversations.pop(0)
 
+    # The row exists now, so the evaluation can update it
+    if evaluate:
+        evaluation_queue.submit(conversation_id, question, answer_data["answer"], answer_data.get("model_used", "gpt-oss"))
+
+
+@app.route("/question", methods=["POST"])
+def handle_question():
+    data = request.json
+    question = data["question"]
+    turn_history = data.get("conversation_history", [])
+
+    if not question:
+        return jsonify({"error": "No question provided"}), 400
+
+    conversation_id = data.get("conversation_id") or str(uuid.uuid4())
+    
+    canned = canned_answer(question, turn_history)
+    if canned is not None:
+        result = {
+            "conversation_id": conversation_id,
+            "question": question,
+            "answer": canned,
+            "sources": []
+        }
+        return jsonify(result)
+
+    try:
+        answer_data = rag(question, conversation_history=turn_history, evaluate=not EVAL_ASYNC)
+    except RateLimitExceeded as e:
+        app.logger.warning(f"Shedding question: {e}")
+        retry_after = math.ceil(e.retry_after)
+        return jsonify({"error": BUSY_MESSAGE, "retry_after": retry_after}), 503, {"Retry-After": str(retry_after)}
+    except Exception as e:
+        app.logger.error(f"Error processing question: {type(e).__name__}: {e}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({"error": "Internal server error"}), 500
+    
+
+    result = {
+        "conversation_id": conversation_id,
+        "question": question,
+        "answer": answer_data["answer"],
+        "sources": answer_data.get("sources", [])
+    }
+
+    store_conversation(conversation_id, question, answer_data)
+
     return jsonify(result)
 
 
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/question/stream", methods=["POST"])
+def handle_question_stream():
+    """
+    Same input as /question, answered as server-sent events: "sources" (list), then "token"
+    (answer text deltas), then "done" ({conversation_id, first_token_time, response_time}), or
+    "error". The answer is evaluated and saved after the stream has been sent.
+    """
+    data = request.json
+    question = data["question"]
+    turn_history = data.get("conversation_history", [])
+
+    if not question:
+        return jsonify({"error": "No question provided"}), 400
+
+    conversation_id = data.get("conversation_id") or str(uuid.uuid4())
+    streamed = {}
+
+    def generate():
+        canned = canned_answer(question, turn_history)
+        if canned is not None:
+            yield sse("sources", [])
+            yield sse("token", canned)
+            yield sse("done", {"conversation_id": conversation_id})
+            return
+
+        try:
+            for event, payload in rag_stream(question, conversation_history=turn_history):
+                if event == "answer":
+                    streamed["answer_data"] = payload
+                    yield sse("done", {
+                        "conversation_id": conversation_id,
+                        "first_token_time": payload["first_token_time"],
+                        "response_time": payload["response_time"],
+                    })
+                else:
+                    yield sse(event, payload)
+        except RateLimitExceeded as e:
+            app.logger.warning(f"Shedding question: {e}")
+            yield sse("error", {"error": BUSY_MESSAGE, "retry_after": math.ceil(e.retry_after)})
+        except Exception as e:
+            app.logger.error(f"Error streaming answer: {type(e).__name__}: {e}")
+            app.logger.error(traceback.format_exc())
+            yield sse("error", {"error": "Internal server error"})
+
+    response = Response(generate(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # keep proxies from buffering the stream
+
+    @response.call_on_close
+    def save_streamed_answer():
+        answer_data = streamed.get("answer_data")
+        if answer_data is None:
+            return
+        try:
+            finish_streamed_answer(question, answer_data, evaluate=not EVAL_ASYNC)
+            store_conversation(conversation_id, question, answer_data)
+        except Exception as e:
+            app.logger.error(f"Error saving streamed answer: {type(e).__name__}: {e}")
+
+    return response
+
+
 @app.route("/feedback", methods=["POST"])
 def handle_feedback():
     data = request.json
@@ -788,27 +963,95 @@ def handle_feedback():
     return jsonify(result)
 
 
+def _utc(timestamp):
+    """An ISO timestamp as an aware UTC datetime; naive ones are local time, as datetime.now() gives them."""
+    return datetime.fromisoformat(timestamp).astimezone(timezone.utc)
+
+
+def history_page(conversations, limit):
+    """The first limit conversations (newest first) and the cursor of the page after them, if any."""
+    if len(conversations) <= limit:
+        return conversations, None
+    last = conversations[limit - 1]
+    return conversations[:limit], db.encode_cursor(last["timestamp"], last["id"])
+
+
 @app.route("/history", methods=["GET"])
 def get_history():
-    """Get conversation history"""
+    """
+    Get conversation history, newest first. Pass the next_cursor of a response as ?cursor= to get
+    the page after it; next_cursor is null on the last page.
+    """
+    limit = min(max(request.args.get('limit', 50, type=int), 1), HISTORY_MAX_LIMIT)
+    relevance = request.args.get('relevance')
+    cursor = request.args.get('cursor')
     try:
-        limit = request.args.get('limit', 50, type=int)
-        
-        # Try to get from database first
-        conversations = db.get_recent_conversations(limit)
-        
-        # If database is empty or disabled, use in-memory storage
-        if not conversations:
-            # Return in-memory history (reversed to show newest first)
-            conversations = list(reversed(in_memory_conversations[-limit:]))
-        
-        return jsonify({"conversations": conversations})
+        before = db.decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # One extra row tells whether there is a next page
+        conversations = db.get_recent_conversations(limit + 1, relevance=relevance, before=before)
     except Exception as e:
         app.logger.error(f"Error fetching history: {e}")
-        # Fallback to in-memory storage
-        limit = request.args.get('limit', 50, type=int)
-        conversations = list(reversed(in_memory_conversations[-limit:]))
-        return jsonify({"conversations": conversations})
+        conversations = []
+
+    # If database is empty or disabled, use in-memory storage (newest first)
+    if not conversations:
+        before = before and (_utc(before[0]), before[1])
+        conversations = [
+            c for c in reversed(in_memory_conversations)
+            if (not before or (_utc(c["timestamp"]), c["id"]) < before)
+            and (not relevance or c["relevance"] == relevance)
+        ]
+
+    conversations, next_cursor = history_page(conversations, limit)
+    return jsonify({"conversations": conversations, "next_cursor": next_cursor})
+
+
+@app.route("/eval/stats", methods=["GET"])
+def get_eval_stats():
+    """Background relevance evaluation queue depth, lag and counters for this worker"""
+    return jsonify(evaluation_queue.stats())
+
+
+@app.route("/llm/stats", methods=["GET"])
+def get_llm_stats():
+    """Health and rate limiter budget of each Groq API key (by its last four characters) in this worker"""
+    return jsonify({"keys": groq_pool.stats(), "rate_limiter": rate_limiter.stats()})
+
+
+@app.route("/db/stats", methods=["GET"])
+def get_db_stats():
+    """Database connection pool, write-behind buffer and metrics rollup refresher of this worker"""
+    return jsonify({
+        "pool": db.db_pool.stats(),
+        "write_behind": db.write_buffer.stats(),
+        "rollups": rollup_refresher.stats(),
+    })
+
+
+@app.route("/cache/stats", methods=["GET"])
+def get_cache_stats():
+    """
+    Answer and retrieval cache counters (per worker for the memory backend, shared otherwise), and the
+    identical in-flight questions of this worker that shared one answer ("shared" rag chains saved)
+    """
+    return jsonify({
+        "answers": answer_cache.stats(),
+        "retrieval": retrieval_cache.stats(),
+        "coalesced": question_flight.stats(),
+    })
+
+
+@app.route("/index/stats", methods=["GET"])
+def get_index_stats():
+    """
+    Version, documents, pending deletes and changes since the last fit of this worker's search index,
+    and its reloads of new knowledge base versions
+    """
+    return jsonify({"index": index.stats(), "reloader": index_reloader.stats()})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,504 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from time import monotonic, time
+
+from scipy.sparse import vstack
+
+# Where answer and retrieval caches live: "memory" (per process), "sqlite" (a file shared by
+# every worker on the host) or "redis" (shared across hosts; pip install redis).
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "/tmp/cancer_qa_cache.sqlite3")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# 0 disables the answer cache.
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Cosine similarity above which a differently worded question reuses a cached answer; 0 disables it.
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+
+# 0 disables the retrieval (search results) cache.
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1000"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "3600"))
+
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    text = _NON_WORD_RE.sub(" ", (question or "").lower())
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def make_cache(namespace, max_size, ttl, backend=CACHE_BACKEND):
+    """
+    Creates a cache backend. All backends share the same interface: get(key), set(key, value),
+    stats() and len(); keys are strings and values must be JSON-serialisable.
+
+    Args:
+        namespace (str): Separates caches that share a SQLite file or Redis database.
+        max_size (int): Maximum number of entries before least recently used ones are evicted.
+        ttl (float): Seconds an entry stays valid; 0 or less keeps entries until evicted.
+        backend (str): "memory", "sqlite" or "redis".
+    """
+    if backend == "memory":
+        return LRUCache(max_size=max_size, ttl=ttl)
+    if backend == "sqlite":
+        return SQLiteCache(CACHE_SQLITE_PATH, max_size=max_size, ttl=ttl, namespace=namespace)
+    if backend == "redis":
+        return RedisCache(CACHE_REDIS_URL, max_size=max_size, ttl=ttl, namespace=namespace)
+    raise ValueError(f"Unknown cache backend {backend!r}, expected memory, sqlite or redis")
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with a per-entry time to live.
+
+    Values are kept as JSON, like the shared backends keep them, so every get returns a fresh copy
+    that callers may change without changing the cached entry.
+
+    Attributes:
+        max_size (int): Maximum number of entries; the least recently used entry is evicted beyond it.
+        ttl (float): Seconds an entry stays valid; 0 or less keeps entries until evicted.
+        hits, misses, evictions, expirations (int): Counters reported by stats().
+    """
+
+    def __init__(self, max_size=1000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value):
+        expires_at = monotonic() + self.ttl if self.ttl > 0 else None
+        value = json.dumps(value, default=_json_default)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SQLiteCache:
+    """
+    LRU cache with TTL in a SQLite file, shared by every process on the host that opens the same path.
+
+    Entries, access times and the hit/miss/eviction/expiration counters all live in the database, so
+    stats() reports totals across workers. Each process and thread opens its own connection, which
+    keeps the cache safe to use after gunicorn forks its workers.
+    """
+
+    def __init__(self, path=CACHE_SQLITE_PATH, max_size=1000, ttl=3600, namespace="default"):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.namespace = namespace
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_entries_lru ON cache_entries (namespace, accessed_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                namespace TEXT NOT NULL,
+                name TEXT NOT NULL,
+                value INTEGER NOT NULL,
+                PRIMARY KEY (namespace, name)
+            )
+        """)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _incr(self, conn, name, amount=1):
+        conn.execute(
+            "INSERT INTO cache_stats (namespace, name, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (namespace, name) DO UPDATE SET value = value + excluded.value",
+            (self.namespace, name, amount),
+        )
+
+    def get(self, key):
+        conn = self._connection()
+        now = time()
+        row = conn.execute(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+
+        if row is None:
+            self._incr(conn, "misses")
+            return None
+
+        value, expires_at = row
+        if expires_at is not None and expires_at <= now:
+            conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+            self._incr(conn, "expirations")
+            self._incr(conn, "misses")
+            return None
+
+        conn.execute(
+            "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+            (now, self.namespace, key),
+        )
+        self._incr(conn, "hits")
+        return json.loads(value)
+
+    def set(self, key, value):
+        conn = self._connection()
+        now = time()
+        expires_at = now + self.ttl if self.ttl > 0 else None
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value, default=_json_default), expires_at, now),
+            )
+            (size,) = conn.execute(
+                "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+            overflow = size - self.max_size
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM cache_entries WHERE rowid IN ("
+                    "SELECT rowid FROM cache_entries WHERE namespace = ? ORDER BY accessed_at LIMIT ?)",
+                    (self.namespace, overflow),
+                )
+                self._incr(conn, "evictions", overflow)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def __len__(self):
+        (size,) = self._connection().execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        return size
+
+    def stats(self):
+        counters = dict(self._connection().execute(
+            "SELECT name, value FROM cache_stats WHERE namespace = ?", (self.namespace,)
+        ).fetchall())
+        return {
+            "backend": "sqlite",
+            "size": len(self),
+            "max_size": self.max_size,
+            **{name: counters.get(name, 0) for name in ("hits", "misses", "evictions", "expirations")},
+        }
+
+
+class RedisCache:
+    """
+    LRU cache with TTL on a Redis server (or anything speaking its protocol), shared across hosts.
+
+    Values are stored as JSON strings with a native expiry; a sorted set of last-access times per
+    namespace drives LRU eviction beyond max_size, and counters live in a hash so stats() reports
+    totals across workers. Pass client to use an existing client or a stand-in such as fakeredis.
+    """
+
+    def __init__(self, url=CACHE_REDIS_URL, max_size=1000, ttl=3600, namespace="default", client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+
+        self.client = client
+        self.max_size = max_size
+        self.ttl = ttl
+        self.namespace = namespace
+        self._prefix = f"cache:{namespace}:entry:"
+        self._lru_key = f"cache:{namespace}:lru"
+        self._stats_key = f"cache:{namespace}:stats"
+
+    def get(self, key):
+        raw = self.client.get(self._prefix + key)
+        if raw is None:
+            # A key still tracked for LRU but gone from Redis has expired.
+            expired = self.client.zrem(self._lru_key, key)
+            pipe = self.client.pipeline()
+            pipe.hincrby(self._stats_key, "misses", 1)
+            if expired:
+                pipe.hincrby(self._stats_key, "expirations", 1)
+            pipe.execute()
+            return None
+
+        pipe = self.client.pipeline()
+        pipe.zadd(self._lru_key, {key: time()})
+        pipe.hincrby(self._stats_key, "hits", 1)
+        pipe.execute()
+        return json.loads(raw)
+
+    def set(self, key, value):
+        pipe = self.client.pipeline()
+        if self.ttl > 0:
+            pipe.set(self._prefix + key, json.dumps(value, default=_json_default), px=int(self.ttl * 1000))
+        else:
+            pipe.set(self._prefix + key, json.dumps(value, default=_json_default))
+        pipe.zadd(self._lru_key, {key: time()})
+        pipe.zcard(self._lru_key)
+        size = pipe.execute()[-1]
+
+        overflow = size - self.max_size
+        if overflow > 0:
+            victims = [k.decode() if isinstance(k, bytes) else k for k, _ in self.client.zpopmin(self._lru_key, overflow)]
+            evicted = self.client.delete(*(self._prefix + k for k in victims)) if victims else 0
+            if evicted:
+                self.client.hincrby(self._stats_key, "evictions", evicted)
+
+    def __len__(self):
+        return self.client.zcard(self._lru_key)
+
+    def stats(self):
+        counters = {
+            (k.decode() if isinstance(k, bytes) else k): int(v)
+            for k, v in self.client.hgetall(self._stats_key).items()
+        }
+        return {
+            "backend": "redis",
+            "size": len(self),
+            "max_size": self.max_size,
+            **{name: counters.get(name, 0) for name in ("hits", "misses", "evictions", "expirations")},
+        }
+
+
+class AnswerCache:
+    """
+    Cache of RAG answers keyed by model and normalized question, stored in any make_cache backend.
+
+    Exact lookups match the normalized question. When similarity_threshold is set and an index is
+    given, a miss falls back to the cached question whose minsearch vector (see Index.vectorize) is
+    most similar, provided the similarity reaches the threshold and both questions contain the same
+    words unknown to the index vocabulary, so "what is leukemia" never answers "what is lymphoma"
+    just because neither disease name is in the vocabulary.
+
+    With a version (of the knowledge base, see live_index.IndexReloader) entries are only shared
+    with caches of the same version, so answers from replaced content are never served.
+    """
+
+    def __init__(self, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL,
+                 similarity_threshold=ANSWER_CACHE_SIMILARITY, index=None, field="question", entries=None,
+                 version=None):
+        self.entries = entries if entries is not None else make_cache("answers", max_size, ttl)
+        self.similarity_threshold = similarity_threshold
+        self.index = index if similarity_threshold > 0 else None
+        self.field = field
+        self.version = version
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        # Vectors of the questions this process cached, for near-duplicate lookups.
+        self._vectors = OrderedDict()
+        self._matrix = None
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.entries.max_size > 0
+
+    def get(self, question, model):
+        if not self.enabled:
+            return None
+
+        key = (model, normalize_question(question))
+        value = self.entries.get(_entry_key(key, self.version))
+        if value is not None:
+            self.hits += 1
+            return value
+
+        near_key = self._nearest(key) if self.index is not None else None
+        value = self.entries.get(_entry_key(near_key, self.version)) if near_key is not None else None
+        if value is not None:
+            self.near_hits += 1
+        else:
+            self.misses += 1
+            if near_key is not None:
+                # Expired or evicted from the backend.
+                with self._lock:
+                    self._vectors.pop(near_key, None)
+                    self._matrix = None
+        return value
+
+    def set(self, question, model, answer_data):
+        if not self.enabled:
+            return
+
+        key = (model, normalize_question(question))
+        self.entries.set(_entry_key(key, self.version), answer_data)
+        if self.index is not None:
+            with self._lock:
+                self._vectors[key] = self._vectorize(key[1])
+                self._vectors.move_to_end(key)
+                while len(self._vectors) > self.entries.max_size:
+                    self._vectors.popitem(last=False)
+                self._matrix = None
+
+    def update(self, question, model, answer, fields):
+        """
+        Sets fields (such as the relevance once judged) on the cached answer to question, provided it
+        is still this answer. Returns whether an entry was updated.
+        """
+        if not self.enabled:
+            return False
+
+        key = _entry_key((model, normalize_question(question)), self.version)
+        value = self.entries.get(key)
+        if value is None or value.get("answer") != answer:
+            return False
+        value.update(fields)
+        self.entries.set(key, value)
+        return True
+
+    def rebind(self, index, version=None):
+        """
+        Switches to a new index (whose vocabulary the near-duplicate vectors must come from) and
+        knowledge base version, forgetting the vectors of the old one so it can be freed.
+        """
+        with self._lock:
+            self.index = index if self.similarity_threshold > 0 else None
+            self.version = version
+            self._vectors.clear()
+            self._matrix = None
+            self._matrix_keys = []
+
+    def _vectorize(self, normalized):
+        vectorizer = self.index.vectorizers[self.field]
+        tokens = set(vectorizer.build_analyzer()(normalized))
+        unknown = frozenset(tokens - vectorizer.vocabulary_.keys())
+        return self.index.vectorize([normalized], self.field), unknown
+
+    def _nearest(self, key):
+        with self._lock:
+            candidates = [k for k in self._vectors if k[0] == key[0]]
+            if not candidates:
+                return None
+            if self._matrix is None or self._matrix_keys != candidates:
+                self._matrix = vstack([self._vectors[k][0] for k in candidates]).tocsr()
+                self._matrix_keys = candidates
+
+            vector, unknown = self._vectorize(key[1])
+            if vector.nnz == 0:
+                return None
+            similarities = (self._matrix @ vector.T).toarray().ravel()
+
+            for i in similarities.argsort()[::-1]:
+                if similarities[i] < self.similarity_threshold:
+                    return None
+                if self._vectors[candidates[i]][1] == unknown:
+                    return candidates[i]
+            return None
+
+    def stats(self):
+        entries = self.entries.stats()
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "backend": entries["backend"],
+            "size": entries["size"],
+            "max_size": entries["max_size"],
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            "evictions": entries["evictions"],
+            "expirations": entries["expirations"],
+        }
+
+
+class RetrievalCache:
+    """
+    Cache of search results keyed by normalized query (and knowledge base version, as in AnswerCache),
+    stored in any make_cache backend.
+    """
+
+    def __init__(self, max_size=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL, entries=None, version=None):
+        self.entries = entries if entries is not None else make_cache("retrieval", max_size, ttl)
+        self.version = version
+
+    @property
+    def enabled(self):
+        return self.entries.max_size > 0
+
+    def get(self, query):
+        if not self.enabled:
+            return None
+        return self.entries.get(self._key(query))
+
+    def set(self, query, results):
+        if self.enabled:
+            self.entries.set(self._key(query), results)
+
+    def _key(self, query):
+        normalized = normalize_question(query)
+        return f"{self.version}:{normalized}" if self.version else normalized
+
+    def stats(self):
+        return self.entries.stats()
+
+
+def _entry_key(key, version=None):
+    model, normalized = key
+    return f"{version}:{model}:{normalized}" if version else f"{model}:{normalized}"
+
+
+def _json_default(value):
+    # Search results can carry numpy scalars from the index.
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
@@ -1,11 +1,21 @@
 import os
+import json
+import atexit
+import base64
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2.errors import ForeignKeyViolation
+from psycopg2.extras import DictCursor, execute_values
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
+from db_pool import ConnectionPool, PoolTimeout
+from write_behind import WriteBehindBuffer
+
 RUN_TIMEZONE_CHECK = os.getenv('RUN_TIMEZONE_CHECK', '0') == '1'
 USE_DB = os.getenv('USE_DB', '0') == '1'
+# Queue conversation, feedback and relevance writes and store them in batches from a background
+# thread; 0 writes them synchronously within the request.
+DB_WRITE_BEHIND = os.getenv('DB_WRITE_BEHIND', '1') == '1'
 
 TZ_INFO = os.getenv("TZ", "Europe/Berlin")
 tz = ZoneInfo(TZ_INFO)
@@ -16,21 +26,239 @@ def get_db_connection():
         return None
     return psycopg2.connect(
         host=os.getenv("POSTGRES_HOST", "postgres"),
+        port=os.getenv("POSTGRES_PORT", "5432"),
         database=os.getenv("POSTGRES_DB", "course_assistant"),
         user=os.getenv("POSTGRES_USER", "your_username"),
         password=os.getenv("POSTGRES_PASSWORD", "your_password"),
+        connect_timeout=int(os.getenv("POSTGRES_CONNECT_TIMEOUT", "5")),
     )
 
 
-def init_db():
+# Connections are reused across requests; see db_pool for the size and health check settings
+db_pool = ConnectionPool(get_db_connection)
+atexit.register(db_pool.closeall)
+
+CONVERSATION_COLUMNS = (
+    "id", "question", "answer", "model_used", "response_time", "first_token_time", "relevance",
+    "relevance_explanation", "prompt_tokens", "completion_tokens", "total_tokens",
+    "eval_prompt_tokens", "eval_completion_tokens", "eval_total_tokens", "openai_cost", "timestamp",
+)
+RELEVANCE_COLUMNS = (
+    "conversation_id", "relevance", "relevance_explanation",
+    "eval_prompt_tokens", "eval_completion_tokens", "eval_total_tokens",
+)
+
+
+def _insert_conversations(cur, rows):
+    # ON CONFLICT makes replaying a journal that was partly written before a crash harmless
+    execute_values(
+        cur,
+        f"INSERT INTO conversations ({', '.join(CONVERSATION_COLUMNS)}) VALUES %s ON CONFLICT (id) DO NOTHING",
+        [tuple(row[column] for column in CONVERSATION_COLUMNS) for row in rows],
+    )
+
+
+def _insert_feedback(cur, rows):
+    execute_values(
+        cur,
+        "INSERT INTO feedback (conversation_id, feedback, timestamp) VALUES %s",
+        [(row["conversation_id"], row["feedback"], row["timestamp"]) for row in rows],
+        template="(%s, %s, COALESCE(%s::timestamptz, CURRENT_TIMESTAMP))",
+    )
+
+
+def _update_relevance(cur, rows):
+    execute_values(
+        cur,
+        """
+        UPDATE conversations AS c
+        SET relevance = v.relevance,
+            relevance_explanation = v.relevance_explanation,
+            eval_prompt_tokens = v.eval_prompt_tokens,
+            eval_completion_tokens = v.eval_completion_tokens,
+            eval_total_tokens = v.eval_total_tokens
+        FROM (VALUES %s) AS v (conversation_id, relevance, relevance_explanation,
+                                eval_prompt_tokens, eval_completion_tokens, eval_total_tokens)
+        WHERE c.id = v.conversation_id
+        """,
+        [tuple(row[column] for column in RELEVANCE_COLUMNS) for row in rows],
+    )
+
+
+_WRITERS = {
+    "conversation": _insert_conversations,
+    "feedback": _insert_feedback,
+    "relevance": _update_relevance,
+}
+
+
+def apply_writes(writes):
+    """
+    Stores (kind, row) writes in one transaction, one multi-row statement per run of the same kind,
+    so a relevance update or feedback row never lands before the conversation it refers to.
+    """
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            start = 0
+            while start < len(writes):
+                kind = writes[start][0]
+                end = start
+                while end < len(writes) and writes[end][0] == kind:
+                    end += 1
+                _WRITERS[kind](cur, [row for _, row in writes[start:end]])
+                start = end
+        conn.commit()
+
+
+def _is_connection_error(error):
+    return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError, PoolTimeout))
+
+
+def _is_missing_conversation(error):
+    # Feedback whose conversation row is still buffered in another worker
+    return isinstance(error, ForeignKeyViolation)
+
+
+# Registered after db_pool.closeall, so at exit it flushes before the pool is closed
+write_buffer = WriteBehindBuffer(
+    apply_writes, retryable=_is_connection_error, deferrable=_is_missing_conversation
+).register_atexit()
+
+
+def _store(kind, row):
+    if DB_WRITE_BEHIND:
+        write_buffer.add(kind, row)
+    else:
+        apply_writes([(kind, row)])
+
+
+# Schema changes applied by migrate(), in order, on top of the tables created by init_db.
+# Indexes are built CONCURRENTLY so that migrating a live database does not block writes.
+MIGRATIONS = [
+    # Version 0 so that databases already at version 6 get it too, and it runs before the rollups use it
+    (0, "add conversations.first_token_time",
+     "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS first_token_time FLOAT"),
+    (1, "index conversations by timestamp",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS conversations_timestamp_idx ON conversations (timestamp DESC, id DESC)"),
+    (2, "index conversations by relevance",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS conversations_relevance_idx ON conversations (relevance, timestamp DESC, id DESC)"),
+    (3, "index conversations by model",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS conversations_model_used_idx ON conversations (model_used, timestamp)"),
+    (4, "index feedback by conversation",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS feedback_conversation_id_idx ON feedback (conversation_id, timestamp DESC)"),
+    (5, "index feedback by timestamp",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS feedback_timestamp_idx ON feedback (timestamp)"),
+    (6, "metrics rollup tables", """
+        CREATE TABLE IF NOT EXISTS metrics_minute (
+            bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+            model_used TEXT NOT NULL,
+            conversations INTEGER NOT NULL,
+            response_time_avg FLOAT,
+            response_time_p50 FLOAT,
+            response_time_p95 FLOAT,
+            first_token_time_p50 FLOAT,
+            prompt_tokens BIGINT NOT NULL,
+            completion_tokens BIGINT NOT NULL,
+            total_tokens BIGINT NOT NULL,
+            eval_total_tokens BIGINT NOT NULL,
+            openai_cost FLOAT NOT NULL,
+            relevant INTEGER NOT NULL,
+            partly_relevant INTEGER NOT NULL,
+            non_relevant INTEGER NOT NULL,
+            unevaluated INTEGER NOT NULL,
+            thumbs_up INTEGER NOT NULL,
+            thumbs_down INTEGER NOT NULL,
+            PRIMARY KEY (bucket, model_used)
+        );
+        CREATE TABLE IF NOT EXISTS metrics_hour (LIKE metrics_minute INCLUDING ALL);
+
+        -- Minutes whose rows changed since the last refresh_rollups()
+        CREATE TABLE IF NOT EXISTS metrics_dirty (
+            bucket TIMESTAMP WITH TIME ZONE PRIMARY KEY
+        );
+
+        CREATE OR REPLACE FUNCTION mark_metrics_dirty() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO metrics_dirty (bucket)
+            SELECT DISTINCT date_trunc('minute', timestamp) FROM changed_rows
+            ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS conversations_inserted_metrics ON conversations;
+        CREATE TRIGGER conversations_inserted_metrics AFTER INSERT ON conversations
+            REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION mark_metrics_dirty();
+        DROP TRIGGER IF EXISTS conversations_updated_metrics ON conversations;
+        CREATE TRIGGER conversations_updated_metrics AFTER UPDATE ON conversations
+            REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION mark_metrics_dirty();
+        DROP TRIGGER IF EXISTS feedback_inserted_metrics ON feedback;
+        CREATE TRIGGER feedback_inserted_metrics AFTER INSERT ON feedback
+            REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION mark_metrics_dirty();
+
+        -- Roll up what is already there on the next refresh
+        INSERT INTO metrics_dirty (bucket)
+        SELECT date_trunc('minute', timestamp) FROM conversations
+        UNION
+        SELECT date_trunc('minute', timestamp) FROM feedback
+        ON CONFLICT DO NOTHING;
+    """),
+]
+
+# Any constants shared by all workers; the advisory locks keep two of them from migrating (or
+# refreshing the rollups) at once
+_MIGRATION_LOCK = 4242
+_ROLLUP_LOCK = 4243
+
+
+def migrate():
+    """Applies the MIGRATIONS not yet recorded in schema_migrations. Safe to run on every deploy."""
     if not USE_DB:
-        print("Database disabled. Skipping initialization.")
+        print("Database disabled. Skipping migrations.")
         return
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, so this uses its own autocommit connection
     conn = get_db_connection()
+    conn.autocommit = True
     try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (_MIGRATION_LOCK,))
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cur.execute("SELECT version FROM schema_migrations")
+            applied = {row[0] for row in cur.fetchall()}
+
+            for version, description, statement in MIGRATIONS:
+                if version in applied:
+                    continue
+                print(f"Applying migration {version}: {description}")
+                cur.execute(statement)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description),
+                )
+            cur.execute("SELECT pg_advisory_unlock(%s)", (_MIGRATION_LOCK,))
+    finally:
+        conn.close()
+
+
+def init_db():
+    if not USE_DB:
+        print("Database disabled. Skipping initialization.")
+        return
+    with db_pool.connection() as conn:
         with conn.cursor() as cur:
             cur.execute("DROP TABLE IF EXISTS feedback")
             cur.execute("DROP TABLE IF EXISTS conversations")
+            cur.execute("DROP TABLE IF EXISTS schema_migrations")
+            cur.execute("DROP TABLE IF EXISTS metrics_minute, metrics_hour, metrics_dirty")
 
             cur.execute("""
                 CREATE TABLE conversations (
@@ -39,6 +267,7 @@ def init_db():
                     answer TEXT NOT NULL,
                     model_used TEXT NOT NULL,
                     response_time FLOAT NOT NULL,
+                    first_token_time FLOAT,
                     relevance TEXT NOT NULL,
                     relevance_explanation TEXT NOT NULL,
                     prompt_tokens INTEGER NOT NULL,
@@ -60,8 +289,7 @@ def init_db():
                 )
             """)
         conn.commit()
-    finally:
-        conn.close()
+    migrate()
 
 
 def save_conversation(conversation_id, question, answer_data, timestamp=None):
@@ -72,38 +300,22 @@ def save_conversation(conversation_id, question, answer_data, timestamp=None):
     if timestamp is None:
         timestamp = datetime.now(tz)
 
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO conversations 
-                (id, question, answer, model_used, response_time, relevance, 
-                relevance_explanation, prompt_tokens, completion_tokens, total_tokens, 
-                eval_prompt_tokens, eval_completion_tokens, eval_total_tokens, openai_cost, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """,
-                (
-                    conversation_id,
-                    question,
-                    answer_data["answer"],
-                    answer_data["model_used"],
-                    answer_data["response_time"],
-                    answer_data["relevance"],
-                    answer_data["relevance_explanation"],
-                    answer_data["prompt_tokens"],
-                    answer_data["completion_tokens"],
-                    answer_data["total_tokens"],
-                    answer_data["eval_prompt_tokens"],
-                    answer_data["eval_completion_tokens"],
-                    answer_data["eval_total_tokens"],
-                    answer_data["openai_cost"],
-                    timestamp
-                ),
-            )
-        conn.commit()
-    finally:
-        conn.close()
+    row = {
+        column: answer_data.get(column)
+        for column in CONVERSATION_COLUMNS
+        if column not in ("id", "question", "timestamp")
+    }
+    row.update(id=conversation_id, question=question, timestamp=timestamp)
+    _store("conversation", row)
+
+
+def update_relevance(results):
+    """Stores background relevance evaluations; results are dicts as produced by evaluation.EvaluationQueue."""
+    if not USE_DB or not results:
+        return
+
+    for result in results:
+        _store("relevance", {column: result[column] for column in RELEVANCE_COLUMNS})
 
 
 def save_feedback(conversation_id, feedback, timestamp=None):
@@ -114,44 +326,183 @@ def save_feedback(conversation_id, feedback, timestamp=None):
     if timestamp is None:
         timestamp = datetime.now(tz)
 
-    conn = get_db_connection()
+    _store("feedback", {"conversation_id": conversation_id, "feedback": feedback, "timestamp": timestamp})
+
+
+def encode_cursor(timestamp, conversation_id):
+    """Opaque /history cursor pointing just past the conversation with this timestamp and id."""
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.isoformat()
+    raw = json.dumps([timestamp, conversation_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) of a cursor from encode_cursor; raises ValueError if it is malformed."""
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                "INSERT INTO feedback (conversation_id, feedback, timestamp) VALUES (%s, %s, COALESCE(%s, CURRENT_TIMESTAMP))",
-                (conversation_id, feedback, timestamp),
-            )
-        conn.commit()
-    finally:
-        conn.close()
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, conversation_id = json.loads(raw)
+        datetime.fromisoformat(timestamp)
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+    return timestamp, str(conversation_id)
+
 
+def get_recent_conversations(limit=5, relevance=None, before=None):
+    """
+    Newest conversations first, with the latest feedback on each.
 
-def get_recent_conversations(limit=5, relevance=None):
+    Paginates by keyset: pass before=(timestamp, id) of the last conversation of the previous
+    page (see decode_cursor) to get the page after it. This reads only the rows it returns
+    through the timestamp index, however deep the page, unlike an OFFSET.
+    """
     if not USE_DB:
         return []
-    conn = get_db_connection()
-    try:
+    conditions = []
+    params = []
+    if relevance:
+        conditions.append("c.relevance = %s")
+        params.append(relevance)
+    if before:
+        conditions.append("(c.timestamp, c.id) < (%s::timestamptz, %s)")
+        params.extend(before)
+
+    query = """
+        SELECT c.*, f.feedback
+        FROM conversations c
+        LEFT JOIN LATERAL (
+            SELECT feedback FROM feedback
+            WHERE feedback.conversation_id = c.id
+            ORDER BY feedback.timestamp DESC
+            LIMIT 1
+        ) f ON TRUE
+    """
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY c.timestamp DESC, c.id DESC LIMIT %s"
+    params.append(limit)
+
+    with db_pool.connection() as conn:
         with conn.cursor(cursor_factory=DictCursor) as cur:
-            query = """
-                SELECT c.*, f.feedback
-                FROM conversations c
-                LEFT JOIN feedback f ON c.id = f.conversation_id
-            """
-            if relevance:
-                query += f" WHERE c.relevance = '{relevance}'"
-            query += " ORDER BY c.timestamp DESC LIMIT %s"
-
-            cur.execute(query, (limit,))
-            return cur.fetchall()
-    finally:
-        conn.close()
+            cur.execute(query, params)
+            return [dict(row) for row in cur.fetchall()]
+
+
+# Recomputes whole buckets of a rollup table from the raw rows, so percentiles stay exact and
+# late relevance updates and feedback are picked up. Every bucket has one row per model plus a
+# model_used = 'all' row over all of them, since percentiles cannot be added up afterwards.
+_ROLLUP_SQL = """
+    INSERT INTO {table}
+    WITH buckets AS (
+        SELECT unnest(%(buckets)s::timestamptz[]) AS bucket
+    ),
+    answered AS (
+        SELECT
+            b.bucket,
+            CASE WHEN GROUPING(c.model_used) = 1 THEN 'all' ELSE c.model_used END AS model_used,
+            COUNT(*) AS conversations,
+            AVG(c.response_time) AS response_time_avg,
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY c.response_time) AS response_time_p50,
+            percentile_cont(0.95) WITHIN GROUP (ORDER BY c.response_time) AS response_time_p95,
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY c.first_token_time) AS first_token_time_p50,
+            SUM(c.prompt_tokens) AS prompt_tokens,
+            SUM(c.completion_tokens) AS completion_tokens,
+            SUM(c.total_tokens) AS total_tokens,
+            SUM(c.eval_total_tokens) AS eval_total_tokens,
+            SUM(c.openai_cost) AS openai_cost,
+            COUNT(*) FILTER (WHERE c.relevance = 'RELEVANT') AS relevant,
+            COUNT(*) FILTER (WHERE c.relevance = 'PARTLY_RELEVANT') AS partly_relevant,
+            COUNT(*) FILTER (WHERE c.relevance = 'NON_RELEVANT') AS non_relevant,
+            COUNT(*) FILTER (WHERE c.relevance NOT IN ('RELEVANT', 'PARTLY_RELEVANT', 'NON_RELEVANT')) AS unevaluated
+        FROM buckets b
+        JOIN conversations c ON c.timestamp >= b.bucket AND c.timestamp < b.bucket + %(width)s::interval
+        GROUP BY GROUPING SETS ((b.bucket, c.model_used), (b.bucket))
+    ),
+    rated AS (
+        SELECT
+            b.bucket,
+            CASE WHEN GROUPING(COALESCE(c.model_used, 'unknown')) = 1 THEN 'all'
+                 ELSE COALESCE(c.model_used, 'unknown') END AS model_used,
+            COUNT(*) FILTER (WHERE f.feedback > 0) AS thumbs_up,
+            COUNT(*) FILTER (WHERE f.feedback < 0) AS thumbs_down
+        FROM buckets b
+        JOIN feedback f ON f.timestamp >= b.bucket AND f.timestamp < b.bucket + %(width)s::interval
+        LEFT JOIN conversations c ON c.id = f.conversation_id
+        GROUP BY GROUPING SETS ((b.bucket, COALESCE(c.model_used, 'unknown')), (b.bucket))
+    )
+    SELECT
+        COALESCE(a.bucket, r.bucket),
+        COALESCE(a.model_used, r.model_used),
+        COALESCE(a.conversations, 0),
+        a.response_time_avg,
+        a.response_time_p50,
+        a.response_time_p95,
+        a.first_token_time_p50,
+        COALESCE(a.prompt_tokens, 0),
+        COALESCE(a.completion_tokens, 0),
+        COALESCE(a.total_tokens, 0),
+        COALESCE(a.eval_total_tokens, 0),
+        COALESCE(a.openai_cost, 0),
+        COALESCE(a.relevant, 0),
+        COALESCE(a.partly_relevant, 0),
+        COALESCE(a.non_relevant, 0),
+        COALESCE(a.unevaluated, 0),
+        COALESCE(r.thumbs_up, 0),
+        COALESCE(r.thumbs_down, 0)
+    FROM answered a
+    FULL JOIN rated r ON a.bucket = r.bucket AND a.model_used = r.model_used
+"""
+
+
+def _rollup(cur, table, width, buckets):
+    cur.execute(f"DELETE FROM {table} WHERE bucket = ANY(%s::timestamptz[])", (buckets,))
+    cur.execute(_ROLLUP_SQL.format(table=table), {"buckets": buckets, "width": width})
+
+
+def refresh_rollups(batch_size=500):
+    """
+    Brings metrics_minute and metrics_hour up to date with the minutes marked in metrics_dirty
+    (by triggers on conversations and feedback), batch_size minutes per transaction.
+
+    Returns:
+        int: number of minutes refreshed.
+    """
+    if not USE_DB:
+        return 0
+    refreshed = 0
+    while True:
+        with db_pool.connection() as conn:
+            with conn.cursor() as cur:
+                # One refresher at a time: two rewriting the same hour would collide
+                cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (_ROLLUP_LOCK,))
+                if not cur.fetchone()[0]:
+                    conn.rollback()
+                    return refreshed
+                cur.execute(
+                    """
+                    DELETE FROM metrics_dirty WHERE bucket IN (
+                        SELECT bucket FROM metrics_dirty ORDER BY bucket LIMIT %s
+                    )
+                    RETURNING bucket
+                    """,
+                    (batch_size,),
+                )
+                minutes = [row[0] for row in cur.fetchall()]
+                if minutes:
+                    cur.execute("SELECT DISTINCT date_trunc('hour', m) FROM unnest(%s::timestamptz[]) AS m", (minutes,))
+                    hours = [row[0] for row in cur.fetchall()]
+                    _rollup(cur, "metrics_minute", "1 minute", minutes)
+                    _rollup(cur, "metrics_hour", "1 hour", hours)
+            conn.commit()
+        refreshed += len(minutes)
+        if len(minutes) < batch_size:
+            return refreshed
 
 
 def get_feedback_stats():
     if not USE_DB:
         return {'thumbs_up': 0, 'thumbs_down': 0}
-    conn = get_db_connection()
-    try:
+    with db_pool.connection() as conn:
         with conn.cursor(cursor_factory=DictCursor) as cur:
             cur.execute("""
                 SELECT 
@@ -160,59 +511,55 @@ def get_feedback_stats():
                 FROM feedback
             """)
             return cur.fetchone()
-    finally:
-        conn.close()
 
 
 def check_timezone():
     if not USE_DB:
         return
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SHOW timezone;")
-            db_timezone = cur.fetchone()[0]
-            print(f"Database timezone: {db_timezone}")
+    with db_pool.connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SHOW timezone;")
+                db_timezone = cur.fetchone()[0]
+                print(f"Database timezone: {db_timezone}")
 
-            cur.execute("SELECT current_timestamp;")
-            db_time_utc = cur.fetchone()[0]
-            print(f"Database current time (UTC): {db_time_utc}")
+                cur.execute("SELECT current_timestamp;")
+                db_time_utc = cur.fetchone()[0]
+                print(f"Database current time (UTC): {db_time_utc}")
 
-            db_time_local = db_time_utc.astimezone(tz)
-            print(f"Database current time ({TZ_INFO}): {db_time_local}")
+                db_time_local = db_time_utc.astimezone(tz)
+                print(f"Database current time ({TZ_INFO}): {db_time_local}")
 
-            py_time = datetime.now(tz)
-            print(f"Python current time: {py_time}")
+                py_time = datetime.now(tz)
+                print(f"Python current time: {py_time}")
 
-            # Use py_time instead of tz for insertion
-            cur.execute("""
-                INSERT INTO conversations 
-                (id, question, answer, model_used, response_time, relevance, 
-                relevance_explanation, prompt_tokens, completion_tokens, total_tokens, 
-                eval_prompt_tokens, eval_completion_tokens, eval_total_tokens, openai_cost, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING timestamp;
-            """, 
-            ('test', 'test question', 'test answer', 'test model', 0.0, 0.0, 
-             'test explanation', 0, 0, 0, 0, 0, 0, 0.0, py_time))
-
-            inserted_time = cur.fetchone()[0]
-            print(f"Inserted time (UTC): {inserted_time}")
-            print(f"Inserted time ({TZ_INFO}): {inserted_time.astimezone(tz)}")
-
-            cur.execute("SELECT timestamp FROM conversations WHERE id = 'test';")
-            selected_time = cur.fetchone()[0]
-            print(f"Selected time (UTC): {selected_time}")
-            print(f"Selected time ({TZ_INFO}): {selected_time.astimezone(tz)}")
-
-            # Clean up the test entry
-            cur.execute("DELETE FROM conversations WHERE id = 'test';")
-            conn.commit()
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+                # Use py_time instead of tz for insertion
+                cur.execute("""
+                    INSERT INTO conversations 
+                    (id, question, answer, model_used, response_time, relevance, 
+                    relevance_explanation, prompt_tokens, completion_tokens, total_tokens, 
+                    eval_prompt_tokens, eval_completion_tokens, eval_total_tokens, openai_cost, timestamp)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING timestamp;
+                """, 
+                ('test', 'test question', 'test answer', 'test model', 0.0, 0.0, 
+                 'test explanation', 0, 0, 0, 0, 0, 0, 0.0, py_time))
+
+                inserted_time = cur.fetchone()[0]
+                print(f"Inserted time (UTC): {inserted_time}")
+                print(f"Inserted time ({TZ_INFO}): {inserted_time.astimezone(tz)}")
+
+                cur.execute("SELECT timestamp FROM conversations WHERE id = 'test';")
+                selected_time = cur.fetchone()[0]
+                print(f"Selected time (UTC): {selected_time}")
+                print(f"Selected time ({TZ_INFO}): {selected_time.astimezone(tz)}")
+
+                # Clean up the test entry
+                cur.execute("DELETE FROM conversations WHERE id = 'test';")
+                conn.commit()
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            conn.rollback()
 
 
 if RUN_TIMEZONE_CHECK:
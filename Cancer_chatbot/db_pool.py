@@ -0,0 +1,219 @@
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import monotonic
+
+import psycopg2
+import psycopg2.pool
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+# Connections kept per worker process: opened up front, and at most.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+# Seconds to wait for a free connection before giving up.
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Connections idle longer than this many seconds are pinged before being handed out.
+DB_POOL_HEALTH_CHECK_AFTER = float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30"))
+
+# Checkout times kept for the percentiles in stats().
+_CHECKOUT_SAMPLES = 1000
+
+
+class PoolTimeout(psycopg2.pool.PoolError):
+    """No connection became free within the pool timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections for one worker process.
+
+    connection() hands out the most recently returned idle connection, opens a new one while fewer
+    than max_size exist, or waits up to timeout seconds for one to be returned. Connections idle for
+    longer than health_check_after seconds are pinged first and replaced if they are dead, and
+    connections that fail with a connection-level error are discarded instead of being reused.
+
+    The pool is opened lazily and reopened in a forked child (gunicorn workers), which never
+    touches the parent's sockets.
+    """
+
+    def __init__(self, connect, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 timeout=DB_POOL_TIMEOUT, health_check_after=DB_POOL_HEALTH_CHECK_AFTER):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+
+        self._condition = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._pid = None
+        # Connections inherited over a fork; kept referenced so they are never closed from the child
+        self._inherited = []
+
+        self._checkout_times = deque(maxlen=_CHECKOUT_SAMPLES)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.opened = 0
+        self.discarded = 0
+        self.failed_health_checks = 0
+
+    def _ensure_process(self):
+        # Called with the condition held
+        if self._pid == os.getpid():
+            return False
+        if self._pid is not None:
+            self._inherited.extend(conn for conn, _ in self._idle)
+        self._idle = []
+        self._size = 0
+        self._pid = os.getpid()
+        return True
+
+    def _open(self):
+        try:
+            conn = self.connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self.opened += 1
+        return conn
+
+    def _warm_up(self):
+        for _ in range(self.min_size):
+            with self._condition:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            conn = self._open()
+            self.putconn(conn)
+
+    def getconn(self):
+        started = monotonic()
+        deadline = started + self.timeout
+
+        with self._condition:
+            fresh_process = self._ensure_process()
+        if fresh_process and self.min_size > 0:
+            self._warm_up()
+
+        while True:
+            with self._condition:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f"no database connection free within {self.timeout:g}s")
+                    self._condition.wait(remaining)
+
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    conn, returned_at = None, None
+                    self._size += 1
+
+            if conn is None:
+                conn = self._open()
+            elif not self._healthy(conn, returned_at):
+                self._discard(conn)
+                continue
+
+            with self._condition:
+                self.checkouts += 1
+                self._checkout_times.append(monotonic() - started)
+            return conn
+
+    def _healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if monotonic() - returned_at < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            with self._condition:
+                self.failed_health_checks += 1
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._condition:
+            self._size -= 1
+            self.discarded += 1
+            self._condition.notify()
+
+    def putconn(self, conn, broken=False):
+        if self._pid != os.getpid():
+            # Checked out before a fork; belongs to the parent
+            self._inherited.append(conn)
+            return
+        if not broken and not conn.closed:
+            try:
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        if broken or conn.closed:
+            self._discard(conn)
+            return
+        with self._condition:
+            self._idle.append((conn, monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """Checks out a connection for the duration of the with block."""
+        conn = self.getconn()
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.putconn(conn, broken=True)
+            raise
+        except BaseException:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._condition:
+            if self._pid != os.getpid():
+                return
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self):
+        with self._condition:
+            times = sorted(self._checkout_times)
+            idle = len(self._idle) if self._pid == os.getpid() else 0
+            size = self._size if self._pid == os.getpid() else 0
+
+        def percentile(p):
+            return times[min(int(p * len(times)), len(times) - 1)] * 1000 if times else 0.0
+
+        return {
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "opened": self.opened,
+            "discarded": self.discarded,
+            "failed_health_checks": self.failed_health_checks,
+            "checkout_ms_p50": percentile(0.5),
+            "checkout_ms_p95": percentile(0.95),
+            "checkout_ms_max": times[-1] * 1000 if times else 0.0,
+        }
@@ -1,12 +1,18 @@
 import os
+import sys
 from dotenv import load_dotenv
 
 os.environ['RUN_TIMEZONE_CHECK'] = '0'
 
-from db import init_db
+from db import init_db, migrate
 
 load_dotenv()
 
 if __name__ == "__main__":
-    print("Initializing database...")
-    init_db()
\ No newline at end of file
+    if "--migrate" in sys.argv[1:]:
+        # Existing database: add the missing indexes and other schema changes, keep the data
+        print("Migrating database...")
+        migrate()
+    else:
+        print("Initializing database...")
+        init_db()
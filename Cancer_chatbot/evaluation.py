@@ -0,0 +1,215 @@
+import os
+import queue
+import random
+import atexit
+import threading
+from time import monotonic, sleep
+
+# Evaluate answer relevance in background workers after /question has responded; 0 evaluates inline.
+EVAL_ASYNC = os.getenv("EVAL_ASYNC", "1") == "1"
+# Fraction of answers sent to the relevance judge; the rest are stored as not evaluated.
+EVAL_SAMPLE_RATE = float(os.getenv("EVAL_SAMPLE_RATE", "1.0"))
+EVAL_WORKERS = int(os.getenv("EVAL_WORKERS", "1"))
+# Answers waiting beyond this many are dropped (and counted) rather than slowing requests down.
+EVAL_QUEUE_SIZE = int(os.getenv("EVAL_QUEUE_SIZE", "500"))
+# Up to this many queued answers are judged in one LLM call.
+EVAL_BATCH_SIZE = int(os.getenv("EVAL_BATCH_SIZE", "4"))
+EVAL_MAX_RETRIES = int(os.getenv("EVAL_MAX_RETRIES", "3"))
+EVAL_RETRY_BACKOFF = float(os.getenv("EVAL_RETRY_BACKOFF", "2.0"))
+# Seconds to keep judging queued answers when the process exits.
+EVAL_SHUTDOWN_TIMEOUT = float(os.getenv("EVAL_SHUTDOWN_TIMEOUT", "10"))
+
+PENDING = "PENDING"
+
+
+class EvaluationQueue:
+    """
+    Bounded queue of answers waiting for the relevance judge, drained by a pool of worker threads.
+
+    Workers take up to batch_size answers at a time and judge each model's answers in one call to
+    evaluate(items, model), which returns (evaluations, token_stats) with one
+    {"Relevance", "Explanation"} dict per (question, answer) item. Failed calls are retried with
+    exponential backoff; the results, with the batch's tokens split across its answers, are passed
+    to on_result(results) as dicts with conversation_id, question, answer, model, relevance,
+    relevance_explanation and eval_*_tokens.
+
+    Workers start on the first submit in each process, so the queue is safe to create before
+    gunicorn forks.
+    """
+
+    def __init__(self, evaluate, on_result, workers=EVAL_WORKERS, max_size=EVAL_QUEUE_SIZE,
+                 batch_size=EVAL_BATCH_SIZE, max_retries=EVAL_MAX_RETRIES,
+                 retry_backoff=EVAL_RETRY_BACKOFF, sample_rate=EVAL_SAMPLE_RATE):
+        self.evaluate = evaluate
+        self.on_result = on_result
+        self.workers = workers
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.sample_rate = sample_rate
+
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def sample(self):
+        """Whether the next answer should be judged, according to sample_rate."""
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def submit(self, conversation_id, question, answer, model='gpt-oss'):
+        """Queues an answer for evaluation. Returns False if the queue is full and it was dropped."""
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait((conversation_id, question, answer, model, monotonic()))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            print(f"[eval] queue full ({self.max_size}), dropping evaluation of {conversation_id}")
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _ensure_workers(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._threads = [
+                threading.Thread(target=self._work, name=f"eval-worker-{n}", daemon=True)
+                for n in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def _work(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._process(batch)
+            except Exception as e:
+                print(f"[eval] failed to store {len(batch)} evaluation(s): {type(e).__name__}: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _process(self, batch):
+        by_model = {}
+        for item in batch:
+            by_model.setdefault(item[3], []).append(item)
+
+        results = []
+        for model, items in by_model.items():
+            evaluations, token_stats = self._evaluate_with_retries(items, model)
+            shares = [_split_tokens(token_stats, len(items), n) for n in range(len(items))]
+            for item, evaluation, tokens in zip(items, evaluations, shares):
+                results.append({
+                    "conversation_id": item[0],
+                    "question": item[1],
+                    "answer": item[2],
+                    "model": model,
+                    "relevance": evaluation.get("Relevance", "UNKNOWN"),
+                    "relevance_explanation": evaluation.get("Explanation", "Failed to parse evaluation"),
+                    "eval_prompt_tokens": tokens["prompt_tokens"],
+                    "eval_completion_tokens": tokens["completion_tokens"],
+                    "eval_total_tokens": tokens["total_tokens"],
+                })
+
+        self.on_result(results)
+
+        now = monotonic()
+        with self._lock:
+            self.batches += 1
+            for item in batch:
+                lag = now - item[4]
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+
+    def _evaluate_with_retries(self, items, model):
+        pairs = [(question, answer) for _, question, answer, _, _ in items]
+        for attempt in range(self.max_retries + 1):
+            try:
+                evaluations, token_stats = self.evaluate(pairs, model=model)
+                with self._lock:
+                    self.completed += len(items)
+                return evaluations, token_stats
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"[eval] giving up on {len(items)} evaluation(s) after {attempt + 1} attempts: {e}")
+                    break
+                with self._lock:
+                    self.retries += 1
+                delay = self.retry_backoff * 2 ** attempt
+                print(f"[eval] judge call failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                sleep(delay)
+
+        with self._lock:
+            self.failed += len(items)
+        failed = {"Relevance": "UNKNOWN", "Explanation": "Evaluation failed"}
+        return [failed] * len(items), {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+    def join(self, timeout=None):
+        """Waits until every queued answer is judged, or timeout seconds pass. Returns True if drained."""
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self):
+        with self._queue.mutex:
+            oldest = self._queue.queue[0][4] if self._queue.queue else None
+        return {
+            "depth": self._queue.qsize(),
+            "max_size": self.max_size,
+            "workers": sum(thread.is_alive() for thread in self._threads) if self._pid == os.getpid() else 0,
+            "sample_rate": self.sample_rate,
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "batches": self.batches,
+            "oldest_pending_seconds": monotonic() - oldest if oldest is not None else 0.0,
+            "last_lag_seconds": self.last_lag,
+            "max_lag_seconds": self.max_lag,
+        }
+
+    def drain_at_exit(self, timeout=EVAL_SHUTDOWN_TIMEOUT):
+        """Registers an atexit hook that gives queued evaluations up to timeout seconds to finish."""
+        def drain():
+            if self._pid == os.getpid() and self._queue.unfinished_tasks:
+                print(f"[eval] waiting up to {timeout}s for {self._queue.unfinished_tasks} queued evaluation(s)")
+                self.join(timeout)
+        atexit.register(drain)
+        return self
+
+
+def _split_tokens(token_stats, parts, n):
+    """The n-th of parts shares of a batch's token usage; the first shares absorb the remainder."""
+    return {
+        name: value // parts + (1 if n < value % parts else 0)
+        for name, value in token_stats.items()
+    }
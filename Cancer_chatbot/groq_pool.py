@@ -0,0 +1,195 @@
+import os
+import threading
+from time import monotonic
+
+import httpx
+from groq import Groq, DefaultHttpxClient
+
+# Seconds a key rests after a 429 that carries no Retry-After header.
+GROQ_RATE_LIMIT_COOLDOWN = float(os.getenv("GROQ_RATE_LIMIT_COOLDOWN", "10"))
+# Consecutive 5xx/connection failures that open a key's circuit, and how long it stays open.
+GROQ_CIRCUIT_FAILURES = int(os.getenv("GROQ_CIRCUIT_FAILURES", "3"))
+GROQ_CIRCUIT_RESET = float(os.getenv("GROQ_CIRCUIT_RESET", "30"))
+# Seconds a key rests after being rejected as invalid (401/403).
+GROQ_AUTH_COOLDOWN = float(os.getenv("GROQ_AUTH_COOLDOWN", "300"))
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "60"))
+# Retries inside the SDK; 0 lets the pool move on to a healthier key instead.
+GROQ_CLIENT_MAX_RETRIES = int(os.getenv("GROQ_CLIENT_MAX_RETRIES", "0"))
+# Open connections per key; the SDK default of 100 would queue calls under the gevent profile.
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "500"))
+
+# Weight of the latest call in a key's moving average latency.
+_LATENCY_SMOOTHING = 0.2
+
+
+def error_status(exc):
+    """HTTP status code of a Groq SDK (or httpx) error, or None."""
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    if code is None:
+        code = getattr(exc, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def retry_after(exc):
+    """Seconds from the Retry-After header of a rate-limit error, or None."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _is_transient(exc, code):
+    if code is not None:
+        return code >= 500 or code == 408
+    name = type(exc).__name__
+    return any(part in name for part in ("Connection", "Timeout", "Connect", "RemoteProtocol"))
+
+
+class KeyHealth:
+    """Call outcomes of one API key: rate-limit cooldown, circuit breaker and moving average latency."""
+
+    def __init__(self):
+        self.available_at = 0.0
+        self.consecutive_failures = 0
+        self.circuit_open = False
+        self.latency = None
+        self.successes = 0
+        self.failures = 0
+        self.rate_limited = 0
+
+    def record_success(self, latency):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.circuit_open = False
+        self.available_at = 0.0
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += _LATENCY_SMOOTHING * (latency - self.latency)
+
+    def record_failure(self, exc, now):
+        self.failures += 1
+        code = error_status(exc)
+
+        if code == 429:
+            self.rate_limited += 1
+            wait = retry_after(exc)
+            self.available_at = now + (wait if wait is not None else GROQ_RATE_LIMIT_COOLDOWN)
+        elif code in (401, 403):
+            self.available_at = now + GROQ_AUTH_COOLDOWN
+        elif _is_transient(exc, code):
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= GROQ_CIRCUIT_FAILURES:
+                # Half-open after the reset: the next call is a trial, one more failure reopens it
+                self.circuit_open = True
+                self.available_at = now + GROQ_CIRCUIT_RESET
+
+    def state(self, now):
+        if self.available_at > now:
+            return "open" if self.circuit_open else "cooldown"
+        return "half_open" if self.circuit_open else "healthy"
+
+
+class GroqClientPool:
+    """
+    One persistent Groq client per API key, so HTTP connections and TLS sessions are reused, plus
+    the health of every key.
+
+    ranked(keys) orders keys for an attempt: usable keys first (fewest recent failures, then lowest
+    latency, then configuration order), followed by resting keys in the order they become usable
+    again. Clients are recreated after a fork, since connection pools must not be shared between
+    processes.
+    """
+
+    def __init__(self, client_factory=None):
+        self.client_factory = client_factory or (
+            lambda api_key: Groq(
+                api_key=api_key,
+                timeout=GROQ_TIMEOUT,
+                max_retries=GROQ_CLIENT_MAX_RETRIES,
+                http_client=DefaultHttpxClient(limits=httpx.Limits(
+                    max_connections=GROQ_MAX_CONNECTIONS,
+                    max_keepalive_connections=min(GROQ_MAX_CONNECTIONS, 100),
+                )),
+            )
+        )
+        self._clients = {}
+        self._health = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def client(self, api_key):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._clients = {}
+                self._pid = os.getpid()
+            client = self._clients.get(api_key)
+            if client is None:
+                client = self._clients[api_key] = self.client_factory(api_key)
+            return client
+
+    def _key_health(self, api_key):
+        health = self._health.get(api_key)
+        if health is None:
+            health = self._health[api_key] = KeyHealth()
+        return health
+
+    def ranked(self, keys):
+        now = monotonic()
+        with self._lock:
+            order = {key: n for n, key in enumerate(keys)}
+            health = {key: self._key_health(key) for key in keys}
+
+        def rank(key):
+            h = health[key]
+            if h.available_at > now:
+                return (1, h.available_at, order[key])
+            return (0, h.consecutive_failures, h.latency if h.latency is not None else 0.0, order[key])
+
+        return sorted(keys, key=rank)
+
+    def usable(self, keys):
+        """The keys of ranked(keys) that are not resting, or all of them if every key is."""
+        now = monotonic()
+        ranked = self.ranked(keys)
+        with self._lock:
+            usable = [key for key in ranked if self._health[key].available_at <= now]
+        return usable or ranked
+
+    def available_in(self, keys):
+        """Seconds until the first of keys stops resting; 0 if one is usable now."""
+        now = monotonic()
+        with self._lock:
+            return max(min(self._key_health(key).available_at for key in keys) - now, 0.0)
+
+    def record_success(self, api_key, latency):
+        with self._lock:
+            self._key_health(api_key).record_success(latency)
+
+    def record_failure(self, api_key, exc):
+        with self._lock:
+            health = self._key_health(api_key)
+            health.record_failure(exc, monotonic())
+            state = health.state(monotonic())
+        if state != "healthy":
+            print(f"[groq] key ...{api_key[-4:]} is {state} after {type(exc).__name__}")
+
+    def stats(self):
+        now = monotonic()
+        with self._lock:
+            return {
+                f"...{key[-4:]}": {
+                    "state": health.state(now),
+                    "available_in": max(health.available_at - now, 0.0),
+                    "consecutive_failures": health.consecutive_failures,
+                    "latency": health.latency,
+                    "successes": health.successes,
+                    "failures": health.failures,
+                    "rate_limited": health.rate_limited,
+                }
+                for key, health in self._health.items()
+            }
@@ -0,0 +1,47 @@
+import os
+
+# Worker profile:
+#   gevent  - cooperative workers; a question waiting on Groq or Postgres yields to the others, so one
+#             process keeps hundreds of questions in flight (WEB_WORKER_CONNECTIONS per worker)
+#   gthread - WEB_THREADS OS threads per worker
+#   sync    - one request per worker at a time
+#
+# Questions that need a fresh answer are bounded by the Groq quota, not by the profile: each
+# worker gives every key GROQ_RPM requests and GROQ_TPM tokens per minute (rate_limit.py), and
+# the in-flight and waiting caps follow from those unless GROQ_MAX_CONCURRENCY and
+# RATE_LIMIT_MAX_WAITERS are set. With the free-tier defaults (15 RPM and 6000 TPM at ~2500
+# tokens per call, i.e. 2.4 calls per minute per key) a worker with two keys runs at most 3
+# calls per key at once, lets 2 more wait, and sustains about 5 answers a minute; the rest get
+# 503 with Retry-After. Cached and shared answers, canned replies, /history and open streams
+# are not limited. On a paid tier, set GROQ_RPM and GROQ_TPM to its quota divided by
+# WEB_WORKERS and the caps grow with them.
+SERVER_PROFILE = os.getenv("SERVER_PROFILE", "gevent")
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "2"))
+WEB_WORKER_CONNECTIONS = int(os.getenv("WEB_WORKER_CONNECTIONS", "1000"))
+WEB_THREADS = int(os.getenv("WEB_THREADS", "32"))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+workers = WEB_WORKERS
+timeout = 120
+
+if SERVER_PROFILE == "gevent":
+    worker_class = "gevent"
+    worker_connections = WEB_WORKER_CONNECTIONS
+    # httpx imports httpcore lazily, which pulls in trio when it is installed; trio needs
+    # select.epoll, which gevent's monkey-patching removes, so import it before the workers patch
+    import httpcore  # noqa: F401
+elif SERVER_PROFILE == "gthread":
+    worker_class = "gthread"
+    threads = WEB_THREADS
+elif SERVER_PROFILE == "sync":
+    worker_class = "sync"
+else:
+    raise ValueError(f"SERVER_PROFILE must be gevent, gthread or sync, not {SERVER_PROFILE!r}")
+
+
+def post_fork(server, worker):
+    if SERVER_PROFILE == "gevent":
+        # The gevent worker monkey-patches sockets, threads and queues, so httpx calls to Groq and
+        # the background threads cooperate; psycopg2 talks to libpq directly and needs its own hook
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
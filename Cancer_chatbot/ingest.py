@@ -1,20 +1,251 @@
 import os
+import re
+import sys
+import argparse
+import tempfile
+import subprocess
+
 import pandas as pd
 
 import minsearch
 
 DATA_PATH = os.getenv("DATA_PATH", "../data/CancerQA_data.csv")
+# Optional prebuilt index snapshot (see `python ingest.py --snapshot`); empty disables it.
+INDEX_SNAPSHOT_PATH = os.getenv("INDEX_SNAPSHOT_PATH", "")
+# "dense" (cosine over every doc) or "inverted" (posting lists of the query terms only).
+INDEX_ENGINE = os.getenv("INDEX_ENGINE", "dense")
+# "tfidf" (cosine similarity) or "bm25"; see evaluate_retrieval.py for a comparison.
+INDEX_SCORER = os.getenv("INDEX_SCORER", "tfidf")
+# "lexical", "lsa" (truncated SVD vectors, which also match paraphrases) or "hybrid" (both, fused).
+INDEX_RETRIEVAL = os.getenv("INDEX_RETRIEVAL", "lexical")
+# LSA dimensions per text field, and whether to keep the LSA vectors as int8 instead of float32.
+INDEX_LSA_DIMS = int(os.getenv("INDEX_LSA_DIMS", "256"))
+INDEX_LSA_QUANTIZE = os.getenv("INDEX_LSA_QUANTIZE", "0") == "1"
+# Answers are indexed as overlapping passages of up to this many characters; 0 indexes whole answers.
+PASSAGE_MAX_CHARS = int(os.getenv("PASSAGE_MAX_CHARS", "1200"))
+PASSAGE_OVERLAP_CHARS = int(os.getenv("PASSAGE_OVERLAP_CHARS", "200"))
+# Entries added or deleted by --upsert/--delete since the snapshot's last fit that make ingest refit it,
+# so corrections learn their new words; 0 never refits.
+INDEX_REFIT_AFTER = int(os.getenv("INDEX_REFIT_AFTER", "200"))
+# Passages searched per document asked for, so the passages of one answer cannot crowd out the others.
+PASSAGE_SEARCH_DEPTH = int(os.getenv("PASSAGE_SEARCH_DEPTH", "5"))
+
+_SECTION_BREAK_RE = re.compile(r"\n\s*\n")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _split_long(sentence, max_chars):
+    # Bullet lists in the NCI answers often have no sentence punctuation at all.
+    pieces, current = [], ""
+    for word in sentence.split(" "):
+        if current and len(current) + 1 + len(word) > max_chars:
+            pieces.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_passages(text, max_chars=PASSAGE_MAX_CHARS, overlap_chars=PASSAGE_OVERLAP_CHARS):
+    """
+    Splits an answer into passages of roughly max_chars characters.
+
+    Answers separate "Key Points" and each stage/treatment section with blank lines. A section that fits
+    in a passage is never split; longer sections are cut on sentence boundaries, and a passage cut
+    mid-section starts with up to overlap_chars of trailing sentences from the previous one. With
+    max_chars <= 0 the whole answer is one passage.
+    """
+    if max_chars <= 0:
+        return [text] if text and text.strip() else []
+
+    passages = []
+    current, size, fresh = [], 0, 0
+
+    def flush(overlap):
+        nonlocal current, size, fresh
+        if fresh:
+            passages.append(" ".join(current))
+        tail = []
+        if overlap:
+            for sentence in reversed(current[1:]):
+                if sum(len(s) + 1 for s in tail) + len(sentence) > overlap_chars:
+                    break
+                tail.insert(0, sentence)
+        current, size, fresh = tail, sum(len(s) + 1 for s in tail), 0
+
+    for section in _SECTION_BREAK_RE.split(text or ""):
+        section = _WHITESPACE_RE.sub(" ", section).strip()
+        if not section:
+            continue
+
+        if current and size + len(section) > max_chars and len(section) <= max_chars:
+            flush(overlap=False)
+
+        for sentence in _SENTENCE_END_RE.split(section):
+            for piece in _split_long(sentence, max_chars):
+                if fresh and size + len(piece) > max_chars:
+                    flush(overlap=True)
+                current.append(piece)
+                size += len(piece) + 1
+                fresh += 1
+
+    flush(overlap=False)
+    return passages
+
+
+def chunk_documents(documents, max_chars=PASSAGE_MAX_CHARS, overlap_chars=PASSAGE_OVERLAP_CHARS):
+    """
+    Replaces every document by one document per answer passage. Passages keep the parent's fields,
+    including its "id", and get a "passage_id" of the form "<id>-<n>".
+    """
+    passages = []
+    for doc in documents:
+        for n, text in enumerate(split_passages(doc.get("answer", ""), max_chars, overlap_chars)):
+            passages.append({**doc, "answer": text, "passage_id": f"{doc['id']}-{n}"})
+    return passages
+
+
+def top_documents(passages, num_results=10):
+    """
+    The passages of the num_results best documents, in rank order. A document ranks by its best
+    passage, so passages must come best first (as search() returns them).
+    """
+    best = set()
+    kept = []
+    for doc in passages:
+        if doc["id"] not in best:
+            if len(best) == num_results:
+                continue
+            best.add(doc["id"])
+        kept.append(doc)
+    return kept
+
+
+def search_documents(index, query, num_results=10, depth=PASSAGE_SEARCH_DEPTH, **options):
+    """
+    Searches index for the num_results best documents rather than passages: fetches depth passages per
+    document asked for and keeps those of the best documents (see top_documents()).
+    """
+    passages = index.search(query, num_results=num_results * max(depth, 1), **options)
+    return top_documents(passages, num_results)
+
 
-def load_index(data_path=DATA_PATH):
+def build_index(data_path=DATA_PATH):
     df = pd.read_csv(data_path)
 
-    documents = df.to_dict(orient='records')
+    documents = chunk_documents(df.to_dict(orient='records'))
 
     index = minsearch.Index(
         text_fields=["question", "answer"],
-        keyword_fields=['id']
+        keyword_fields=['id'],
+        engine=INDEX_ENGINE,
+        scorer=INDEX_SCORER,
+        retrieval=INDEX_RETRIEVAL,
+        lsa_params={"dims": INDEX_LSA_DIMS, "quantize": INDEX_LSA_QUANTIZE},
     )
 
     index.fit(documents)
 
     return index
+
+
+def build_index_in_subprocess(data_path=DATA_PATH, snapshot_path=INDEX_SNAPSHOT_PATH):
+    """
+    build_index in a separate Python process, so a refit never competes for this process's GIL (or
+    stalls a gevent worker's event loop). The process writes the index as the snapshot at snapshot_path
+    (atomically, see Index.save), which is then memory-mapped here; the other workers' IndexReloader and
+    the next start pick up the same snapshot instead of fitting again. Without a snapshot_path it goes
+    to a temporary snapshot that is read into memory and removed.
+    """
+    if snapshot_path:
+        _build_snapshot_in_subprocess(data_path, snapshot_path)
+        return minsearch.Index.load(snapshot_path, engine=INDEX_ENGINE)
+
+    with tempfile.TemporaryDirectory(prefix="index-build-") as tmp:
+        snapshot_path = os.path.join(tmp, "snapshot")
+        _build_snapshot_in_subprocess(data_path, snapshot_path)
+        return minsearch.Index.load(snapshot_path, mmap=False, engine=INDEX_ENGINE)
+
+
+def _build_snapshot_in_subprocess(data_path, snapshot_path):
+    subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--data", data_path, "--snapshot", snapshot_path],
+        check=True,
+    )
+
+
+def index_sources(data_path=DATA_PATH, snapshot_path=INDEX_SNAPSHOT_PATH):
+    """The files load_index reads; a snapshot's meta.json is written last, when the rest is complete."""
+    sources = [data_path]
+    if snapshot_path:
+        sources.append(os.path.join(snapshot_path, "meta.json"))
+    return sources
+
+
+def _snapshot_is_fresh(snapshot_path, data_path):
+    meta_path = os.path.join(snapshot_path, "meta.json")
+    if not os.path.exists(meta_path):
+        return False
+    if os.path.exists(data_path) and os.path.getmtime(data_path) > os.path.getmtime(meta_path):
+        print(f"[ingest] snapshot {snapshot_path} is older than {data_path}, refitting")
+        return False
+    return True
+
+
+def load_index(data_path=DATA_PATH, snapshot_path=INDEX_SNAPSHOT_PATH, build=build_index):
+    if snapshot_path and _snapshot_is_fresh(snapshot_path, data_path):
+        try:
+            index = minsearch.Index.load(snapshot_path, engine=INDEX_ENGINE)
+            if index.scorer != INDEX_SCORER:
+                raise ValueError(f"snapshot uses scorer {index.scorer!r}, INDEX_SCORER is {INDEX_SCORER!r}")
+            if index.retrieval != INDEX_RETRIEVAL:
+                raise ValueError(f"snapshot uses retrieval {index.retrieval!r}, INDEX_RETRIEVAL is {INDEX_RETRIEVAL!r}")
+            print(f"[ingest] loaded index snapshot from {snapshot_path} ({len(index.docs)} docs)")
+            return index
+        except ValueError as e:
+            print(f"[ingest] ignoring index snapshot: {e}")
+
+    return build(data_path)
+
+
+def apply_changes(index, upserts=(), delete_ids=(), refit_after=INDEX_REFIT_AFTER):
+    """
+    Applies content corrections to a fitted index: every entry of upserts replaces the passages of
+    its "id" (or is added), and the entries of delete_ids are removed. Corrected passages only use the
+    vocabulary of the last fit (see Index.add), so once refit_after rows changed since that fit the
+    result is refitted. Returns the changed index, which may be a new one.
+    """
+    if delete_ids:
+        index.delete(list(delete_ids))
+    if upserts:
+        index.update(chunk_documents(list(upserts)))
+    if refit_after > 0 and index.changes_since_fit >= refit_after:
+        print(f"[ingest] refitting after {index.changes_since_fit} changed rows")
+        index = index.refit()
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a memory-mappable index snapshot")
+    parser.add_argument("--data", default=DATA_PATH, help="CSV file to index")
+    parser.add_argument(
+        "--snapshot",
+        default=INDEX_SNAPSHOT_PATH or "../data/index_snapshot",
+        help="Directory to write the snapshot to",
+    )
+    parser.add_argument("--upsert", help="CSV of corrected or new entries to apply to the existing snapshot instead of rebuilding it")
+    parser.add_argument("--delete", nargs="+", type=int, default=[], metavar="ID", help="entry ids to remove from the existing snapshot")
+    args = parser.parse_args()
+
+    if args.upsert or args.delete:
+        # Corrections only; also make them in --data, or the next rebuild from it drops them
+        index = minsearch.Index.load(args.snapshot, mmap=False)
+        upserts = pd.read_csv(args.upsert).to_dict(orient="records") if args.upsert else []
+        index = apply_changes(index, upserts, args.delete)
+    else:
+        index = build_index(args.data)
+    index.save(args.snapshot)
+    print(f"Saved index snapshot with {len(index.docs)} docs to {args.snapshot}")
@@ -0,0 +1,163 @@
+import os
+import hashlib
+import threading
+from time import monotonic
+
+# Seconds between checks of the knowledge base files for a new version to load; 0 disables reloading.
+INDEX_RELOAD_INTERVAL = float(os.getenv("INDEX_RELOAD_INTERVAL", "30"))
+
+
+class LiveIndex:
+    """
+    Serves searches from a minsearch.Index that replace() swaps for a new one, e.g. a new knowledge
+    base version from IndexReloader.
+
+    The swap is a single assignment, so a search that already started finishes on the index it
+    started on and searches take no lock. Content corrections reach the workers the same way:
+    `python ingest.py --upsert/--delete` applies them to the snapshot, which IndexReloader then loads
+    in every worker. Every swap calls the on_swap listeners with the new index and version, so that
+    nothing keeps the old index alive once the searches running on it are done.
+    """
+
+    def __init__(self, index, version=None):
+        self.current = index
+        self.version = version
+        self.on_swap = []
+
+        self._write_lock = threading.Lock()
+        self.replacements = 0
+
+    def search(self, *args, **kwargs):
+        return self.current.search(*args, **kwargs)
+
+    def search_batch(self, *args, **kwargs):
+        return self.current.search_batch(*args, **kwargs)
+
+    def replace(self, index, version=None):
+        """Swaps in a new index."""
+        with self._write_lock:
+            self.current = index
+            self.version = version
+            self.replacements += 1
+        for listener in self.on_swap:
+            listener(index, version)
+
+    def stats(self):
+        index = self.current
+        return {
+            "version": self.version,
+            "docs": len(index.docs),
+            "deleted": 0 if index.deleted is None else int(index.deleted.sum()),
+            "changes_since_fit": index.changes_since_fit,
+            "replacements": self.replacements,
+        }
+
+
+class IndexReloader:
+    """
+    Loads a new knowledge base into a LiveIndex when the files it is built from change.
+
+    Every interval seconds a daemon thread compares the modification time and size of paths (the CSV
+    and the snapshot's meta.json, see ingest.index_sources) with those the current index was loaded
+    from. A change is loaded with load() once it has stayed the same for a whole interval, so a CSV
+    that is still being written is never read, and then swapped in with LiveIndex.replace(); searches
+    running on the old index finish on it. A load that fails keeps the old index and is not retried
+    until the files change again.
+
+    The version of the live index is a hash of those stamps, so every worker on a host derives the
+    same one and caches shared between them (see cache.AnswerCache) agree on it.
+    """
+
+    def __init__(self, live, load, paths, interval=INDEX_RELOAD_INTERVAL):
+        self.live = live
+        self.load = load
+        self.paths = list(paths)
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stopping = threading.Event()
+        self.loaded = self._stamps()
+        self._seen = self.loaded
+        self._failed = None
+        self.live.version = _version(self.loaded)
+
+        self.reloads = 0
+        self.failures = 0
+        self.last_reload_ms = 0.0
+        self.last_error = None
+
+    def _stamps(self):
+        stamps = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                stamps.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamps.append((path, None, None))
+        return tuple(stamps)
+
+    def ensure_started(self):
+        if self.interval <= 0 or self._pid == os.getpid():
+            return self
+        with self._lock:
+            if self._pid != os.getpid():
+                self._stopping = threading.Event()
+                threading.Thread(target=self._run, name="index-reloader", daemon=True).start()
+                self._pid = os.getpid()
+        return self
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """Reloads when the files changed and have not changed since the previous check; returns whether it did."""
+        stamps = self._stamps()
+        settled = stamps == self._seen
+        self._seen = stamps
+        if not settled or stamps in (self.loaded, self._failed):
+            return False
+        return self.reload(stamps)
+
+    def reload(self, stamps=None):
+        stamps = stamps or self._stamps()
+        started = monotonic()
+        try:
+            index = self.load()
+        except Exception as e:
+            print(f"[live_index] reload failed: {type(e).__name__}: {e}")
+            with self._lock:
+                self._failed = stamps
+                self.failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+            return False
+
+        self.live.replace(index, _version(stamps))
+        with self._lock:
+            self.loaded = stamps
+            self.reloads += 1
+            self.last_reload_ms = (monotonic() - started) * 1000
+        print(f"[live_index] loaded {len(index.docs)} docs as version {self.live.version} "
+              f"in {self.last_reload_ms:.0f}ms")
+        return True
+
+    def stop(self):
+        self._stopping.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.live.version,
+                "paths": self.paths,
+                "interval": self.interval,
+                "reloads": self.reloads,
+                "failures": self.failures,
+                "last_reload_ms": self.last_reload_ms,
+                "last_error": self.last_error,
+                "running": self._pid == os.getpid() and not self._stopping.is_set(),
+            }
+
+
+def _version(stamps):
+    return hashlib.sha1(repr(stamps).encode()).hexdigest()[:12]
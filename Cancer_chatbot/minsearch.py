@@ -1,25 +1,82 @@
+import os
+import sys
+import json
+import shutil
+
 import pandas as pd
 
-from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy.sparse import csc_matrix, csr_matrix, hstack, vstack
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 
 import numpy as np
 
 
+# Bump whenever the on-disk layout written by Index.save changes.
+SNAPSHOT_FORMAT_VERSION = 1
+
+# "dense" scores every document with cosine_similarity, "inverted" only walks the
+# posting lists of the query terms.
+SEARCH_ENGINES = ("dense", "inverted")
+
+# "tfidf" ranks by TF-IDF cosine similarity, "bm25" by Okapi BM25 summed over the boosted fields.
+SCORERS = ("tfidf", "bm25")
+DEFAULT_BM25_PARAMS = {"k1": 1.2, "b": 0.75}
+
+# "lexical" ranks by the scorer above, "lsa" by the cosine similarity of LSA (truncated SVD) vectors
+# of the same matrices, which also matches paraphrases that share no words with the documents, and
+# "hybrid" fuses the two rankings with reciprocal rank fusion.
+RETRIEVAL_MODES = ("lexical", "lsa", "hybrid")
+# dims: LSA dimensions per text field; quantize: store the vectors as int8 with a scale per row;
+# rrf_k: the k of RRF's 1 / (k + rank); rrf_depth: results taken from each ranking before fusing.
+DEFAULT_LSA_PARAMS = {"dims": 256, "quantize": False, "rrf_k": 60, "rrf_depth": 50}
+
+# Index.add() and delete() call merge() once this many rows were added since the posting lists were
+# built, or are deleted but still stored, so neither ever slows queries down by much.
+MERGE_ROWS = 256
+
+# TfidfVectorizer options that CountVectorizer (used for BM25 term counts) does not accept.
+_TFIDF_ONLY_PARAMS = ("norm", "use_idf", "smooth_idf", "sublinear_tf")
+
+
+class Not:
+    """
+    Negated keyword filter value, e.g. filter_dict={"topic": Not("lung")} or Not(["lung", "skin"]).
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+
 class Index:
     """
-    A simple search index using TF-IDF and cosine similarity for text fields and exact matching for keyword fields.
+    A simple search index using TF-IDF cosine similarity (or BM25) for text fields and exact matching for keyword fields.
 
     Attributes:
         text_fields (list): List of text field names to index.
         keyword_fields (list): List of keyword field names to index.
-        vectorizers (dict): Dictionary of TfidfVectorizer instances for each text field.
+        vectorizers (dict): Dictionary of TfidfVectorizer (CountVectorizer for BM25) instances for each text field.
         keyword_df (pd.DataFrame): DataFrame containing keyword field data.
-        text_matrices (dict): Dictionary of TF-IDF matrices for each text field.
+        keyword_index (dict): Per keyword field, a dictionary mapping each value to the ascending row ids holding it.
+        text_matrices (dict): Dictionary of TF-IDF matrices (precomputed BM25 term weights for BM25) for each text field.
+        doc_lengths (dict): Dictionary of per-document token counts for each text field, used by BM25.
+        bm25_idf (dict): Dictionary of BM25 idf vectors for each text field.
+        postings (dict): Dictionary of term-major (CSC) posting lists for each text field, used by the inverted engine.
+        lsa_projections (dict): Dictionary of (terms x dims) float32 SVD projections for each text field.
+        lsa_vectors (dict): Dictionary of contiguous (docs x dims) unit-length LSA document vectors for each text
+            field, float32 or int8 when quantized.
+        lsa_scales (dict): Dictionary of per-document float32 scales of the int8 LSA vectors for each text field.
+        postings_delta (dict): Dictionary of posting lists of the rows added since the postings were last built,
+            for each text field.
+        deleted (np.ndarray): Boolean mask of the deleted rows still stored until the next merge, or None.
+        changes_since_fit (int): Rows added or deleted since the vocabulary and weights were fitted.
+        merge_rows (int): Added or deleted rows that trigger a merge. Defaults to MERGE_ROWS.
         docs (list): List of documents indexed.
     """
 
-    def __init__(self, text_fields, keyword_fields, vectorizer_params={}):
+    def __init__(self, text_fields, keyword_fields, vectorizer_params={}, engine="dense", scorer="tfidf", bm25_params={},
+                 retrieval="lexical", lsa_params={}):
         """
         Initializes the Index with specified text and keyword fields.
 
@@ -27,13 +84,48 @@ class Index:
             text_fields (list): List of text field names to index.
             keyword_fields (list): List of keyword field names to index.
             vectorizer_params (dict): Optional parameters to pass to TfidfVectorizer.
+            engine (str): "dense" to score every document, or "inverted" to score only documents
+                found in the posting lists of the query terms. Both return the same results.
+            scorer (str): "tfidf" for TF-IDF cosine similarity or "bm25" for Okapi BM25.
+            bm25_params (dict): Optional BM25 parameters "k1" (term frequency saturation) and "b"
+                (document length normalisation). Defaults to DEFAULT_BM25_PARAMS.
+            retrieval (str): Default ranking of search(): "lexical", "lsa" or "hybrid". Any other than
+                "lexical" fits LSA vectors, after which search() can use every mode.
+            lsa_params (dict): Optional LSA and fusion parameters "dims", "quantize", "rrf_k" and
+                "rrf_depth". Defaults to DEFAULT_LSA_PARAMS.
         """
+        if engine not in SEARCH_ENGINES:
+            raise ValueError(f"Unknown search engine {engine!r}, expected one of {SEARCH_ENGINES}")
+        if scorer not in SCORERS:
+            raise ValueError(f"Unknown scorer {scorer!r}, expected one of {SCORERS}")
+        if retrieval not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {retrieval!r}, expected one of {RETRIEVAL_MODES}")
+
         self.text_fields = text_fields
         self.keyword_fields = keyword_fields
+        self.vectorizer_params = dict(vectorizer_params)
+        self.engine = engine
+        self.scorer = scorer
+        self.bm25_params = {**DEFAULT_BM25_PARAMS, **bm25_params}
+        self.retrieval = retrieval
+        self.lsa_params = {**DEFAULT_LSA_PARAMS, **lsa_params}
 
-        self.vectorizers = {field: TfidfVectorizer(**vectorizer_params) for field in text_fields}
+        self.vectorizers = {field: self._make_vectorizer() for field in text_fields}
         self.keyword_df = None
+        self.keyword_index = {}
         self.text_matrices = {}
+        self.doc_lengths = {}
+        self.bm25_idf = {}
+        self.postings = {}
+        self.lsa_projections = {}
+        self.lsa_vectors = {}
+        self.lsa_scales = {}
+        self.bm25_avg_lengths = {}
+        self.postings_delta = {}
+        self._postings_rows = 0
+        self.deleted = None
+        self.changes_since_fit = 0
+        self.merge_rows = MERGE_ROWS
         self.docs = []
 
     def fit(self, docs):
@@ -48,49 +140,868 @@ class Index:
 
         for field in self.text_fields:
             texts = [doc.get(field, '') for doc in docs]
-            self.text_matrices[field] = self.vectorizers[field].fit_transform(texts)
+            matrix = self.vectorizers[field].fit_transform(texts)
+            if self.scorer == "bm25":
+                counts = matrix.tocsr()
+                self.doc_lengths[field] = np.asarray(counts.sum(axis=1), dtype=np.float32).ravel()
+                num_docs_with_term = np.bincount(counts.indices, minlength=counts.shape[1])
+                self.bm25_idf[field] = _bm25_idf(num_docs_with_term, counts.shape[0])
+                self.bm25_avg_lengths[field] = _average_length(self.doc_lengths[field])
+                matrix = self._bm25_weights(
+                    counts, self.doc_lengths[field], self.bm25_idf[field], self.bm25_avg_lengths[field])
+            self.text_matrices[field] = matrix
 
         for doc in docs:
             for field in self.keyword_fields:
                 keyword_data[field].append(doc.get(field, ''))
 
         self.keyword_df = pd.DataFrame(keyword_data)
+        self._build_keyword_index()
+        self.deleted = None
+        self.changes_since_fit = 0
+
+        if self.engine == "inverted":
+            self._build_postings()
+        if self.retrieval != "lexical":
+            self._fit_lsa()
+
+        return self
+
+    def add(self, docs):
+        """
+        Appends documents without refitting.
+
+        They are vectorized with the vocabulary and weights (idf, BM25 average length, LSA projection)
+        of the last fit, so words the index has not seen are not searchable in them until refit().
+        With the inverted engine their posting lists go to postings_delta until the next merge().
+
+        Args:
+            docs (list of dict): Documents to append.
+        """
+        docs = list(docs)
+        if not docs:
+            return self
+
+        for field in self.text_fields:
+            matrix, lengths = self._transform_docs(field, docs)
+            self.text_matrices[field] = vstack([self.text_matrices[field], matrix], format="csr")
+            if lengths is not None:
+                self.doc_lengths[field] = np.concatenate([self.doc_lengths[field], lengths])
+            if field in self.lsa_vectors:
+                vectors, scales = self._encode_lsa(normalize(matrix @ self.lsa_projections[field]))
+                self.lsa_vectors[field] = np.concatenate([self.lsa_vectors[field], vectors])
+                if scales is not None:
+                    self.lsa_scales[field] = np.concatenate([self.lsa_scales[field], scales])
+            if self.engine == "inverted":
+                self.postings_delta[field] = self._postings_matrix(self.text_matrices[field][self._postings_rows:])
+
+        keyword_data = {field: [doc.get(field, '') for doc in docs] for field in self.keyword_fields}
+        self.keyword_df = pd.concat([self.keyword_df, pd.DataFrame(keyword_data)], ignore_index=True)
+        self._build_keyword_index()
+        if self.deleted is not None:
+            self.deleted = np.concatenate([self.deleted, np.zeros(len(docs), dtype=bool)])
+        self.docs = self.docs + docs
 
+        self.changes_since_fit += len(docs)
+        self._maybe_merge()
         return self
 
-    def search(self, query, filter_dict={}, boost_dict={}, num_results=10):
+    def delete(self, values, field="id"):
+        """
+        Deletes every document whose keyword field holds one of values.
+
+        Deleted rows are only masked out of the results until the next merge() drops them.
+
+        Args:
+            values: A value or a list/tuple/set of values, as accepted by filter_dict.
+            field (str): The keyword field to match. Defaults to "id".
+
+        Returns:
+            int: The number of documents deleted.
+        """
+        if field not in self.keyword_fields:
+            raise ValueError(f"Can only delete by a keyword field, not {field!r}")
+
+        rows = self._filter_rows({field: values})
+        deleted = np.zeros(len(self.docs), dtype=bool) if self.deleted is None else self.deleted.copy()
+        count = int(np.count_nonzero(~deleted[rows]))
+        deleted[rows] = True
+        self.deleted = deleted
+
+        self.changes_since_fit += count
+        self._maybe_merge()
+        return count
+
+    def update(self, docs, field="id"):
+        """
+        Replaces the documents sharing a keyword field value with docs, e.g. all passages of an entry
+        with its corrected passages: a delete() of their values followed by an add().
+        """
+        docs = list(docs)
+        self.delete(list(dict.fromkeys(doc.get(field, '') for doc in docs)), field)
+        return self.add(docs)
+
+    def merge(self):
+        """
+        Drops the deleted rows and rebuilds the posting lists over every row, so queries no longer pay
+        for them. Renumbers the remaining rows; use copy() to merge while others search this index.
+        """
+        compacted = self.deleted is not None
+        if compacted:
+            self._take_rows(np.flatnonzero(~self.deleted))
+
+        if self.engine == "inverted" and (compacted or self.postings_delta):
+            self._build_postings()
+        return self
+
+    def subset(self, rows):
+        """
+        A copy holding only the given rows (ascending, deleted ones left out) with this index's
+        vocabulary and weights, so its scores compare with those of this index and of every other
+        subset of it, e.g. to split it into shards (see sharded_index.ShardedIndex).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.deleted is not None:
+            rows = rows[~self.deleted[rows]]
+        index = self.copy()
+        index._take_rows(rows)
+        if index.engine == "inverted":
+            index._build_postings()
+        return index
+
+    def _take_rows(self, rows):
+        self.docs = [self.docs[i] for i in rows]
+        for field in self.text_fields:
+            self.text_matrices[field] = self.text_matrices[field][rows]
+            for arrays in (self.doc_lengths, self.lsa_vectors, self.lsa_scales):
+                if field in arrays:
+                    arrays[field] = np.ascontiguousarray(arrays[field][rows])
+        self.keyword_df = self.keyword_df.iloc[rows].reset_index(drop=True)
+        self._build_keyword_index()
+        self.deleted = None
+
+    def _maybe_merge(self):
+        added = len(self.docs) - self._postings_rows if self.engine == "inverted" else 0
+        deleted = 0 if self.deleted is None else int(np.count_nonzero(self.deleted))
+        if max(added, deleted) >= self.merge_rows:
+            self.merge()
+
+    def refit(self):
+        """
+        Fits a new index with the same parameters on the documents that are not deleted, picking up
+        the vocabulary of the documents added since the last fit. This index is left untouched.
+        """
+        docs = self.docs if self.deleted is None else [doc for doc, dead in zip(self.docs, self.deleted) if not dead]
+        return type(self)(
+            self.text_fields, self.keyword_fields, self.vectorizer_params, self.engine, self.scorer,
+            self.bm25_params, self.retrieval, self.lsa_params,
+        ).fit(docs)
+
+    def copy(self):
+        """
+        A shallow copy that add(), delete(), update() and merge() can change without affecting this
+        index: arrays are shared but always replaced rather than modified in place.
+        """
+        index = type(self).__new__(type(self))
+        index.__dict__.update(self.__dict__)
+        for name, value in self.__dict__.items():
+            if isinstance(value, dict):
+                setattr(index, name, dict(value))
+        return index
+
+    def _transform_docs(self, field, docs):
+        """Rows of new documents in the fitted vocabulary and weights, and their BM25 lengths (or None)."""
+        matrix = self.vectorizers[field].transform([doc.get(field, '') for doc in docs])
+        if self.scorer != "bm25":
+            return matrix, None
+        counts = matrix.tocsr()
+        lengths = np.asarray(counts.sum(axis=1), dtype=np.float32).ravel()
+        return self._bm25_weights(counts, lengths, self.bm25_idf[field], self.bm25_avg_lengths[field]), lengths
+
+    def _make_vectorizer(self, **kwargs):
+        if self.scorer == "bm25":
+            params = {k: v for k, v in self.vectorizer_params.items() if k not in _TFIDF_ONLY_PARAMS}
+            return CountVectorizer(**params, **kwargs)
+        return TfidfVectorizer(**self.vectorizer_params, **kwargs)
+
+    def _bm25_weights(self, counts, doc_lengths, idf, avg_length):
+        """
+        Precomputes the BM25 contribution of every (doc, term) pair so scoring a query is a sparse dot product
+        with its binary term vector: idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(d) / avg_len)).
+        """
+        k1, b = self.bm25_params["k1"], self.bm25_params["b"]
+        length_norms = k1 * (1 - b + b * doc_lengths / avg_length)
+
+        tf = counts.data.astype(np.float32)
+        rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+        weights = idf[counts.indices] * tf * (k1 + 1) / (tf + length_norms[rows])
+
+        return csr_matrix((weights.astype(np.float32), counts.indices, counts.indptr), shape=counts.shape)
+
+    def _query_weights(self, query_matrix):
+        # BM25 counts each query term once; TF-IDF query vectors are L2-normalised for cosine similarity.
+        if self.scorer == "bm25":
+            weights = query_matrix.astype(np.float32)
+            weights.data[:] = 1.0
+            return weights
+        return normalize(query_matrix, norm="l2")
+
+    def _build_postings(self):
+        # TF-IDF rows are L2-normalised so a dot product with the (normalised) query vector equals
+        # the cosine similarity used by the dense engine; BM25 rows already hold final term weights.
+        # CSC keeps each term's postings contiguous: indptr[t]:indptr[t + 1] slices the doc ids and
+        # weights of term t.
+        for field in self.text_fields:
+            self.postings[field] = self._postings_matrix(self.text_matrices[field])
+        self.postings_delta = {}
+        self._postings_rows = len(self.docs)
+
+    def _postings_matrix(self, matrix):
+        if self.scorer == "tfidf":
+            matrix = normalize(matrix, norm="l2", copy=True)
+        return matrix.tocsc()
+
+    def _postings_segments(self, field):
+        """(first row, posting lists) of the rows the postings were built over and of those added since."""
+        segments = [(0, self.postings[field])]
+        if field in self.postings_delta:
+            segments.append((self._postings_rows, self.postings_delta[field]))
+        return segments
+
+    def _fit_lsa(self):
+        from sklearn.decomposition import TruncatedSVD
+
+        for field in self.text_fields:
+            matrix = self.text_matrices[field]
+            dims = max(1, min(self.lsa_params["dims"], matrix.shape[0], matrix.shape[1] - 1))
+            svd = TruncatedSVD(n_components=dims, random_state=0)
+            vectors = normalize(svd.fit_transform(matrix))
+            # Term-major, so projecting a query only reads the rows of its terms
+            self.lsa_projections[field] = np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+            self._set_lsa_vectors(field, vectors)
+
+    def _set_lsa_vectors(self, field, vectors):
+        self.lsa_vectors[field], scales = self._encode_lsa(vectors)
+        if scales is not None:
+            self.lsa_scales[field] = scales
+
+    def _encode_lsa(self, vectors):
+        """The stored form of unit-length LSA vectors: (float32 vectors, None) or (int8 vectors, scales)."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not self.lsa_params["quantize"]:
+            return np.ascontiguousarray(vectors), None
+        # Symmetric int8 per document: a quarter of the memory, scores off by well under 1%
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        return np.ascontiguousarray(np.round(vectors / scales[:, None]).astype(np.int8)), scales.astype(np.float32)
+
+    def _build_keyword_index(self):
+        # value -> ascending row ids per keyword field, so filters become set operations on
+        # small sorted arrays instead of comparisons against every document.
+        self.keyword_index = {}
+        for field in self.keyword_fields:
+            codes, uniques = pd.factorize(self.keyword_df[field])
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            self.keyword_index[field] = {
+                value: order[bounds[i]:bounds[i + 1]] for i, value in enumerate(uniques.tolist())
+            }
+
+    def search(self, query, filter_dict={}, boost_dict={}, num_results=10, retrieval=None):
         """
         Searches the index with the given query, filters, and boost parameters.
 
         Args:
             query (str): The search query string.
-            filter_dict (dict): Dictionary of keyword fields to filter by. Keys are field names and values are the values to filter by.
+            filter_dict (dict): Dictionary of keyword fields to filter by. Keys are field names and values are the
+                values to filter by: a single value, a list/tuple/set of accepted values, or Not(value or list) to
+                exclude values.
             boost_dict (dict): Dictionary of boost scores for text fields. Keys are field names and values are the boost scores.
             num_results (int): The number of top results to return. Defaults to 10.
+            retrieval (str): "lexical", "lsa" or "hybrid". Defaults to the retrieval the index was created with.
 
         Returns:
             list of dict: List of documents matching the search criteria, ranked by relevance.
         """
+        retrieval = self._retrieval(retrieval)
+        query_vecs = {field: self.vectorizers[field].transform([query]) for field in self.text_fields}
+        candidates = self._filter_rows(filter_dict)
+        if candidates is not None and len(candidates) == 0:
+            return []
+
+        if retrieval == "lexical":
+            top, _ = self._lexical_top(query_vecs, boost_dict, candidates, num_results)
+        elif retrieval == "lsa":
+            top, _ = self._lsa_top(query_vecs, boost_dict, candidates, num_results)
+        else:
+            depth = max(num_results, self.lsa_params["rrf_depth"])
+            top = _rrf(
+                [self._lexical_top(query_vecs, boost_dict, candidates, depth)[0],
+                 self._lsa_top(query_vecs, boost_dict, candidates, depth)[0]],
+                self.lsa_params["rrf_k"],
+                num_results,
+            )
+
+        return [self.docs[i] for i in top]
+
+    def ranked_rows(self, query, filter_dict={}, boost_dict={}, num_results=10, rankings=("lexical",)):
+        """
+        The rankings search() is built from, with their scores: per ranking ("lexical" or "lsa"), the
+        row ids of the num_results best matches, best first, and their scores. Scores of subsets of
+        one index (see subset()) compare, so their rankings merge into the ranking of the whole.
+
+        Returns:
+            dict: (rows, scores) arrays per ranking.
+        """
+        self._check_rankings(rankings)
         query_vecs = {field: self.vectorizers[field].transform([query]) for field in self.text_fields}
-        scores = np.zeros(len(self.docs))
+        candidates = self._filter_rows(filter_dict)
+        if candidates is not None and len(candidates) == 0:
+            return {ranking: (np.empty(0, dtype=np.int64), np.empty(0)) for ranking in rankings}
+
+        top = {"lexical": self._lexical_top, "lsa": self._lsa_top}
+        return {ranking: top[ranking](query_vecs, boost_dict, candidates, num_results) for ranking in rankings}
+
+    def _check_rankings(self, rankings):
+        for ranking in rankings:
+            if ranking not in ("lexical", "lsa"):
+                raise ValueError(f"Unknown ranking {ranking!r}, expected 'lexical' or 'lsa'")
+            self._retrieval(ranking)
+
+    def _retrieval(self, retrieval):
+        retrieval = retrieval or self.retrieval
+        if retrieval not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {retrieval!r}, expected one of {RETRIEVAL_MODES}")
+        if retrieval != "lexical" and not self.lsa_vectors:
+            raise ValueError(f"Retrieval mode {retrieval!r} needs LSA vectors; create the index with retrieval={retrieval!r}")
+        return retrieval
+
+    def _lexical_top(self, query_vecs, boost_dict, candidates, num_results):
+        """Row ids and scores of the num_results best lexical matches, best first."""
+        if self.engine == "inverted":
+            rows, scores = self._score_postings(query_vecs, boost_dict)
+            if candidates is not None:
+                keep = _contains(candidates, rows)
+                rows, scores = rows[keep], scores[keep]
+        else:
+            rows, scores = candidates, self._score_dense(query_vecs, boost_dict, candidates)
+        self._mask_deleted(scores, rows)
+
+        top = _top_k(scores, num_results)
+        return (top if rows is None else rows[top]), scores[top]
+
+    def _lsa_top(self, query_vecs, boost_dict, candidates, num_results):
+        """Row ids and scores of the num_results documents whose LSA vectors are closest to the query's, best first."""
+        scores = np.zeros(len(self.docs) if candidates is None else len(candidates), dtype=np.float32)
+        for field, query_vec in query_vecs.items():
+            scores += self._lsa_similarity(field, query_vec, candidates)[0] * boost_dict.get(field, 1)
+        self._mask_deleted(scores, candidates)
+
+        top = _top_k(scores, num_results)
+        return (top if candidates is None else candidates[top]), scores[top]
+
+    def _mask_deleted(self, scores, rows=None):
+        """Zeroes the scores (along the last axis, for the given rows if any) of deleted documents."""
+        if self.deleted is not None:
+            scores[..., self.deleted if rows is None else self.deleted[rows]] = 0
+
+    def _lsa_similarity(self, field, query_matrix, rows=None):
+        """Dense (queries x docs) cosine similarities of the LSA vectors of one field."""
+        query_matrix = query_matrix.tocsr()
+        projection = self.lsa_projections[field]
+        queries = np.zeros((query_matrix.shape[0], projection.shape[1]), dtype=np.float32)
+        for n in range(query_matrix.shape[0]):
+            start, end = query_matrix.indptr[n], query_matrix.indptr[n + 1]
+            terms, weights = query_matrix.indices[start:end], query_matrix.data[start:end].astype(np.float32)
+            if self.scorer == "bm25":
+                weights = weights * self.bm25_idf[field][terms]
+            queries[n] = weights @ projection[terms]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries /= np.where(norms > 0, norms, 1)
+
+        vectors = self.lsa_vectors[field]
+        scales = self.lsa_scales.get(field)
+        if rows is not None:
+            vectors = vectors[rows]
+            scales = scales[rows] if scales is not None else None
+        scores = queries @ vectors.T
+        if scales is not None:
+            scores *= scales
+        return scores
+
+    def search_batch(self, queries, filter_dict={}, boost_dict={}, num_results=10, chunk_size=1024, retrieval=None):
+        """
+        Searches the index with many queries at once, returning the same results as calling search for each.
+
+        All queries of a chunk are vectorized with a single transform per field and scored with one sparse
+        matrix-matrix product per field; the top results of every row are then picked with a vectorized
+        argpartition.
+
+        Args:
+            queries (list of str): The search query strings.
+            filter_dict (dict): Dictionary of keyword fields to filter by, applied to every query.
+            boost_dict (dict): Dictionary of boost scores for text fields, applied to every query.
+            num_results (int): The number of top results to return per query. Defaults to 10.
+            chunk_size (int): Number of queries scored together, bounding the dense score block to
+                chunk_size x len(docs). Defaults to 1024.
+            retrieval (str): "lexical", "lsa" or "hybrid"; only lexical retrieval is batched, the
+                others search query by query. Defaults to the retrieval the index was created with.
+
+        Returns:
+            list of list of dict: For each query, the documents matching the search criteria, ranked by relevance.
+        """
+        retrieval = self._retrieval(retrieval)
+        if retrieval != "lexical":
+            return [self.search(query, filter_dict, boost_dict, num_results, retrieval) for query in queries]
 
-        # Compute cosine similarity for each text field and apply boost
+        candidates = self._filter_rows(filter_dict)
+        if candidates is not None and len(candidates) == 0:
+            return [[] for _ in queries]
+
+        results = []
+        for start in range(0, len(queries), chunk_size):
+            chunk = list(queries[start:start + chunk_size])
+            query_matrices = {field: self.vectorizers[field].transform(chunk) for field in self.text_fields}
+            top_rows, valid = _top_k_rows(self._lexical_scores(query_matrices, boost_dict, candidates), num_results)
+            if candidates is not None:
+                top_rows = candidates[top_rows]
+            for top, keep in zip(top_rows, valid):
+                results.append([self.docs[i] for i in top[keep]])
+
+        return results
+
+    def ranked_rows_batch(self, queries, filter_dict={}, boost_dict={}, num_results=10, rankings=("lexical",),
+                          chunk_size=1024):
+        """
+        ranked_rows for each of queries, scored a chunk of queries at a time like search_batch: one
+        sparse matrix-matrix product (lexical) or dense matrix product (LSA) per field and ranking.
+
+        Returns:
+            list of dict: For each query, (rows, scores) arrays per ranking.
+        """
+        self._check_rankings(rankings)
+        candidates = self._filter_rows(filter_dict)
+        if candidates is not None and len(candidates) == 0:
+            empty = (np.empty(0, dtype=np.int64), np.empty(0))
+            return [{ranking: empty for ranking in rankings} for _ in queries]
+
+        results = []
+        for start in range(0, len(queries), chunk_size):
+            chunk = list(queries[start:start + chunk_size])
+            query_matrices = {field: self.vectorizers[field].transform(chunk) for field in self.text_fields}
+            ranked = {}
+            for ranking in rankings:
+                if ranking == "lexical":
+                    scores = self._lexical_scores(query_matrices, boost_dict, candidates)
+                else:
+                    scores = self._lsa_scores(query_matrices, boost_dict, candidates)
+                top_rows, valid = _top_k_rows(scores, num_results)
+                top_scores = np.take_along_axis(scores, top_rows, axis=1)
+                if candidates is not None:
+                    top_rows = candidates[top_rows]
+                ranked[ranking] = [(top[keep], top_score[keep]) for top, top_score, keep in zip(top_rows, top_scores, valid)]
+            results.extend({ranking: ranked[ranking][n] for ranking in rankings} for n in range(len(chunk)))
+
+        return results
+
+    def _lexical_scores(self, query_matrices, boost_dict, candidates):
+        """Dense (queries x candidates) lexical score block, with deleted documents scored 0."""
+        num_rows = len(self.docs) if candidates is None else len(candidates)
+        scores = np.zeros((next(iter(query_matrices.values())).shape[0], num_rows))
+        for field, query_matrix in query_matrices.items():
+            if self.engine == "inverted":
+                weights = self._query_weights(query_matrix)
+                blocks = [weights @ postings.T for _, postings in self._postings_segments(field)]
+                sim = blocks[0] if len(blocks) == 1 else hstack(blocks, format="csr")
+                if candidates is not None:
+                    sim = sim[:, candidates]
+                sim = sim.toarray()
+            else:
+                sim = self._similarity(field, query_matrix, candidates)
+            scores += sim * boost_dict.get(field, 1)
+        self._mask_deleted(scores, candidates)
+        return scores
+
+    def _lsa_scores(self, query_matrices, boost_dict, candidates):
+        """Dense (queries x candidates) LSA score block, with deleted documents scored 0."""
+        num_rows = len(self.docs) if candidates is None else len(candidates)
+        scores = np.zeros((next(iter(query_matrices.values())).shape[0], num_rows), dtype=np.float32)
+        for field, query_matrix in query_matrices.items():
+            scores += self._lsa_similarity(field, query_matrix, candidates) * boost_dict.get(field, 1)
+        self._mask_deleted(scores, candidates)
+        return scores
+
+    def vectorize(self, texts, field):
+        """
+        Vectorizes texts in the vocabulary of a text field, e.g. to compare queries with each other.
+
+        Args:
+            texts (list of str): The texts to vectorize.
+            field (str): The text field whose fitted vocabulary and weights to use.
+
+        Returns:
+            scipy.sparse.csr_matrix: One L2-normalised row per text with TF-IDF weights, or idf-weighted
+            term counts for the BM25 scorer.
+        """
+        matrix = self.vectorizers[field].transform(texts)
+        if self.scorer == "bm25":
+            matrix = csr_matrix(matrix.multiply(self.bm25_idf[field]))
+        return normalize(matrix, norm="l2")
+
+    def _filter_rows(self, filter_dict):
+        """Ascending ids of the docs that pass every keyword filter, or None when nothing is filtered."""
+        rows = None
+        for field, value in filter_dict.items():
+            if field not in self.keyword_fields:
+                continue
+
+            negate = isinstance(value, Not)
+            if negate:
+                value = value.value
+            values = value if isinstance(value, (list, tuple, set, frozenset)) else [value]
+
+            postings = self.keyword_index[field]
+            matched = [postings[v] for v in values if v in postings]
+            if not matched:
+                field_rows = np.empty(0, dtype=np.int64)
+            elif len(matched) == 1:
+                field_rows = matched[0]
+            else:
+                field_rows = np.unique(np.concatenate(matched))
+
+            if negate:
+                field_rows = np.setdiff1d(np.arange(len(self.docs)), field_rows, assume_unique=True)
+
+            rows = field_rows if rows is None else np.intersect1d(rows, field_rows, assume_unique=True)
+        return rows
+
+    def _score_dense(self, query_vecs, boost_dict, rows=None):
+        scores = np.zeros(len(self.docs) if rows is None else len(rows))
+
+        # Compute cosine similarity (or BM25) for each text field and apply boost
         for field, query_vec in query_vecs.items():
-            sim = cosine_similarity(query_vec, self.text_matrices[field]).flatten()
+            sim = self._similarity(field, query_vec, rows).flatten()
             boost = boost_dict.get(field, 1)
             scores += sim * boost
 
-        # Apply keyword filters
-        for field, value in filter_dict.items():
-            if field in self.keyword_fields:
-                mask = self.keyword_df[field] == value
-                scores = scores * mask.to_numpy()
+        return scores
+
+    def _similarity(self, field, query_matrix, rows=None):
+        """Dense (queries x docs) score block of one field, restricted to the given rows if any."""
+        matrix = self.text_matrices[field]
+        if rows is not None:
+            matrix = matrix[rows]
+        if self.scorer == "bm25":
+            return (self._query_weights(query_matrix) @ matrix.T).toarray()
+        return cosine_similarity(query_matrix, matrix)
+
+    def _score_postings(self, query_vecs, boost_dict):
+        """
+        Term-at-a-time scoring over the posting lists of the query terms only.
+
+        Returns:
+            tuple: (rows, scores) where rows are the ids of every document that shares at least one
+            term with the query, in ascending order, and scores are their boosted similarities.
+        """
+        doc_ids = []
+        contributions = []
+
+        for field, query_vec in query_vecs.items():
+            boost = boost_dict.get(field, 1)
+            query_vec = self._query_weights(query_vec)
+
+            for offset, postings in self._postings_segments(field):
+                for term, weight in zip(query_vec.indices, query_vec.data):
+                    start, end = postings.indptr[term], postings.indptr[term + 1]
+                    ids = postings.indices[start:end]
+                    doc_ids.append(ids + offset if offset else ids)
+                    contributions.append(postings.data[start:end] * (weight * boost))
+
+        if not doc_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        rows, inverse = np.unique(np.concatenate(doc_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions), minlength=len(rows))
+
+        return rows, scores
+
+    def memory_usage(self):
+        """
+        Approximate bytes held by the fitted index, per component.
+
+        Memory-mapped arrays (see Index.load) are counted at their full size even though the page
+        cache backs them and forked workers share them.
+
+        Returns:
+            dict: Bytes of the "matrices" (text_matrices), "postings", "idf" (idf and doc length
+            vectors), "vocabulary" (vectorizer term dicts), "lsa" (projections and vectors),
+            "keyword_index" and "docs", and their "total".
+        """
+        def sparse_bytes(matrix):
+            return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+        usage = {
+            "matrices": sum(sparse_bytes(m) for m in self.text_matrices.values()),
+            "postings": sum(sparse_bytes(m) for m in (*self.postings.values(), *self.postings_delta.values())),
+            "idf": sum(v.nbytes for v in self.bm25_idf.values()) + sum(v.nbytes for v in self.doc_lengths.values()),
+            "vocabulary": 0,
+            "lsa": sum(a.nbytes for arrays in (self.lsa_projections, self.lsa_vectors, self.lsa_scales)
+                       for a in arrays.values()),
+            "keyword_index": sum(rows.nbytes for postings in self.keyword_index.values() for rows in postings.values()),
+            "docs": len(json.dumps(self.docs, default=_json_default)),
+        }
+        for vectorizer in self.vectorizers.values():
+            vocabulary = getattr(vectorizer, "vocabulary_", {})
+            usage["vocabulary"] += sys.getsizeof(vocabulary) + sum(sys.getsizeof(term) for term in vocabulary)
+            if self.scorer == "tfidf" and hasattr(vectorizer, "idf_"):
+                usage["idf"] += vectorizer.idf_.nbytes
+        usage["total"] = sum(usage.values())
+        return usage
+
+    def save(self, path):
+        """
+        Saves the fitted index to a snapshot directory that can be memory-mapped by Index.load.
+
+        The snapshot holds a meta.json (format version, fields, vectorizer params), the documents,
+        and per text field the vocabulary, idf vector, the CSR data/indices/indptr arrays and any LSA
+        arrays as .npy files. It is written to a temporary directory next to path first and then renamed
+        into place.
+
+        Documents added or deleted since the last merge are merged into the snapshot (this index is
+        left as it is).
+
+        Args:
+            path (str): Directory to write the snapshot to. An existing snapshot is replaced.
+        """
+        if self.deleted is not None or self.postings_delta:
+            return self.copy().merge().save(path)
+
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+
+        meta = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "text_fields": self.text_fields,
+            "keyword_fields": self.keyword_fields,
+            "vectorizer_params": self.vectorizer_params,
+            "engine": self.engine,
+            "scorer": self.scorer,
+            "bm25_params": self.bm25_params,
+            "retrieval": self.retrieval,
+            "lsa_params": self.lsa_params,
+            "bm25_avg_lengths": self.bm25_avg_lengths,
+            "changes_since_fit": self.changes_since_fit,
+            "num_docs": len(self.docs),
+            "shapes": {field: list(self.text_matrices[field].shape) for field in self.text_fields},
+        }
+
+        for field in self.text_fields:
+            vectorizer = self.vectorizers[field]
+            vocabulary = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+            with open(os.path.join(tmp_path, f"{field}.vocab.json"), "w") as f:
+                json.dump(vocabulary, f)
+
+            matrix = self.text_matrices[field].tocsr()
+            arrays = {
+                "data": matrix.data,
+                "indices": matrix.indices,
+                "indptr": matrix.indptr,
+            }
+            if self.scorer == "bm25":
+                arrays.update({"idf": self.bm25_idf[field], "doc_lengths": self.doc_lengths[field]})
+            else:
+                arrays["idf"] = vectorizer.idf_
+            if field in self.postings:
+                postings = self.postings[field]
+                arrays.update({
+                    "postings_data": postings.data,
+                    "postings_indices": postings.indices,
+                    "postings_indptr": postings.indptr,
+                })
+            if field in self.lsa_vectors:
+                arrays.update({"lsa_projection": self.lsa_projections[field], "lsa_vectors": self.lsa_vectors[field]})
+                if field in self.lsa_scales:
+                    arrays["lsa_scales"] = self.lsa_scales[field]
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_path, f"{field}.{name}.npy"), np.ascontiguousarray(array))
+
+        with open(os.path.join(tmp_path, "docs.json"), "w") as f:
+            json.dump(self.docs, f, default=_json_default)
+
+        # meta.json goes last so a half-written snapshot is never considered valid.
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        # Move the old snapshot aside rather than deleting it first, so the path is only missing between
+        # two renames; processes that memory-mapped its files keep reading them after the rmtree.
+        old_path = f"{path}.old-{os.getpid()}"
+        if os.path.isdir(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        if os.path.isdir(old_path):
+            shutil.rmtree(old_path)
+
+    @classmethod
+    def load(cls, path, mmap=True, engine=None):
+        """
+        Loads an index previously written with Index.save without refitting.
+
+        With mmap enabled the CSR arrays are opened read-only via np.load(mmap_mode='r'), so the OS
+        page cache backs them and forked workers share the same physical pages.
+
+        Args:
+            path (str): Snapshot directory written by Index.save.
+            mmap (bool): Whether to memory-map the matrix arrays. Defaults to True.
+            engine (str): Search engine to use. Defaults to the engine the snapshot was saved with.
+
+        Returns:
+            Index: A fitted index ready for search.
+
+        Raises:
+            ValueError: If the snapshot is missing or was written with a different format version.
+        """
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            raise ValueError(f"No index snapshot found at {path}")
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        version = meta.get("format_version")
+        if version != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(
+                f"Index snapshot at {path} has format version {version}, expected {SNAPSHOT_FORMAT_VERSION}"
+            )
+
+        index = cls(
+            text_fields=meta["text_fields"],
+            keyword_fields=meta["keyword_fields"],
+            vectorizer_params=meta["vectorizer_params"],
+            engine=engine or meta.get("engine", "dense"),
+            scorer=meta.get("scorer", "tfidf"),
+            bm25_params=meta.get("bm25_params", {}),
+            retrieval=meta.get("retrieval", "lexical"),
+            lsa_params=meta.get("lsa_params", {}),
+        )
+
+        with open(os.path.join(path, "docs.json")) as f:
+            index.docs = json.load(f)
+
+        mmap_mode = "r" if mmap else None
+        for field in index.text_fields:
+            with open(os.path.join(path, f"{field}.vocab.json")) as f:
+                vocabulary = json.load(f)
+
+            vectorizer = index._make_vectorizer(vocabulary={term: i for i, term in enumerate(vocabulary)})
+            idf = np.load(os.path.join(path, f"{field}.idf.npy"))
+            if index.scorer == "bm25":
+                index.bm25_idf[field] = idf
+                index.doc_lengths[field] = np.load(os.path.join(path, f"{field}.doc_lengths.npy"))
+                # Snapshots from before add() existed were always saved right after fit()
+                index.bm25_avg_lengths[field] = meta.get("bm25_avg_lengths", {}).get(
+                    field, _average_length(index.doc_lengths[field]))
+            else:
+                vectorizer.idf_ = idf
+            index.vectorizers[field] = vectorizer
+
+            data, indices, indptr = (
+                np.load(os.path.join(path, f"{field}.{name}.npy"), mmap_mode=mmap_mode)
+                for name in ("data", "indices", "indptr")
+            )
+            shape = tuple(meta["shapes"][field])
+            index.text_matrices[field] = csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+            if index.engine == "inverted" and os.path.exists(os.path.join(path, f"{field}.postings_indptr.npy")):
+                data, indices, indptr = (
+                    np.load(os.path.join(path, f"{field}.postings_{name}.npy"), mmap_mode=mmap_mode)
+                    for name in ("data", "indices", "indptr")
+                )
+                index.postings[field] = csc_matrix((data, indices, indptr), shape=shape, copy=False)
+
+            for name, arrays in (("lsa_projection", index.lsa_projections), ("lsa_vectors", index.lsa_vectors),
+                                 ("lsa_scales", index.lsa_scales)):
+                array_path = os.path.join(path, f"{field}.{name}.npy")
+                if os.path.exists(array_path):
+                    arrays[field] = np.load(array_path, mmap_mode=mmap_mode)
+
+        keyword_data = {field: [doc.get(field, '') for doc in index.docs] for field in index.keyword_fields}
+        index.keyword_df = pd.DataFrame(keyword_data)
+        index._build_keyword_index()
+        index.changes_since_fit = meta.get("changes_since_fit", 0)
+
+        if index.engine == "inverted" and len(index.postings) < len(index.text_fields):
+            index._build_postings()
+        index._postings_rows = len(index.docs)
+
+        return index
+
+
+def _top_k(scores, num_results):
+    """Positions of the num_results highest positive scores, best first."""
+    num_results = min(num_results, len(scores))
+    if num_results <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Use argpartition to get top num_results indices
+    top_indices = np.argpartition(scores, -num_results)[-num_results:]
+    top_indices = top_indices[np.argsort(-scores[top_indices])]
+
+    # Filter out zero-score results
+    return top_indices[scores[top_indices] > 0]
+
+
+def _rrf(rankings, k, num_results):
+    """Reciprocal rank fusion: every ranking adds 1 / (k + rank) to the score of each row it holds."""
+    scores = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:num_results]
+
+
+def _average_length(doc_lengths):
+    return float(doc_lengths.mean()) if len(doc_lengths) and doc_lengths.mean() > 0 else 1.0
+
+
+def _bm25_idf(num_docs_with_term, num_docs):
+    # Lucene's non-negative variant of the Robertson-Sparck Jones idf.
+    return np.log1p((num_docs - num_docs_with_term + 0.5) / (num_docs_with_term + 0.5)).astype(np.float32)
+
+
+def _contains(sorted_rows, rows):
+    """Boolean mask of the rows that are present in the ascending array sorted_rows."""
+    if len(sorted_rows) == 0:
+        return np.zeros(len(rows), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_rows, rows), len(sorted_rows) - 1)
+    return sorted_rows[positions] == rows
+
+
+def _top_k_rows(scores, num_results):
+    """
+    Row-wise version of _top_k for a 2D score block.
+
+    Returns:
+        tuple: (top, valid) arrays of shape (rows, k) with the column indices of the best scores of each
+        row, best first, and a boolean mask of the entries whose score is positive.
+    """
+    num_results = min(num_results, scores.shape[1])
+    if num_results <= 0:
+        empty = np.empty((scores.shape[0], 0), dtype=np.int64)
+        return empty, empty.astype(bool)
+
+    top = np.argpartition(scores, -num_results, axis=1)[:, -num_results:]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
 
-        # Use argpartition to get top num_results indices
-        top_indices = np.argpartition(scores, -num_results)[-num_results:]
-        top_indices = top_indices[np.argsort(-scores[top_indices])]
+    return top, top_scores > 0
 
-        # Filter out zero-score results
-        top_docs = [self.docs[i] for i in top_indices if scores[i] > 0]
 
-        return top_docs
\ No newline at end of file
+def _json_default(value):
+    # Documents built from pandas may carry numpy scalars.
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
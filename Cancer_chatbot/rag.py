@@ -1,12 +1,15 @@
 import ingest
+from cache import AnswerCache, RetrievalCache, normalize_question
+from groq_pool import GroqClientPool, GROQ_RATE_LIMIT_COOLDOWN, error_status
+from live_index import IndexReloader, LiveIndex
+from rate_limit import RateLimiter, RateLimitExceeded, RATE_LIMIT_COMPLETION_ESTIMATE
+from singleflight import SingleFlight
 
 import os
 import re
 import json
 from time import time
 
-from groq import Groq
-
 
 def _normalize_api_key(value):
     if value is None:
@@ -41,12 +44,39 @@ def _groq_api_keys():
     return keys
 
 
+# Persistent clients and health of the configured Groq keys, shared by every request in this process
+groq_pool = GroqClientPool()
+# Requests/tokens per minute budget of every key and model, shared the same way; its concurrency
+# and waiter caps follow from the quotas of the configured keys
+rate_limiter = RateLimiter(num_keys=max(len(_groq_api_keys()), 1))
+
+
+def _reserve_groq_call(remaining, model, messages):
+    """Reserves rate limiter capacity on the healthiest remaining key that has it (waiting if needed)."""
+    estimate = sum(count_tokens(m["content"]) for m in messages) + RATE_LIMIT_COMPLETION_ESTIMATE
+    reservation = rate_limiter.acquire(groq_pool.usable(remaining), model, estimate)
+    remaining.remove(reservation.key)
+    return reservation
+
+
+def _groq_final_error(exc, keys):
+    """
+    The error to raise once every key failed: a 429 from Groq on the last key becomes
+    RateLimitExceeded, retryable when the first key has rested, like a call our own limiter sheds.
+    """
+    if error_status(exc) != 429:
+        return exc
+    wait = groq_pool.available_in(keys)
+    error = RateLimitExceeded(
+        f"Groq rate limit on every key: {exc}",
+        retry_after=wait if wait > 0 else GROQ_RATE_LIMIT_COOLDOWN,
+    )
+    error.__cause__ = exc
+    return error
+
+
 def _groq_error_suggests_try_next_key(exc):
-    code = getattr(exc, "status_code", None)
-    if code is None:
-        code = getattr(getattr(exc, "response", None), "status_code", None)
-    if code is None:
-        code = getattr(exc, "code", None)
+    code = error_status(exc)
     if code is not None:
         if code == 400:
             return False
@@ -121,19 +151,52 @@ def load_meditron():
     
     return meditron_pipeline, meditron_tokenizer
 
-index = ingest.load_index()
+# Searches go to index.current; documents can be added, updated and deleted without a restart, and
+# index_reloader swaps in a new knowledge base when the CSV or the snapshot changes. The index is
+# refitted in a subprocess, so requests keep being served at full speed meanwhile.
+index = LiveIndex(ingest.load_index())
+index_reloader = IndexReloader(
+    index,
+    load=lambda: ingest.load_index(build=ingest.build_index_in_subprocess),
+    paths=ingest.index_sources(),
+)
+
+answer_cache = AnswerCache(index=index.current, version=index.version)
+retrieval_cache = RetrievalCache(version=index.version)
+
+
+def rebind_caches(new_index, version):
+    # The near-duplicate lookup must not keep the old index alive, and cached answers and results
+    # of replaced content must not be served
+    answer_cache.rebind(new_index, version)
+    retrieval_cache.version = version
+
+
+index.on_swap.append(rebind_caches)
+
+# Identical questions asked at the same time (e.g. after a push notification) share one
+# search + LLM + relevance chain instead of each running their own; 0 disables it.
+COALESCE_QUESTIONS = os.getenv("COALESCE_QUESTIONS", "1") == "1"
+question_flight = SingleFlight()
 
 
 def search(query):
+    index_reloader.ensure_started()
+    cached = retrieval_cache.get(query)
+    if cached is not None:
+        return cached
+
     boost = {}
 
-    results = index.search(
-        query=query,
+    results = ingest.search_documents(
+        index,
+        query,
+        num_results=10,  # documents; build_prompt packs their passages into CONTEXT_TOKEN_BUDGET
         filter_dict={},
         boost_dict=boost,
-        num_results=3  # Reduced to stay within token limits
     )
 
+    retrieval_cache.set(query, results)
     return results
 
 # System instructions for the /question RAG endpoint (adaptive length, safety, tone).
@@ -275,12 +338,120 @@ answer: {answer}
 topic: {topic}
 """.strip()
 
-def build_prompt(query, search_results, conversation_history=None):
-    query = augment_question_for_policy(query)
-    context = ""
-    
+# Token budget for the retrieved CONTEXT. Tokens are estimated at ~4 characters each unless
+# CONTEXT_TOKENIZER=tiktoken selects a local tokenizer (pip install tiktoken).
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "chars")
+# A truncated entry is only added if at least this many tokens are left for it.
+MIN_TRUNCATED_ENTRY_TOKENS = 60
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Number of knowledge base entries returned as "sources" with an answer, and their snippet length.
+SOURCES_LIMIT = int(os.getenv("SOURCES_LIMIT", "3"))
+SOURCE_SNIPPET_CHARS = 200
+
+# For tiktoken (lazy loading)
+context_tokenizer = None
+
+
+def count_tokens(text):
+    global context_tokenizer
+
+    if CONTEXT_TOKENIZER == "tiktoken":
+        if context_tokenizer is None:
+            import tiktoken
+            context_tokenizer = tiktoken.get_encoding("cl100k_base")
+        return len(context_tokenizer.encode(text))
+    return (len(text) + 3) // 4
+
+
+def merge_passages(search_results):
+    """
+    Group passages of the same source document into one CONTEXT entry, in rank order.
+
+    Sentences repeated by overlapping passages are dropped, as are entries whose answer text
+    duplicates a better-ranked one.
+    """
+    merged = {}
+    seen_sentences = {}
     for doc in search_results:
-        context = context + entry_template.format(**doc) + "\n\n"
+        key = doc.get("id")
+        sentences = [s for s in _SENTENCE_SPLIT_RE.split(doc.get("answer") or "") if s]
+        if key in merged:
+            new_sentences = [s for s in sentences if s not in seen_sentences[key]]
+            if new_sentences:
+                merged[key]["answer"] += "\n...\n" + " ".join(new_sentences)
+                seen_sentences[key].update(new_sentences)
+        else:
+            merged[key] = dict(doc)
+            seen_sentences[key] = set(sentences)
+
+    entries = []
+    seen_answers = set()
+    for doc in merged.values():
+        fingerprint = " ".join((doc.get("answer") or "").lower().split())
+        if fingerprint in seen_answers:
+            continue
+        seen_answers.add(fingerprint)
+        entries.append(doc)
+    return entries
+
+
+def _truncate_entry(doc, max_tokens):
+    """Longest sentence prefix of the answer whose entry fits in max_tokens, or None."""
+    sentences = _SENTENCE_SPLIT_RE.split(doc.get("answer") or "")
+    entry = None
+    for n in range(1, len(sentences) + 1):
+        candidate = entry_template.format(**{**doc, "answer": " ".join(sentences[:n]) + " ..."}) + "\n\n"
+        if count_tokens(candidate) > max_tokens:
+            break
+        entry = candidate
+    return entry
+
+
+def pack_context(search_results, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Greedily fill the CONTEXT with the ranked search results until token_budget is used up.
+
+    Entries that do not fit are truncated to whole sentences when enough budget is left,
+    otherwise skipped in favour of smaller, lower-ranked ones.
+
+    Returns:
+        tuple: (context, stats) where stats has the estimated context_tokens used, and the
+        number of context_entries included out of context_candidates.
+    """
+    entries = merge_passages(search_results)
+    context = ""
+    used = 0
+    included = 0
+
+    for doc in entries:
+        entry = entry_template.format(**doc) + "\n\n"
+        tokens = count_tokens(entry)
+        remaining = token_budget - used
+        if tokens > remaining:
+            if remaining < MIN_TRUNCATED_ENTRY_TOKENS:
+                continue
+            entry = _truncate_entry(doc, remaining)
+            if entry is None:
+                continue
+            tokens = count_tokens(entry)
+        context = context + entry
+        used += tokens
+        included += 1
+
+    stats = {
+        "context_tokens": used,
+        "context_entries": included,
+        "context_candidates": len(entries),
+    }
+    return context, stats
+
+
+def build_prompt(query, search_results, conversation_history=None, token_budget=CONTEXT_TOKEN_BUDGET, return_stats=False):
+    query = augment_question_for_policy(query)
+    context, context_stats = pack_context(search_results, token_budget)
     
     # Add conversation history context if provided
     history_context = ""
@@ -306,11 +477,13 @@ def build_prompt(query, search_results, conversation_history=None):
     if history_context:
         prompt = history_context + prompt
     
+    if return_stats:
+        return prompt, context_stats
     return prompt
 
 
 def llm_groq(prompt, model='llama-3.3-70b-versatile', system=None):
-    """Use Groq API for text generation; tries GROQ_API_KEY then GROQ_API_KEY_FALLBACK."""
+    """Use Groq API for text generation; tries GROQ_API_KEY and GROQ_API_KEY_FALLBACK, healthiest first."""
     keys = _groq_api_keys()
     if not keys:
         raise RuntimeError(
@@ -324,8 +497,12 @@ def llm_groq(prompt, model='llama-3.3-70b-versatile', system=None):
     messages.append({"role": "user", "content": prompt})
 
     last_error = None
-    for idx, api_key in enumerate(keys, start=1):
-        client = Groq(api_key=api_key)
+    remaining = list(keys)
+    for idx in range(1, len(keys) + 1):
+        reservation = _reserve_groq_call(remaining, model, messages)
+        api_key = reservation.key
+        client = groq_pool.client(api_key)
+        started = time()
         try:
             completion = client.chat.completions.create(
                 model=model,
@@ -336,6 +513,8 @@ def llm_groq(prompt, model='llama-3.3-70b-versatile', system=None):
                 stream=False,
             )
         except Exception as e:
+            reservation.release(used_tokens=0)
+            groq_pool.record_failure(api_key, e)
             last_error = e
             has_next_key = idx < len(keys)
             reason_matched = _groq_error_suggests_try_next_key(e)
@@ -346,17 +525,103 @@ def llm_groq(prompt, model='llama-3.3-70b-versatile', system=None):
             )
             if should_try_next:
                 continue
-            raise
+            raise _groq_final_error(e, keys)
 
+        groq_pool.record_success(api_key, time() - started)
         answer = completion.choices[0].message.content
         token_stats = {
             "prompt_tokens": completion.usage.prompt_tokens,
             "completion_tokens": completion.usage.completion_tokens,
             "total_tokens": completion.usage.total_tokens,
         }
+        reservation.release(used_tokens=token_stats["total_tokens"])
         return answer, token_stats
 
-    raise last_error
+    raise _groq_final_error(last_error, keys)
+
+
+def _stream_usage(chunk):
+    # Groq reports usage on the last chunk under x_groq; OpenAI-compatible servers use chunk.usage.
+    usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+    return usage or getattr(chunk, "usage", None)
+
+
+def llm_groq_stream(prompt, model='llama-3.3-70b-versatile', system=None):
+    """
+    Streaming variant of llm_groq. Yields ("token", text) for every answer delta and a final
+    ("usage", token_stats). A failing key falls back to the next one only until the first token has
+    been yielded; after that the error is raised to the caller.
+    """
+    keys = _groq_api_keys()
+    if not keys:
+        raise RuntimeError(
+            "No Groq API key configured. Set GROQ_API_KEY and optionally GROQ_API_KEY_FALLBACK."
+        )
+
+    messages = []
+    if system:
+        messages.append({"role": "system", "content": system})
+    messages.append({"role": "user", "content": prompt})
+
+    remaining = list(keys)
+    for idx in range(1, len(keys) + 1):
+        reservation = _reserve_groq_call(remaining, model, messages)
+        api_key = reservation.key
+        client = groq_pool.client(api_key)
+        started = time()
+        answer = ""
+        usage = None
+        try:
+            stream = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=1024,
+                top_p=1,
+                stream=True,
+            )
+            for chunk in stream:
+                usage = _stream_usage(chunk) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    answer += delta
+                    yield "token", delta
+        except GeneratorExit:
+            # The consumer stopped reading (e.g. the client disconnected)
+            reservation.release(used_tokens=count_tokens(answer))
+            raise
+        except Exception as e:
+            reservation.release(used_tokens=count_tokens(answer) if answer else 0)
+            groq_pool.record_failure(api_key, e)
+            should_try_next = not answer and idx < len(keys)
+            print(
+                f"[groq] stream key attempt {idx}/{len(keys)} failed ({type(e).__name__}), "
+                f"tokens_sent={bool(answer)}, retry_next={should_try_next}"
+            )
+            if should_try_next:
+                continue
+            raise _groq_final_error(e, keys)
+
+        groq_pool.record_success(api_key, time() - started)
+        if usage is not None:
+            token_stats = {
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens,
+            }
+        else:
+            prompt_tokens = count_tokens((system or "") + prompt)
+            completion_tokens = count_tokens(answer)
+            token_stats = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }
+        reservation.release(used_tokens=token_stats["total_tokens"])
+        yield "usage", token_stats
+        return
 
 
 def llm_meditron(prompt):
@@ -395,6 +660,18 @@ def llm(prompt, model='gpt-oss', system=None):
         return llm_groq(prompt, groq_model, system=system)
 
 
+def llm_stream(prompt, model='gpt-oss', system=None):
+    """Streaming counterpart of llm(); see llm_groq_stream for the events it yields."""
+    if model == 'meditron':
+        # The local pipeline does not stream; send the whole answer as one token
+        answer, token_stats = llm(prompt, model=model, system=system)
+        yield "token", answer
+        yield "usage", token_stats
+    else:
+        groq_model = AVAILABLE_MODELS.get(model, 'openai/gpt-oss-20b')
+        yield from llm_groq_stream(prompt, groq_model, system=system)
+
+
 def calculate_openai_cost(model, tokens):
     # Groq and local models have different pricing or are free
     return 0.0
@@ -430,7 +707,55 @@ def evaluate_relevance(question, answer, model='gpt-oss'):
         result = {"Relevance": "UNKNOWN", "Explanation": "Failed to parse evaluation"}
         return result, tokens
 
-def rag(query, model='gpt-oss', conversation_history=None):
+evaluation_batch_prompt_template = """
+You are an expert evaluator for a RAG system.
+Your task is to analyze the relevance of each generated answer below to its question.
+Classify every answer as "NON_RELEVANT", "PARTLY_RELEVANT", or "RELEVANT".
+
+Here is the data for evaluation:
+
+{items}
+
+Provide your evaluation as a parsable JSON array without using code blocks, with exactly one
+object per numbered item, in the same order:
+
+[
+  {{
+    "Relevance": "NON_RELEVANT" | "PARTLY_RELEVANT" | "RELEVANT",
+    "Explanation": "[Provide a brief explanation for your evaluation]"
+  }}
+]
+""".strip()
+
+def evaluate_relevance_batch(items, model='gpt-oss'):
+    """
+    Judges several (question, answer) pairs with one LLM call.
+
+    Returns:
+        tuple: (evaluations, tokens) with one {"Relevance", "Explanation"} dict per item.
+    """
+    if len(items) == 1:
+        evaluation, tokens = evaluate_relevance(items[0][0], items[0][1], model=model)
+        if not isinstance(evaluation, dict):
+            evaluation = {"Relevance": "UNKNOWN", "Explanation": "Failed to parse evaluation"}
+        return [evaluation], tokens
+
+    numbered = "\n\n".join(
+        f"Item {n}:\nQuestion: {question}\nGenerated Answer: {answer}"
+        for n, (question, answer) in enumerate(items, start=1)
+    )
+    prompt = evaluation_batch_prompt_template.format(items=numbered)
+    evaluation, tokens = llm(prompt, model=model)
+
+    try:
+        evaluations = json.loads(evaluation)
+    except json.JSONDecodeError:
+        evaluations = None
+    if not isinstance(evaluations, list) or len(evaluations) != len(items):
+        evaluations = [{"Relevance": "UNKNOWN", "Explanation": "Failed to parse evaluation"}] * len(items)
+    return evaluations, tokens
+
+def rag(query, model='gpt-oss', conversation_history=None, evaluate=True):
     """
     Main RAG function with conversation memory.
     
@@ -438,49 +763,218 @@ def rag(query, model='gpt-oss', conversation_history=None):
         query: The question to answer
         model: 'gpt-oss' (default, uses Groq) or 'meditron' (uses HuggingFace)
         conversation_history: List of previous messages for context
+        evaluate: Judge the answer's relevance before returning; when False the relevance is
+            left as "PENDING" for the background evaluation queue
+
+    Concurrent calls with the same model, normalized question and evaluate flag, and no dependence
+    on the conversation history, wait on one computation and share its answer (see question_flight).
     """
     t0 = time()
 
+    # Answers that depend on earlier turns are neither served from nor stored in the cache
+    cacheable = not (conversation_history and should_use_conversation_history(query))
+    if cacheable:
+        cached = answer_cache.get(query, model)
+        if cached is not None:
+            print("[rag] answer cache hit")
+            return cached_answer_data(cached, time() - t0)
+
+    if not (cacheable and COALESCE_QUESTIONS):
+        return answer_question(query, model, conversation_history, evaluate, cacheable, t0)
+
+    key = (model, normalize_question(query), evaluate)
+    answer_data, shared = question_flight.do(
+        key, lambda: answer_question(query, model, conversation_history, evaluate, cacheable, t0)
+    )
+    if shared:
+        print("[rag] shared the answer of an identical question in flight")
+        return coalesced_answer_data(answer_data, time() - t0)
+    return answer_data
+
+
+def answer_question(query, model, conversation_history, evaluate, cacheable, t0):
+    """The uncached part of rag(): retrieval, the LLM call and (if evaluate) the relevance judge."""
     # Search local database
     search_results = search(query)
     
     # Build prompt with context and conversation history
-    prompt = build_prompt(query, search_results, conversation_history)
+    prompt, context_stats = build_prompt(query, search_results, conversation_history, return_stats=True)
+    print(
+        f"[rag] context {context_stats['context_tokens']}/{CONTEXT_TOKEN_BUDGET} tokens, "
+        f"{context_stats['context_entries']}/{context_stats['context_candidates']} entries"
+    )
     answer, token_stats = llm(prompt, model=model, system=ASSISTANT_SYSTEM_PROMPT)
 
+    answer_data = new_answer_data(answer, model, token_stats, context_stats, search_results)
+    if evaluate:
+        complete_answer(query, answer_data, model=model)
+    answer_data["response_time"] = time() - t0
+
+    if cacheable:
+        answer_cache.set(query, model, answer_data)
+
+    return answer_data
+
+
+def rag_stream(query, model='gpt-oss', conversation_history=None):
+    """
+    Streaming variant of rag(). Yields (event, data) tuples:
+
+        ("sources", [...])       once retrieval is done, before the LLM is called
+        ("token", text)          for every answer delta from the LLM
+        ("answer", answer_data)  when the answer is complete
+
+    response_time is measured up to the last token and first_token_time up to the first one.
+    The answer_data has no relevance evaluation yet; call finish_streamed_answer() with it once
+    the response has been sent.
+    """
+    t0 = time()
+
+    cacheable = not (conversation_history and should_use_conversation_history(query))
+    if cacheable:
+        cached = answer_cache.get(query, model)
+        if cached is not None:
+            print("[rag] answer cache hit")
+            answer_data = cached_answer_data(cached, time() - t0)
+            answer_data["first_token_time"] = answer_data["response_time"]
+            yield "sources", answer_data.get("sources", [])
+            yield "token", answer_data["answer"]
+            yield "answer", answer_data
+            return
+
+    search_results = search(query)
+    yield "sources", sources_from_results(search_results)
+
+    prompt, context_stats = build_prompt(query, search_results, conversation_history, return_stats=True)
+    print(
+        f"[rag] context {context_stats['context_tokens']}/{CONTEXT_TOKEN_BUDGET} tokens, "
+        f"{context_stats['context_entries']}/{context_stats['context_candidates']} entries"
+    )
+
+    answer = ""
+    first_token_time = None
+    token_stats = None
+    for event, data in llm_stream(prompt, model=model, system=ASSISTANT_SYSTEM_PROMPT):
+        if event == "usage":
+            token_stats = data
+            continue
+        if first_token_time is None:
+            first_token_time = time() - t0
+        answer += data
+        yield "token", data
+
+    answer_data = new_answer_data(answer, model, token_stats, context_stats, search_results)
+    answer_data["response_time"] = time() - t0
+    answer_data["first_token_time"] = first_token_time
+    answer_data["cacheable"] = cacheable
+    if first_token_time is not None:
+        print(f"[rag] streamed answer, first token {first_token_time:.2f}s, total {answer_data['response_time']:.2f}s")
+    yield "answer", answer_data
+
+
+def finish_streamed_answer(query, answer_data, model='gpt-oss', evaluate=True):
+    """Runs the relevance evaluation (unless evaluate is False) for an answer from rag_stream() and caches it."""
+    if answer_data.get("cache_hit"):
+        return answer_data
+
+    cacheable = answer_data.pop("cacheable", False)
+    if evaluate:
+        complete_answer(query, answer_data, model=model)
+    if cacheable:
+        answer_cache.set(query, model, answer_data)
+    return answer_data
+
+
+def new_answer_data(answer, model, token_stats, context_stats, search_results):
+    """answer_data for a freshly generated answer, before relevance evaluation."""
+    return {
+        "answer": answer,
+        "model_used": model,
+        "response_time": 0.0,
+        "first_token_time": None,
+        "relevance": "PENDING",
+        "relevance_explanation": "Evaluation pending",
+        "prompt_tokens": token_stats["prompt_tokens"],
+        "completion_tokens": token_stats["completion_tokens"],
+        "total_tokens": token_stats["total_tokens"],
+        "eval_prompt_tokens": 0,
+        "eval_completion_tokens": 0,
+        "eval_total_tokens": 0,
+        "openai_cost": calculate_openai_cost(model, token_stats),
+        "context_tokens": context_stats["context_tokens"],
+        "sources": sources_from_results(search_results),
+    }
+
+
+def complete_answer(query, answer_data, model='gpt-oss'):
+    """Fills in the relevance evaluation fields and eval token usage of answer_data in place."""
     # Relevance evaluation is a second Groq call — skip gracefully on rate-limit
     try:
-        relevance, rel_token_stats = evaluate_relevance(query, answer, model=model)
+        relevance, rel_token_stats = evaluate_relevance(query, answer_data["answer"], model=model)
     except Exception as eval_err:
-        import traceback
         print(f"[rag] evaluate_relevance failed (non-fatal): {eval_err}")
         relevance = {"Relevance": "UNKNOWN", "Explanation": "Evaluation skipped"}
         rel_token_stats = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
 
-    t1 = time()
-    took = t1 - t0
-
-    openai_cost_rag = calculate_openai_cost(model, token_stats)
-    openai_cost_eval = calculate_openai_cost(model, rel_token_stats)
-
-    openai_cost = openai_cost_rag + openai_cost_eval
-
-    answer_data = {
-        "answer": answer,
-        "model_used": model,
-        "response_time": took,
+    answer_data.update({
         "relevance": relevance.get("Relevance", "UNKNOWN"),
         "relevance_explanation": relevance.get(
             "Explanation", "Failed to parse evaluation"
         ),
-        "prompt_tokens": token_stats["prompt_tokens"],
-        "completion_tokens": token_stats["completion_tokens"],
-        "total_tokens": token_stats["total_tokens"],
         "eval_prompt_tokens": rel_token_stats["prompt_tokens"],
         "eval_completion_tokens": rel_token_stats["completion_tokens"],
         "eval_total_tokens": rel_token_stats["total_tokens"],
-        "openai_cost": openai_cost,
-    }
+        "openai_cost": answer_data["openai_cost"] + calculate_openai_cost(model, rel_token_stats),
+    })
+    return answer_data
+
+
+def sources_from_results(search_results, limit=SOURCES_LIMIT):
+    """The best-ranked knowledge base entries behind an answer, for display next to it."""
+    sources = []
+    for doc in merge_passages(search_results)[:limit]:
+        answer = " ".join((doc.get("answer") or "").split())
+        sources.append({
+            "id": doc.get("id"),
+            "title": doc.get("question"),
+            "snippet": answer[:SOURCE_SNIPPET_CHARS] + ("..." if len(answer) > SOURCE_SNIPPET_CHARS else ""),
+        })
+    return sources
+
+
+def cached_answer_data(cached, took, pending_explanation="Served from the cache while the original is evaluated"):
+    """
+    A cached answer as served now: no LLM tokens or cost were spent on it. A relevance still pending
+    is left to the judge of the original answer, which writes its verdict back to the cache.
+    """
+    answer_data = dict(cached)
+    if answer_data.get("relevance") == "PENDING":
+        answer_data["relevance"] = "UNKNOWN"
+        answer_data["relevance_explanation"] = pending_explanation
+    answer_data.update({
+        "response_time": took,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "eval_prompt_tokens": 0,
+        "eval_completion_tokens": 0,
+        "eval_total_tokens": 0,
+        "openai_cost": 0.0,
+        "context_tokens": 0,
+        "first_token_time": None,
+        "cache_hit": True,
+    })
+    return answer_data
+
+
+def coalesced_answer_data(shared, took):
+    """
+    The answer of an identical in-flight question as served to a caller that waited on it: like a
+    cached answer, it cost no tokens, and a still pending relevance is left to the original's judge.
+    """
+    answer_data = cached_answer_data(shared, took, "Shared with an identical question, which is evaluated instead")
+    answer_data["cache_hit"] = False
+    answer_data["coalesced"] = True
     return answer_data
 
 
@@ -488,3 +982,4 @@ def rag(query, model='gpt-oss', conversation_history=None):
 #     question = "What are different types of lung cancers?"
 #     answer = rag(question)
 #     print(answer)
+
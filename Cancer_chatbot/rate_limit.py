@@ -0,0 +1,247 @@
+import os
+import math
+import threading
+from time import monotonic
+
+
+def _optional_int(name):
+    value = os.getenv(name, "").strip()
+    return int(value) if value else None
+
+
+# Client-side Groq limits per API key and model, for each worker process (gunicorn runs 2, so
+# these default to half of the free tier's 30 requests and 12k tokens per minute); 0 disables one.
+GROQ_RPM = float(os.getenv("GROQ_RPM", "15"))
+GROQ_TPM = float(os.getenv("GROQ_TPM", "6000"))
+# In-flight calls per API key; 0 means unlimited. Unset, it follows from the quotas (see quota_limits).
+GROQ_MAX_CONCURRENCY = _optional_int("GROQ_MAX_CONCURRENCY")
+# Calls allowed to wait for capacity at once; later ones are shed immediately. Unset, it follows
+# from the quotas and the number of keys (see quota_limits).
+RATE_LIMIT_MAX_WAITERS = _optional_int("RATE_LIMIT_MAX_WAITERS")
+# Longest a call waits for capacity. A call whose expected wait is longer is shed right away.
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "20"))
+# Completion tokens reserved per call until the actual usage is known.
+RATE_LIMIT_COMPLETION_ESTIMATE = int(os.getenv("RATE_LIMIT_COMPLETION_ESTIMATE", "400"))
+# Tokens of a typical answer call (system prompt, a full context and the completion), to turn
+# GROQ_TPM into calls per minute for quota_limits.
+RATE_LIMIT_CALL_TOKENS = int(os.getenv("RATE_LIMIT_CALL_TOKENS", "2500"))
+
+
+def quota_limits(num_keys, rpm=GROQ_RPM, tpm=GROQ_TPM, max_wait=RATE_LIMIT_MAX_WAIT,
+                 call_tokens=RATE_LIMIT_CALL_TOKENS):
+    """
+    The in-flight cap per key and the waiter cap that follow from the per-key quotas.
+
+    A key can start at most one minute of its quota at once (a full bucket), so a tighter
+    concurrency cap would only shed calls Groq would take. Once the buckets are empty, all keys
+    together admit num_keys * calls_per_minute * max_wait / 60 calls within a caller's deadline;
+    more waiters would only be shed when their deadline passes.
+
+    Returns:
+        tuple: (max_concurrency, max_waiters); (0, 0) when neither quota is limited.
+    """
+    per_minute = [rpm] if rpm > 0 else []
+    if tpm > 0:
+        per_minute.append(tpm / max(call_tokens, 1))
+    if not per_minute:
+        return 0, 0
+    calls_per_minute = min(per_minute)
+    return max(math.ceil(calls_per_minute), 1), max(math.ceil(num_keys * calls_per_minute * max_wait / 60), 1)
+
+
+class RateLimitExceeded(Exception):
+    """No API key has capacity for a call within its deadline, or too many calls are already waiting."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Bucket refilled continuously at rate_per_minute up to one minute's worth. The level may go
+    below zero when actual usage exceeds what was reserved; later calls then wait off the debt.
+    """
+
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+        self.level = rate_per_minute
+        self.updated = monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount can be taken; a call larger than the capacity only needs a full bucket."""
+        self._refill(now)
+        needed = min(amount, self.capacity) - self.level
+        return max(needed, 0.0) / self.rate
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level = min(self.capacity, self.level - amount)
+
+
+class Reservation:
+    """Capacity held for one LLM call. Call release() once it ends, with the tokens actually used if known."""
+
+    def __init__(self, limiter, key, model, tokens):
+        self.limiter = limiter
+        self.key = key
+        self.model = model
+        self.tokens = tokens
+        self.released = False
+
+    def release(self, used_tokens=None):
+        if not self.released:
+            self.released = True
+            self.limiter._release(self, used_tokens)
+
+
+class RateLimiter:
+    """
+    Token-bucket limits on requests and tokens per minute for every (API key, model), plus a cap on
+    in-flight calls per key, shared by all threads of the process.
+
+    acquire() picks, among the candidate keys, the first one that can take the call now, or waits
+    for the one with capacity soonest. Waiting is bounded twice over: at most max_waiters calls wait
+    at once, and a call is shed as soon as its expected wait would pass its deadline, so that under
+    load requests fail fast with a retry hint instead of piling up on the worker.
+
+    max_concurrency and max_waiters left as None follow from the quotas of num_keys keys (see
+    quota_limits), so the caps grow with the key pool and with GROQ_RPM/GROQ_TPM.
+    """
+
+    def __init__(self, rpm=GROQ_RPM, tpm=GROQ_TPM, max_concurrency=GROQ_MAX_CONCURRENCY,
+                 max_waiters=RATE_LIMIT_MAX_WAITERS, max_wait=RATE_LIMIT_MAX_WAIT, num_keys=1):
+        quota_concurrency, quota_waiters = quota_limits(num_keys, rpm, tpm, max_wait)
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = quota_concurrency if max_concurrency is None else max_concurrency
+        self.max_waiters = quota_waiters if max_waiters is None else max_waiters
+        self.max_wait = max_wait
+
+        self._buckets = {}
+        self._in_flight = {}
+        self._waiters = 0
+        self._condition = threading.Condition()
+
+        self.admitted = 0
+        self.waited = 0
+        self.shed = 0
+        self.wait_seconds = 0.0
+
+    def _key_buckets(self, key, model):
+        buckets = self._buckets.get((key, model))
+        if buckets is None:
+            buckets = self._buckets[(key, model)] = (
+                TokenBucket(self.rpm) if self.rpm > 0 else None,
+                TokenBucket(self.tpm) if self.tpm > 0 else None,
+            )
+        return buckets
+
+    def _wait_time(self, key, model, tokens, now):
+        if self.max_concurrency > 0 and self._in_flight.get(key, 0) >= self.max_concurrency:
+            return None  # no estimate: depends on when a call finishes
+        requests, token_bucket = self._key_buckets(key, model)
+        return max(
+            requests.wait_time(1, now) if requests else 0.0,
+            token_bucket.wait_time(tokens, now) if token_bucket else 0.0,
+        )
+
+    def acquire(self, keys, model, tokens, timeout=None):
+        """
+        Reserves one request and tokens estimated tokens on one of keys, in order of preference.
+
+        Returns:
+            Reservation: for the chosen key (reservation.key).
+
+        Raises:
+            RateLimitExceeded: if no key has capacity within timeout (default max_wait) seconds.
+        """
+        started = monotonic()
+        timeout = self.max_wait if timeout is None else timeout
+        deadline = started + timeout
+        waiting = False
+
+        with self._condition:
+            try:
+                while True:
+                    now = monotonic()
+                    waits = {key: self._wait_time(key, model, tokens, now) for key in keys}
+                    ready = [key for key in keys if waits[key] == 0]
+                    if ready:
+                        key = ready[0]
+                        requests, token_bucket = self._key_buckets(key, model)
+                        if requests:
+                            requests.take(1, now)
+                        if token_bucket:
+                            token_bucket.take(tokens, now)
+                        self._in_flight[key] = self._in_flight.get(key, 0) + 1
+                        self.admitted += 1
+                        if waiting:
+                            self.wait_seconds += now - started
+                        return Reservation(self, key, model, tokens)
+
+                    known = [w for w in waits.values() if w is not None]
+                    soonest = min(known) if known else None
+                    if (soonest is not None and now + soonest > deadline) or now >= deadline:
+                        self.shed += 1
+                        raise RateLimitExceeded(
+                            f"LLM rate limit: no capacity for {model} within {timeout:g}s",
+                            retry_after=soonest if soonest is not None else self.max_wait,
+                        )
+                    if not waiting:
+                        if self._waiters >= self.max_waiters:
+                            self.shed += 1
+                            raise RateLimitExceeded(
+                                f"LLM rate limit: {self._waiters} calls already waiting",
+                                retry_after=soonest if soonest is not None else self.max_wait,
+                            )
+                        waiting = True
+                        self._waiters += 1
+                        self.waited += 1
+
+                    self._condition.wait(deadline - now if soonest is None else min(soonest, deadline - now))
+            finally:
+                if waiting:
+                    self._waiters -= 1
+
+    def _release(self, reservation, used_tokens):
+        with self._condition:
+            self._in_flight[reservation.key] -= 1
+            if used_tokens is not None:
+                token_bucket = self._key_buckets(reservation.key, reservation.model)[1]
+                if token_bucket:
+                    # Return the unused part of the estimate, or charge what went beyond it
+                    token_bucket.take(used_tokens - reservation.tokens, monotonic())
+            self._condition.notify_all()
+
+    def stats(self):
+        now = monotonic()
+        with self._condition:
+            buckets = {}
+            for (key, model), (requests, token_bucket) in self._buckets.items():
+                if requests:
+                    requests._refill(now)
+                if token_bucket:
+                    token_bucket._refill(now)
+                buckets[f"...{key[-4:]}/{model}"] = {
+                    "requests_available": requests.level if requests else None,
+                    "tokens_available": token_bucket.level if token_bucket else None,
+                    "in_flight": self._in_flight.get(key, 0),
+                }
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "max_concurrency": self.max_concurrency,
+                "waiting": self._waiters,
+                "max_waiters": self.max_waiters,
+                "admitted": self.admitted,
+                "waited": self.waited,
+                "shed": self.shed,
+                "wait_seconds": self.wait_seconds,
+                "buckets": buckets,
+            }
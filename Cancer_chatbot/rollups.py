@@ -0,0 +1,85 @@
+import os
+import threading
+from time import monotonic
+
+import db
+
+# Seconds between refreshes; the dashboard lags the raw tables by at most about this much.
+ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", "30"))
+# Dirty minutes recomputed per transaction.
+ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", "500"))
+
+
+class RollupRefresher:
+    """
+    Calls refresh(batch_size) every interval seconds from a daemon thread.
+
+    The thread starts on the first ensure_started() in each process, so the refresher is safe to
+    create before gunicorn forks. Errors (e.g. the database being down) are logged and retried on
+    the next tick.
+    """
+
+    def __init__(self, refresh=db.refresh_rollups, interval=ROLLUP_INTERVAL, batch_size=ROLLUP_BATCH_SIZE):
+        self.refresh = refresh
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stopping = threading.Event()
+
+        self.runs = 0
+        self.failures = 0
+        self.minutes_refreshed = 0
+        self.last_run_ms = 0.0
+        self.last_error = None
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return self
+        with self._lock:
+            if self._pid != os.getpid():
+                self._stopping = threading.Event()
+                threading.Thread(target=self._run, name="rollup-refresher", daemon=True).start()
+                self._pid = os.getpid()
+        return self
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        started = monotonic()
+        try:
+            minutes = self.refresh(self.batch_size)
+        except Exception as e:
+            print(f"[rollups] refresh failed: {type(e).__name__}: {e}")
+            with self._lock:
+                self.failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+            return 0
+        with self._lock:
+            self.runs += 1
+            self.minutes_refreshed += minutes
+            self.last_run_ms = (monotonic() - started) * 1000
+        return minutes
+
+    def stop(self):
+        self._stopping.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": self._pid == os.getpid() and not self._stopping.is_set(),
+                "interval": self.interval,
+                "runs": self.runs,
+                "failures": self.failures,
+                "minutes_refreshed": self.minutes_refreshed,
+                "last_run_ms": self.last_run_ms,
+                "last_error": self.last_error,
+            }
+
+
+if __name__ == "__main__":
+    # One refresh by hand, e.g. after a bulk import: python rollups.py
+    print(f"Refreshed {db.refresh_rollups(ROLLUP_BATCH_SIZE)} minute(s) of metrics")
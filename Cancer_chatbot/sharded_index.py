@@ -0,0 +1,145 @@
+import heapq
+import itertools
+import threading
+import multiprocessing
+
+import numpy as np
+
+import minsearch
+
+
+class ShardedIndex:
+    """
+    A fitted minsearch.Index split into num_shards contiguous row ranges (see Index.subset), each
+    searched by its own process, whose best matches are merged by score into the global top results.
+
+    Every shard keeps the vocabulary and weights of the whole index, so its scores compare with the
+    other shards' and the merged ranking is the one the whole index returns, up to the order of equal
+    scores. Hybrid retrieval fuses the merged lexical and LSA rankings, as Index.search does.
+
+    Shard processes are forked with their shard and answer over a pipe; processes=False searches the
+    shards one after another in this process instead. Every query goes to all shards at once, and
+    queries from several threads take turns, so send many queries through search_batch for throughput.
+    """
+
+    def __init__(self, index, num_shards, processes=True):
+        self.num_shards = num_shards
+        self.retrieval = index.retrieval
+        self.lsa_params = index.lsa_params
+        shards = [index.subset(rows) for rows in np.array_split(np.arange(len(index.docs)), num_shards)]
+        self.num_docs = sum(len(shard.docs) for shard in shards)
+
+        self._lock = threading.Lock()
+        self._shards = None if processes else shards
+        self._connections = []
+        self._processes = []
+        if not processes:
+            return
+
+        context = multiprocessing.get_context("fork")
+        for shard in shards:
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=_serve_shard, args=(shard, child_connection), name="index-shard", daemon=True)
+            process.start()
+            child_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    def search(self, query, filter_dict={}, boost_dict={}, num_results=10, retrieval=None):
+        """Index.search over every shard."""
+        return self.search_batch([query], filter_dict, boost_dict, num_results, retrieval)[0]
+
+    def search_batch(self, queries, filter_dict={}, boost_dict={}, num_results=10, retrieval=None):
+        """
+        Index.search for each of queries: every shard searches all of them, in parallel with the
+        other shards, and then the rankings of the shards are merged query by query.
+
+        Returns:
+            list of list of dict: For each query, the documents matching the search criteria, ranked by relevance.
+        """
+        retrieval = retrieval or self.retrieval
+        if retrieval not in minsearch.RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {retrieval!r}, expected one of {minsearch.RETRIEVAL_MODES}")
+        rankings = ("lexical", "lsa") if retrieval == "hybrid" else (retrieval,)
+        depth = max(num_results, self.lsa_params["rrf_depth"]) if retrieval == "hybrid" else num_results
+
+        replies = self._scatter(list(queries), filter_dict, boost_dict, depth, rankings)
+
+        results = []
+        for per_shard in zip(*replies):
+            docs = {}
+            merged = []
+            for ranking in rankings:
+                # Ties keep shard order, which is row order, like _top_k within one index
+                entries = heapq.nlargest(depth, itertools.chain.from_iterable(
+                    [(score, (shard, row), doc) for score, row, doc in ranked[ranking]]
+                    for shard, ranked in enumerate(per_shard)
+                ), key=lambda entry: entry[0])
+                docs.update((key, doc) for _, key, doc in entries)
+                merged.append([key for _, key, _ in entries])
+
+            if retrieval == "hybrid":
+                top = minsearch._rrf(merged, self.lsa_params["rrf_k"], num_results)
+            else:
+                top = merged[0]
+            results.append([docs[key] for key in top])
+        return results
+
+    def _scatter(self, *request):
+        """The reply of every shard, in shard order, to one request."""
+        if self._shards is not None:
+            return [_rank(shard, *request) for shard in self._shards]
+
+        with self._lock:
+            for connection in self._connections:
+                connection.send(request)
+            replies = [connection.recv() for connection in self._connections]
+
+        for ok, reply in replies:
+            if not ok:
+                raise reply
+        return [reply for _, reply in replies]
+
+    def close(self):
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+        for connection in self._connections:
+            connection.close()
+        self._connections, self._processes = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _rank(shard, queries, filter_dict, boost_dict, num_results, rankings):
+    # (score, row, doc) per ranking for each query; docs travel with their scores so the caller
+    # needs no copy of the shard
+    return [
+        {
+            ranking: [(float(score), int(row), shard.docs[row]) for row, score in zip(rows, scores)]
+            for ranking, (rows, scores) in ranked.items()
+        }
+        for ranked in shard.ranked_rows_batch(queries, filter_dict, boost_dict, num_results, rankings)
+    ]
+
+
+def _serve_shard(shard, connection):
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        try:
+            connection.send((True, _rank(shard, *request)))
+        except Exception as e:
+            connection.send((False, e))
@@ -0,0 +1,79 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time; callers arriving with the same key while it runs wait
+    for it and share its result, or its exception.
+
+    Nothing is kept once a call returns, so a later caller with the same key runs it again; put a
+    cache in front for that. Waiting uses threading.Event, which gevent's monkey-patching makes
+    cooperative.
+
+    Attributes:
+        calls (int): Calls that ran fn.
+        shared (int): Calls that waited on another caller's fn instead, i.e. the upstream work saved.
+        failures (int): Calls of fn that raised; their waiters raised the same exception.
+        max_waiters (int): Most callers that ever shared a single call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.shared = 0
+        self.failures = 0
+        self.max_waiters = 0
+
+    def do(self, key, fn):
+        """
+        Returns (fn(), shared), where shared is True when another caller's fn() produced the result.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self.shared += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "calls": self.calls,
+                "shared": self.shared,
+                "failures": self.failures,
+                "max_waiters": self.max_waiters,
+            }
@@ -0,0 +1,326 @@
+import os
+import glob
+import json
+import queue
+import atexit
+import threading
+from datetime import datetime
+from time import monotonic, sleep
+
+# Rows are written by a background thread in batches of up to this many...
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+# ...or after this many seconds, whichever comes first.
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+# Rows waiting in memory; beyond this they go straight to the journal.
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "10000"))
+# Directory of the journal files that keep rows while the database is unreachable.
+WRITE_BEHIND_JOURNAL_DIR = os.getenv("WRITE_BEHIND_JOURNAL_DIR", "/tmp/cancer_qa_journal")
+# Flush cycles a row refused for a reason that may pass (its conversation still buffered in
+# another worker) is retried before it is rejected.
+WRITE_BEHIND_MAX_DEFERRALS = int(os.getenv("WRITE_BEHIND_MAX_DEFERRALS", "5"))
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class WriteBehindBuffer:
+    """
+    Buffers database writes and hands them to flush(writes) in batches from a background thread.
+
+    A write is a (kind, row) tuple; flush receives them in the order they were added and must
+    apply them in one transaction. When flush fails with an error for which retryable(error) is
+    true (the database is down), the batch is appended to a JSON lines journal in journal_dir and
+    replayed before the next batch once writes succeed again; journals left by other or earlier
+    processes are claimed and replayed the same way. Any other error means some row is bad: the
+    batch is retried row by row and rows that still fail are set aside in a .rejected file, except
+    those failing with an error for which deferrable(error) is true: they are retried on their own
+    after each of the next max_deferrals flushes before being rejected. When the in-memory queue is
+    full, writes go straight to the journal, so requests never wait on the database.
+
+    The flusher thread starts on the first add in each process and logs and survives any error;
+    close() (registered with atexit) flushes what is left.
+    """
+
+    def __init__(self, flush, retryable=lambda error: True, deferrable=lambda error: False,
+                 batch_size=WRITE_BEHIND_BATCH_SIZE, flush_interval=WRITE_BEHIND_FLUSH_INTERVAL,
+                 max_size=WRITE_BEHIND_QUEUE_SIZE, journal_dir=WRITE_BEHIND_JOURNAL_DIR,
+                 max_deferrals=WRITE_BEHIND_MAX_DEFERRALS):
+        self.flush = flush
+        self.retryable = retryable
+        self.deferrable = deferrable
+        self.max_deferrals = max_deferrals
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.journal_dir = journal_dir
+
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._journal_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        # [write, attempts] of rows waiting to be retried on their own
+        self._deferred = []
+
+        self.added = 0
+        self.written = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.journaled = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.journal_dir, f"writes-{os.getpid()}.jsonl")
+
+    def add(self, kind, row):
+        self._ensure_thread()
+        with self._lock:
+            self.added += 1
+        try:
+            self._queue.put_nowait((kind, row))
+        except queue.Full:
+            print(f"[write-behind] queue full ({self.max_size}), journaling {kind} row")
+            self._journal([(kind, row)])
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_size)
+            self._deferred = []
+            self._stopping = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                batch = self._collect()
+                if self._write(batch):
+                    self._retry_deferred()
+            except Exception as e:
+                # e.g. the journal cannot be written; the rows of this cycle are lost, but not the thread
+                print(f"[write-behind] flusher error ({type(e).__name__}: {e}), continuing")
+                with self._lock:
+                    self.errors += 1
+                sleep(self.flush_interval)
+
+    def _collect(self):
+        batch = []
+        deadline = monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        """Replays pending journals, then writes batch. Returns False if the database is unreachable."""
+        if not self._replay_journals():
+            if batch:
+                self._journal(batch)
+            return False
+        if not batch:
+            return True
+
+        started = monotonic()
+        try:
+            rejected = self._flush(batch)
+        except Exception as e:
+            print(f"[write-behind] flush of {len(batch)} row(s) failed ({type(e).__name__}: {e}), journaling")
+            with self._lock:
+                self.failed_batches += 1
+            self._journal(batch)
+            return False
+
+        with self._lock:
+            self.batches += 1
+            self.written += len(batch) - rejected
+            self.last_flush_ms = (monotonic() - started) * 1000
+        return True
+
+    def _flush(self, batch):
+        """
+        flush(batch), falling back to one write at a time when the batch holds a bad row. Returns the
+        rows not written, whether rejected or deferred.
+        """
+        try:
+            self.flush(batch)
+            return 0
+        except Exception as e:
+            if self.retryable(e):
+                raise
+            print(f"[write-behind] batch of {len(batch)} rejected ({type(e).__name__}: {e}), writing rows one by one")
+
+        rejected = 0
+        for write in batch:
+            try:
+                self.flush([write])
+            except Exception as e:
+                if self.retryable(e):
+                    raise
+                rejected += 1
+                if self.deferrable(e) and self.max_deferrals > 0:
+                    print(f"[write-behind] deferring {write[0]} row ({type(e).__name__}: {e})")
+                    with self._lock:
+                        self._deferred.append([write, 0])
+                else:
+                    self._reject(write, e)
+        return rejected
+
+    def _reject(self, write, error):
+        print(f"[write-behind] rejecting {write[0]} row ({type(error).__name__}: {error})")
+        self._append(os.path.join(self.journal_dir, f"rejected-{os.getpid()}.jsonl"), [write])
+        with self._lock:
+            self.rejected += 1
+
+    def _retry_deferred(self):
+        """Retries deferred rows one by one; a row still refused after max_deferrals tries is rejected."""
+        with self._lock:
+            deferred, self._deferred = self._deferred, []
+
+        for n, (write, attempts) in enumerate(deferred):
+            try:
+                self.flush([write])
+            except Exception as e:
+                if self.retryable(e):
+                    # The database went away: these rows wait in the journal like any others
+                    self._journal([w for w, _ in deferred[n:]])
+                    return
+                if self.deferrable(e) and attempts + 1 < self.max_deferrals:
+                    with self._lock:
+                        self._deferred.append([write, attempts + 1])
+                else:
+                    self._reject(write, e)
+                continue
+            with self._lock:
+                self.written += 1
+
+    def _append(self, path, writes):
+        with self._journal_lock:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            with open(path, "a") as f:
+                for kind, row in writes:
+                    f.write(json.dumps([kind, row], default=_json_default) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _journal(self, writes):
+        if not writes:
+            return
+        self._append(self.journal_path, writes)
+        with self._lock:
+            self.journaled += len(writes)
+
+    def _replay_journals(self):
+        paths = sorted(glob.glob(os.path.join(self.journal_dir, "writes-*.jsonl")))
+        for path in paths:
+            # Renaming claims the file, so two workers never replay the same journal
+            claimed = f"{path}.replay-{os.getpid()}"
+            with self._journal_lock:
+                try:
+                    os.rename(path, claimed)
+                except FileNotFoundError:
+                    continue
+            if not self._replay(claimed):
+                return False
+
+        for claimed in glob.glob(os.path.join(self.journal_dir, f"writes-*.jsonl.replay-{os.getpid()}")):
+            if not self._replay(claimed):
+                return False
+        return True
+
+    def _replay(self, claimed):
+        writes = []
+        with open(claimed) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    writes.append(tuple(json.loads(line)))
+                except ValueError:
+                    # Cut short, e.g. still being appended by the process the journal was claimed from
+                    print(f"[write-behind] skipping a torn line in {claimed}")
+        for start in range(0, len(writes), self.batch_size):
+            try:
+                self._flush(writes[start:start + self.batch_size])
+            except Exception as e:
+                print(f"[write-behind] replaying {claimed} failed ({type(e).__name__}: {e})")
+                with self._lock:
+                    self.failed_batches += 1
+                # Keep the rest for the next attempt
+                with open(claimed, "w") as f:
+                    for kind, row in writes[start:]:
+                        f.write(json.dumps([kind, row], default=_json_default) + "\n")
+                return False
+            with self._lock:
+                self.replayed += len(writes[start:start + self.batch_size])
+        os.remove(claimed)
+        print(f"[write-behind] replayed {len(writes)} journaled row(s) from {claimed}")
+        return True
+
+    def close(self, timeout=10):
+        """Stops the flusher and writes out (or journals) everything still queued."""
+        if self._pid != os.getpid():
+            return
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+        pending = []
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for start in range(0, len(pending), self.batch_size):
+            if not self._write(pending[start:start + self.batch_size]):
+                self._journal(pending[start + self.batch_size:])
+                break
+
+        # Rows still deferred get more tries from whichever process replays the journal
+        self._retry_deferred()
+        with self._lock:
+            deferred, self._deferred = self._deferred, []
+        self._journal([write for write, _ in deferred])
+        self._pid = None
+
+    def register_atexit(self):
+        atexit.register(self.close)
+        return self
+
+    def stats(self):
+        journal_rows = 0
+        for path in glob.glob(os.path.join(self.journal_dir, "writes-*.jsonl*")):
+            with open(path) as f:
+                journal_rows += sum(1 for _ in f)
+        return {
+            "depth": self._queue.qsize() if self._pid == os.getpid() else 0,
+            "max_size": self.max_size,
+            "added": self.added,
+            "written": self.written,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "journaled": self.journaled,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+            "deferred": len(self._deferred),
+            "errors": self.errors,
+            "journal_rows": journal_rows,
+            "last_flush_ms": self.last_flush_ms,
+        }
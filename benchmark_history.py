@@ -0,0 +1,183 @@
+"""
+Seed a large synthetic conversations table and time the history and dashboard queries
+before and after the db.MIGRATIONS indexes, including OFFSET against keyset pagination.
+
+Runs in its own schema (dropped and recreated), never on the app's tables:
+
+    docker compose up -d postgres
+    POSTGRES_HOST=localhost python benchmark_history.py --rows 1000000
+"""
+
+import os
+import io
+import sys
+import uuid
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Cancer_chatbot"))
+
+MODELS = ["gpt-oss", "llama-3.1-8b", "meditron"]
+RELEVANCE = ["RELEVANT", "PARTLY_RELEVANT", "NON_RELEVANT", "UNKNOWN"]
+
+
+def seed(db, rows, feedback_share, chunk_size=50_000):
+    """COPYs rows synthetic conversations spread over the last 90 days, and feedback on a share of them."""
+    rng = random.Random(42)
+    end = datetime.now(timezone.utc)
+    span = timedelta(days=90).total_seconds()
+
+    with db.db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            for start in range(0, rows, chunk_size):
+                conversations = io.StringIO()
+                feedback = io.StringIO()
+                for _ in range(start, min(start + chunk_size, rows)):
+                    conversation_id = str(uuid.UUID(int=rng.getrandbits(128)))
+                    timestamp = (end - timedelta(seconds=rng.random() * span)).isoformat()
+                    prompt, completion = rng.randint(200, 2000), rng.randint(50, 600)
+                    conversations.write("\t".join(map(str, [
+                        conversation_id, "synthetic question", "synthetic answer", rng.choice(MODELS),
+                        round(rng.lognormvariate(0.5, 0.6), 3), round(rng.random(), 3),
+                        rng.choices(RELEVANCE, weights=[6, 2, 1, 1])[0], "synthetic",
+                        prompt, completion, prompt + completion, 0, 0, 0, 0.0, timestamp,
+                    ])) + "\n")
+                    if rng.random() < feedback_share:
+                        feedback.write(f"{conversation_id}\t{rng.choice([1, -1])}\t{timestamp}\n")
+
+                conversations.seek(0)
+                feedback.seek(0)
+                cur.copy_expert(f"COPY conversations ({', '.join(db.CONVERSATION_COLUMNS)}) FROM STDIN", conversations)
+                cur.copy_expert("COPY feedback (conversation_id, feedback, timestamp) FROM STDIN", feedback)
+                conn.commit()
+                print(f"  seeded {min(start + chunk_size, rows):,} rows")
+            cur.execute("ANALYZE conversations")
+            cur.execute("ANALYZE feedback")
+        conn.commit()
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = perf_counter()
+        fn()
+        times.append((perf_counter() - t0) * 1000)
+    return pd.Series(times).median()
+
+
+def run_queries(db, depth, page_size, repeat):
+    with db.db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT timestamp, id FROM conversations ORDER BY timestamp DESC, id DESC OFFSET %s LIMIT 1",
+                (depth,),
+            )
+            deep_cursor = cur.fetchone()
+
+    def sql(query, params=()):
+        def run():
+            with db.db_pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, params)
+                    cur.fetchall()
+        return run
+
+    queries = {
+        "history first page": lambda: db.get_recent_conversations(page_size),
+        "history first page, RELEVANT": lambda: db.get_recent_conversations(page_size, relevance="RELEVANT"),
+        f"history page at {depth:,}, OFFSET": sql(
+            "SELECT * FROM conversations ORDER BY timestamp DESC, id DESC OFFSET %s LIMIT %s", (depth, page_size)
+        ),
+        f"history page at {depth:,}, keyset": lambda: db.get_recent_conversations(
+            page_size, before=(deep_cursor[0].isoformat(), deep_cursor[1])
+        ),
+        "last 24h by model": sql(
+            "SELECT model_used, COUNT(*) FROM conversations "
+            "WHERE timestamp > now() - interval '24 hours' GROUP BY model_used"
+        ),
+        "last 24h by relevance": sql(
+            "SELECT relevance, COUNT(*) FROM conversations "
+            "WHERE timestamp > now() - interval '24 hours' GROUP BY relevance"
+        ),
+        "feedback of one conversation": sql(
+            "SELECT feedback FROM feedback WHERE conversation_id = %s", (deep_cursor[1],)
+        ),
+    }
+    return {name: timed(fn, repeat) for name, fn in queries.items()}
+
+
+def drop_schema(db, schema):
+    conn = db.get_db_connection()
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark history and dashboard queries on a synthetic table")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--feedback-share", type=float, default=0.1)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--depth", type=int, default=None, help="rows skipped for the deep page (default: half)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--schema", default="history_bench")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded schema afterwards")
+    args = parser.parse_args()
+
+    os.environ["USE_DB"] = "1"
+    # Every connection, pooled or not, resolves table names in the benchmark schema only
+    os.environ["PGOPTIONS"] = f"-c search_path={args.schema}"
+    import db
+
+    drop_schema(db, args.schema)
+    conn = db.get_db_connection()
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {args.schema}")
+    conn.commit()
+    conn.close()
+
+    db.init_db()
+    # Start from the bare tables so the indexes can be measured
+    with db.db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            for version, description, statement in db.MIGRATIONS:
+                if statement.startswith("CREATE INDEX"):
+                    index_name = statement.split(" IF NOT EXISTS ")[1].split()[0]
+                    cur.execute(f"DROP INDEX {index_name}")
+                    cur.execute("DELETE FROM schema_migrations WHERE version = %s", (version,))
+        conn.commit()
+
+    print(f"Seeding {args.rows:,} conversations into schema {args.schema}...")
+    t0 = perf_counter()
+    seed(db, args.rows, args.feedback_share)
+    print(f"Seeded in {perf_counter() - t0:.1f}s")
+
+    depth = args.depth if args.depth is not None else args.rows // 2
+    before = run_queries(db, depth, args.page_size, args.repeat)
+
+    t0 = perf_counter()
+    db.migrate()
+    print(f"Migrated in {perf_counter() - t0:.1f}s")
+    with db.db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE conversations")
+            cur.execute("ANALYZE feedback")
+        conn.commit()
+    after = run_queries(db, depth, args.page_size, args.repeat)
+
+    results = pd.DataFrame({"no_indexes_ms": before, "indexed_ms": after})
+    results["speedup"] = results["no_indexes_ms"] / results["indexed_ms"]
+    print(results.to_string(float_format=lambda v: f"{v:.2f}"))
+
+    db.db_pool.closeall()
+    if not args.keep:
+        drop_schema(db, args.schema)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark sharded search (Cancer_chatbot/sharded_index.py) on a synthetic corpus many times the size
+of the knowledge base, against the same index searched in one process.
+
+The corpus repeats the knowledge base entries, as the app indexes them, --copies times, each copy
+missing a random tenth of its words so copies score differently. For every shard count the script
+times single queries (latency p50/p95) and batches of --batch-size queries (throughput), and reports
+the speedup and parallel efficiency over one shard. Scaling needs at least as many free cores as
+shards; the report records os.cpu_count().
+
+    python benchmark_sharding.py --copies 50 --shards 1 2 4 8 --output sharding.json
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+from time import perf_counter
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "Cancer_chatbot"))
+
+import ingest
+import minsearch
+from evaluate_retrieval import DATA_PATH, GROUND_TRUTH_PATH
+from load_test import percentiles
+from sharded_index import ShardedIndex
+
+
+def synthetic_corpus(documents, copies, seed=0):
+    """The documents repeated copies times, with new ids and a tenth of the answer words dropped per copy."""
+    rng = random.Random(seed)
+    corpus = []
+    for copy in range(copies):
+        for doc in documents:
+            words = doc["answer"].split()
+            kept = [w for w in words if rng.random() >= 0.1] if copy else words
+            corpus.append({**doc, "id": copy * 100_000 + doc["id"], "answer": " ".join(kept)})
+    return corpus
+
+
+def run(index, queries, latency_queries, batch_size, num_results):
+    """Latency percentiles (ms) of single queries and queries per second in batches."""
+    latencies = []
+    for query in queries[:latency_queries]:
+        t0 = perf_counter()
+        index.search(query, num_results=num_results)
+        latencies.append((perf_counter() - t0) * 1000)
+
+    t0 = perf_counter()
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+        if isinstance(index, ShardedIndex):
+            index.search_batch(batch, num_results=num_results)
+        else:
+            # Index.search_batch scores dense (queries x docs) blocks, too large at this corpus size
+            for query in batch:
+                index.search(query, num_results=num_results)
+    wall = perf_counter() - t0
+
+    latency = percentiles(latencies)
+    return {"latency_ms_p50": latency["p50"], "latency_ms_p95": latency["p95"], "queries_per_s": len(queries) / wall}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sharded minsearch search against one process")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--ground-truth", default=GROUND_TRUTH_PATH)
+    parser.add_argument("--copies", type=int, default=20, help="times the knowledge base is repeated")
+    parser.add_argument("--shards", type=int, nargs="+",
+                        default=[n for n in (1, 2, 4, 8, 16, 32) if n <= max(1, os.cpu_count() or 1)] or [1])
+    parser.add_argument("--engine", default="inverted", choices=minsearch.SEARCH_ENGINES)
+    parser.add_argument("--scorer", default="bm25", choices=minsearch.SCORERS)
+    parser.add_argument("--retrieval", default="lexical", choices=minsearch.RETRIEVAL_MODES)
+    parser.add_argument("--queries", type=int, default=1000, help="ground-truth questions timed per configuration")
+    parser.add_argument("--latency-queries", type=int, default=200, help="of which timed one by one for latency")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--num-results", type=int, default=10)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    documents = ingest.chunk_documents(pd.read_csv(args.data).to_dict(orient="records"))
+    corpus = synthetic_corpus(documents, args.copies)
+    queries = pd.read_csv(args.ground_truth)["question"].sample(frac=1, random_state=0).tolist()[:args.queries]
+
+    print(f"Fitting {len(corpus):,} passages...", file=sys.stderr)
+    t0 = perf_counter()
+    index = minsearch.Index(
+        text_fields=["question", "answer"],
+        keyword_fields=["id"],
+        engine=args.engine,
+        scorer=args.scorer,
+        retrieval=args.retrieval,
+    ).fit(corpus)
+    fit_s = perf_counter() - t0
+
+    rows = [{"shards": "in-process", **run(index, queries, args.latency_queries, args.batch_size, args.num_results)}]
+    for num_shards in args.shards:
+        with ShardedIndex(index, num_shards) as sharded:
+            sharded.search_batch(queries[:args.batch_size], num_results=args.num_results)  # warm up
+            rows.append({"shards": num_shards, **run(sharded, queries, args.latency_queries, args.batch_size, args.num_results)})
+
+    base = next((row["queries_per_s"] for row in rows if row["shards"] == 1), None)
+    for row in rows[1:]:
+        if base:
+            row["speedup"] = row["queries_per_s"] / base
+            row["efficiency"] = row["speedup"] / row["shards"]
+
+    print(f"{len(corpus):,} passages, {os.cpu_count()} CPU(s), fit in {fit_s:.1f}s")
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "docs": len(corpus), "cpu_count": os.cpu_count(),
+                       "fit_s": fit_s, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Offline retrieval evaluation: runs every question of data/ground-truth-retrieval_v2.csv through a
+minsearch index and reports quality (hit rate, MRR, recall@k against the "id" column), per-query
+latency percentiles, throughput and the index's memory size.
+
+Queries are spread over --workers processes, which share the index through fork. With
+--min-hit-rate, --min-mrr or --max-p95-ms the script exits with status 1 when a configuration
+misses the bar, so a retrieval change can be gated on both quality and speed.
+
+    python evaluate_retrieval.py --scorers tfidf bm25 --engine inverted
+    python evaluate_retrieval.py --scorers bm25 --retrieval lexical lsa hybrid --lsa-dims 256
+    python evaluate_retrieval.py --passage-chars 1200 --min-hit-rate 0.9 --max-p95-ms 20 --output report.json
+    python evaluate_retrieval.py --scorers bm25 --engine inverted --shards 4
+
+Used as a library:
+
+    from evaluate_retrieval import evaluate, load_ground_truth
+    metrics = evaluate(index, load_ground_truth(), workers=4)
+"""
+
+import os
+import sys
+import json
+import argparse
+import multiprocessing
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "Cancer_chatbot"))
+
+import ingest
+import minsearch
+from sharded_index import ShardedIndex
+
+DATA_PATH = os.path.join(ROOT, "data", "CancerQA_data.csv")
+GROUND_TRUTH_PATH = os.path.join(ROOT, "data", "ground-truth-retrieval_v2.csv")
+RECALL_AT = (1, 3, 5, 10)
+
+# The index searched by worker processes, inherited through fork rather than pickled per task
+_worker_index = None
+
+
+def hit_rate(relevance_total):
+    cnt = 0
+
+    for line in relevance_total:
+        if True in line:
+            cnt = cnt + 1
+
+    return cnt / len(relevance_total)
+
+
+def mrr(relevance_total):
+    total_score = 0.0
+
+    for line in relevance_total:
+        for rank in range(len(line)):
+            if line[rank] == True:
+                total_score = total_score + 1 / (rank + 1)
+
+    return total_score / len(relevance_total)
+
+
+def recall_at(relevance_total, k):
+    # Every question has exactly one relevant document, so recall@k is the share found in the top k
+    return sum(True in line[:k] for line in relevance_total) / len(relevance_total)
+
+
+def load_ground_truth(path=GROUND_TRUTH_PATH):
+    return pd.read_csv(path).to_dict(orient="records")
+
+
+def build_index(documents, engine="dense", scorer="tfidf", passage_chars=ingest.PASSAGE_MAX_CHARS, retrieval="lexical", lsa_params=None):
+    """The app's index (see ingest.build_index) over documents, split into answer passages of passage_chars."""
+    documents = ingest.chunk_documents(documents, max_chars=passage_chars)
+    return minsearch.Index(
+        text_fields=["question", "answer"],
+        keyword_fields=["id"],
+        engine=engine,
+        scorer=scorer,
+        retrieval=retrieval,
+        lsa_params=lsa_params or {},
+    ).fit(documents)
+
+
+def _run_queries(index, ground_truth, boost, num_results, options):
+    relevance_total = []
+    latencies = []
+
+    for q in ground_truth:
+        t0 = perf_counter()
+        results = ingest.search_documents(index, q["question"], num_results, boost_dict=boost, **options)
+        latencies.append(perf_counter() - t0)
+
+        # Passages of one document count once, at the rank of the best one (as rag.merge_passages does)
+        ids = list(dict.fromkeys(d["id"] for d in results))
+        relevance_total.append([doc_id == q["id"] for doc_id in ids])
+
+    return relevance_total, latencies
+
+
+def _run_queries_in_worker(ground_truth, boost, num_results, options):
+    return _run_queries(_worker_index, ground_truth, boost, num_results, options)
+
+
+def evaluate(index, ground_truth, boost=None, num_results=10, workers=1, chunk_size=256, retrieval=None):
+    """
+    Searches every ground-truth question and scores the results against its "id".
+
+    Args:
+        index: A fitted minsearch.Index, or anything with the same search() signature.
+        ground_truth (list of dict): Questions with their "question" text and relevant "id".
+        boost (dict): Boosts per text field, passed to search().
+        num_results (int): Results per query; hit rate and MRR only see these.
+        workers (int): Processes to search in; 1 searches in this process.
+        chunk_size (int): Questions per task handed to a worker.
+        retrieval (str): Retrieval mode passed to search() ("lexical", "lsa" or "hybrid"); by default
+            the index's own.
+
+    Returns:
+        dict: hit_rate, mrr, recall@k for the RECALL_AT cutoffs up to num_results, per-query latency
+        percentiles in milliseconds, queries_per_s over the wall time and index_mb (when the index
+        reports memory_usage()).
+    """
+    global _worker_index
+    boost = boost or {}
+    options = {"retrieval": retrieval} if retrieval else {}
+
+    t0 = perf_counter()
+    if workers <= 1:
+        relevance_total, latencies = _run_queries(index, ground_truth, boost, num_results, options)
+    else:
+        _worker_index = index
+        chunks = [ground_truth[i:i + chunk_size] for i in range(0, len(ground_truth), chunk_size)]
+        relevance_total, latencies = [], []
+        try:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as pool:
+                for relevance, chunk_latencies in pool.map(
+                    _run_queries_in_worker, chunks, [boost] * len(chunks), [num_results] * len(chunks),
+                    [options] * len(chunks),
+                ):
+                    relevance_total += relevance
+                    latencies += chunk_latencies
+        finally:
+            _worker_index = None
+    wall = perf_counter() - t0
+
+    latencies = pd.Series(latencies) * 1000
+    metrics = {
+        "hit_rate": hit_rate(relevance_total),
+        "mrr": mrr(relevance_total),
+        **{f"recall@{k}": recall_at(relevance_total, k) for k in RECALL_AT if k <= num_results},
+        "latency_ms_p50": latencies.quantile(0.5),
+        "latency_ms_p95": latencies.quantile(0.95),
+        "latency_ms_p99": latencies.quantile(0.99),
+        "latency_ms_mean": latencies.mean(),
+        "queries_per_s": len(ground_truth) / wall,
+    }
+    if hasattr(index, "memory_usage"):
+        metrics["index_mb"] = index.memory_usage()["total"] / 2**20
+    return metrics
+
+
+def failed_gates(metrics, min_hit_rate=None, min_mrr=None, max_p95_ms=None):
+    """Descriptions of the thresholds metrics misses; empty when it passes all of them."""
+    failures = []
+    if min_hit_rate is not None and metrics["hit_rate"] < min_hit_rate:
+        failures.append(f"hit rate {metrics['hit_rate']:.4f} < {min_hit_rate}")
+    if min_mrr is not None and metrics["mrr"] < min_mrr:
+        failures.append(f"MRR {metrics['mrr']:.4f} < {min_mrr}")
+    if max_p95_ms is not None and metrics["latency_ms_p95"] > max_p95_ms:
+        failures.append(f"p95 latency {metrics['latency_ms_p95']:.2f}ms > {max_p95_ms}ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate minsearch retrieval quality and speed on the ground truth")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--ground-truth", default=GROUND_TRUTH_PATH)
+    parser.add_argument("--snapshot", help="evaluate this index snapshot (ingest.py --snapshot) instead of fitting --data")
+    parser.add_argument("--scorers", nargs="+", default=list(minsearch.SCORERS), choices=minsearch.SCORERS)
+    parser.add_argument("--engine", default="dense", choices=minsearch.SEARCH_ENGINES)
+    parser.add_argument("--passage-chars", type=int, default=ingest.PASSAGE_MAX_CHARS,
+                        help="index answers as passages of up to this many characters (0: whole answers); "
+                             "defaults to the app's PASSAGE_MAX_CHARS")
+    parser.add_argument("--retrieval", nargs="+", default=["lexical"], choices=minsearch.RETRIEVAL_MODES)
+    parser.add_argument("--lsa-dims", type=int, default=minsearch.DEFAULT_LSA_PARAMS["dims"])
+    parser.add_argument("--lsa-quantize", action="store_true", help="store LSA vectors as int8")
+    parser.add_argument("--boost", nargs="*", default=[], metavar="FIELD=VALUE", help="e.g. question=3 answer=0.5")
+    parser.add_argument("--num-results", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes to search in")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="split the index over this many shard processes (sharded_index.py); implies --workers 1")
+    parser.add_argument("--min-hit-rate", type=float)
+    parser.add_argument("--min-mrr", type=float)
+    parser.add_argument("--max-p95-ms", type=float)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    documents = pd.read_csv(args.data).to_dict(orient="records")
+    ground_truth = load_ground_truth(args.ground_truth)
+    boost = {field: float(value) for field, value in (item.split("=", 1) for item in args.boost)}
+
+    # One index per scorer serves every retrieval mode asked for; LSA vectors only when needed
+    retrieval = "lexical" if args.retrieval == ["lexical"] else "hybrid"
+    lsa_params = {"dims": args.lsa_dims, "quantize": args.lsa_quantize}
+    if args.snapshot:
+        snapshot = minsearch.Index.load(args.snapshot, engine=args.engine)
+        configs = [(snapshot.scorer, lambda: snapshot)]
+    else:
+        configs = [
+            (scorer, lambda scorer=scorer: build_index(
+                documents, args.engine, scorer, args.passage_chars, retrieval, lsa_params))
+            for scorer in args.scorers
+        ]
+
+    rows = []
+    failures = []
+    for scorer, make_index in configs:
+        index = make_index()
+        num_docs = len(index.docs)
+        if args.shards > 1:
+            index = ShardedIndex(index, args.shards)
+        for mode in args.retrieval:
+            metrics = evaluate(index, ground_truth, boost=boost, num_results=args.num_results,
+                               workers=1 if args.shards > 1 else args.workers, retrieval=mode)
+            rows.append({"scorer": scorer, "engine": args.engine, "retrieval": mode, "docs": num_docs, **metrics})
+            failures += [f"{scorer}/{mode}: {failure}" for failure in failed_gates(
+                metrics, args.min_hit_rate, args.min_mrr, args.max_p95_ms)]
+        if args.shards > 1:
+            index.close()
+
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": rows, "failures": failures}, f, indent=2)
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -149,6 +149,12 @@ def create_dashboard(api_key, datasource_uid):
 
     print(f"Updated datasource UID for {panels_updated} panels/targets.")
 
+    # The panels read the metrics_minute/metrics_hour rollup tables through the $resolution and
+    # $model variables; the model list is itself a query on the datasource
+    for variable in dashboard_json.get("templating", {}).get("list", []):
+        if isinstance(variable.get("datasource"), dict):
+            variable["datasource"]["uid"] = datasource_uid
+
     # Remove keys that shouldn't be included when creating a new dashboard
     dashboard_json.pop("id", None)
     dashboard_json.pop("uid", None)
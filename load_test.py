@@ -0,0 +1,228 @@
+"""
+Load generator for the /question API: replays the ground-truth questions as multi-turn sessions and
+reports latency percentiles, throughput and errors as JSON, to compare runs for regressions.
+
+Sessions start on an open-loop schedule (--rate sessions per second, Poisson arrivals), so a slow
+server builds up a backlog instead of slowing the load down, and the first question of a session is
+timed from when it was due rather than from when a thread got round to sending it. --concurrency N
+runs a closed loop of N users instead. Each session asks up to --turns questions about the same
+knowledge base entry and sends the earlier turns along as conversation_history.
+
+    # a server that is already running
+    python load_test.py --url http://localhost:5001 --rate 2 --duration 60 --turns 3
+
+    # a local gunicorn in front of the stub Groq API (stub_groq.py), which answers 429 beyond 600 RPM
+    python load_test.py --local --latency 1.5 --stub-rpm 600 --rate 10 --duration 60 --output run.json
+"""
+
+import os
+import sys
+import json
+import random
+import signal
+import argparse
+import itertools
+import threading
+from collections import Counter, namedtuple
+from datetime import datetime, timezone
+from time import perf_counter, sleep
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+
+from load_test_serving import ROOT, start_app, start_stub
+
+Result = namedtuple("Result", "turn status latency")
+
+
+def load_sessions(path, turns, seed=None):
+    """The questions of each knowledge base entry (up to turns of them), entries and questions shuffled."""
+    rng = random.Random(seed)
+    sessions = []
+    for _, group in pd.read_csv(path).groupby("id"):
+        questions = group["question"].drop_duplicates().tolist()
+        rng.shuffle(questions)
+        sessions.append(questions[:turns])
+    rng.shuffle(sessions)
+    return sessions
+
+
+def percentiles(latencies):
+    if not latencies:
+        return None
+    values = pd.Series(latencies)
+    return {
+        "p50": values.quantile(0.5),
+        "p95": values.quantile(0.95),
+        "p99": values.quantile(0.99),
+        "mean": values.mean(),
+        "max": values.max(),
+    }
+
+
+class LoadTest:
+    """
+    Runs sessions of questions against url + "/question" and collects a Result per question.
+
+    A session ends at its first failed question, as a user would give up; think_time is the mean of
+    the exponentially distributed pause between the answer to one turn and the next question.
+    """
+
+    def __init__(self, url, sessions, think_time=0.0, timeout=120, seed=None):
+        self.url = url.rstrip("/") + "/question"
+        self.sessions = sessions
+        self.think_time = think_time
+        self.timeout = timeout
+        self.results = []
+        self.started_sessions = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._http = requests.Session()
+
+    def run_session(self, questions, due):
+        history = []
+        for turn, question in enumerate(questions, start=1):
+            payload = {"question": question}
+            if history:
+                payload["conversation_history"] = list(history)
+            try:
+                response = self._http.post(self.url, json=payload, timeout=self.timeout)
+                status = response.status_code
+                answer = response.json().get("answer", "") if status == 200 else None
+            except requests.Timeout:
+                status = "timeout"
+            except (requests.RequestException, ValueError) as e:
+                status = type(e).__name__
+            with self._lock:
+                self.results.append(Result(turn, status, perf_counter() - due))
+            if status != 200:
+                return
+
+            history += [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+            if self.think_time and turn < len(questions):
+                sleep(self._rng.expovariate(1 / self.think_time))
+            due = perf_counter()
+
+    def open_loop(self, rate, duration, max_in_flight):
+        """Starts sessions at Poisson arrivals of rate per second for duration seconds; returns the wall time."""
+        self._http.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=max_in_flight))
+        t0 = perf_counter()
+        due = t0
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            for questions in itertools.cycle(self.sessions):
+                due += self._rng.expovariate(rate)
+                if due - t0 >= duration:
+                    break
+                delay = due - perf_counter()
+                if delay > 0:
+                    sleep(delay)
+                self.started_sessions += 1
+                pool.submit(self.run_session, questions, due)
+        return perf_counter() - t0
+
+    def closed_loop(self, concurrency, duration):
+        """Runs concurrency users, each starting a new session as soon as its last one ends; returns the wall time."""
+        self._http.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+        sessions = itertools.cycle(self.sessions)
+        t0 = perf_counter()
+
+        def user():
+            while perf_counter() - t0 < duration:
+                with self._lock:
+                    questions = next(sessions)
+                    self.started_sessions += 1
+                self.run_session(questions, perf_counter())
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(user)
+        return perf_counter() - t0
+
+    def report(self, wall):
+        ok = [r for r in self.results if r.status == 200]
+        errors = Counter(str(r.status) for r in self.results if r.status != 200)
+        turns = sorted({r.turn for r in ok})
+        return {
+            "wall_s": wall,
+            "sessions": self.started_sessions,
+            "requests": len(self.results),
+            "ok": len(ok),
+            "errors": sum(errors.values()),
+            "error_rate": sum(errors.values()) / len(self.results) if self.results else 0.0,
+            "errors_by_status": dict(errors),
+            "throughput_rps": len(ok) / wall if wall else 0.0,
+            "latency_s": percentiles([r.latency for r in ok]),
+            "latency_by_turn_s": {str(turn): percentiles([r.latency for r in ok if r.turn == turn]) for turn in turns},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay ground-truth questions against /question and report latency as JSON")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--rate", type=float, default=2.0, help="new sessions per second (open loop, the default)")
+    load.add_argument("--concurrency", type=int, help="simultaneous users (closed loop) instead of --rate")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to start sessions for")
+    parser.add_argument("--turns", type=int, default=3, help="most questions per session")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds between an answer and the next question")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="most sessions running at once in open loop")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--ground-truth", default=os.path.join(ROOT, "data", "ground-truth-retrieval_v2.csv"))
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--url", default="http://localhost:5001", help="server to test, unless --local")
+
+    local = parser.add_argument_group("--local: start gunicorn and a stub Groq API on this machine")
+    local.add_argument("--local", action="store_true")
+    local.add_argument("--profile", default="gevent", help="SERVER_PROFILE of the local gunicorn")
+    local.add_argument("--workers", type=int, default=1)
+    local.add_argument("--port", type=int, default=18001, help="local gunicorn port; the stub takes the next one")
+    local.add_argument("--latency", type=float, default=1.5, help="stub Groq seconds per completion")
+    local.add_argument("--stub-rpm", type=int, default=0, help="stub Groq requests per minute per key before 429s")
+    local.add_argument("--stub-throttle-share", type=float, default=0.0, help="share of stub Groq requests answered 429")
+    local.add_argument("--app-env", action="append", default=[], metavar="NAME=VALUE",
+                       help="extra environment for the local gunicorn, e.g. GROQ_MAX_CONCURRENCY=8")
+    args = parser.parse_args()
+
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "ground_truth")}
+    if args.concurrency:
+        config["rate"] = None
+    test = LoadTest(args.url, load_sessions(args.ground_truth, args.turns, args.seed),
+                    think_time=args.think_time, timeout=args.timeout, seed=args.seed)
+
+    processes = []
+    try:
+        if args.local:
+            stub_url = f"http://127.0.0.1:{args.port + 1}"
+            processes.append(start_stub(args.port + 1, args.latency, args.stub_rpm, args.stub_throttle_share))
+            overrides = dict(item.split("=", 1) for item in args.app_env)
+            processes.append(start_app(args.profile, args.port, stub_url, args.workers, overrides))
+            test.url = f"http://127.0.0.1:{args.port}/question"
+            config["url"] = f"http://127.0.0.1:{args.port}"
+
+        print(f"Load test of {test.url} for {args.duration:g}s...", file=sys.stderr)
+        started_at = datetime.now(timezone.utc).isoformat()
+        if args.concurrency:
+            wall = test.closed_loop(args.concurrency, args.duration)
+        else:
+            wall = test.open_loop(args.rate, args.duration, args.max_in_flight)
+
+        report = {"started_at": started_at, "config": config, **test.report(wall)}
+        if args.local:
+            report["stub_groq"] = requests.get(stub_url, timeout=5).json()
+    finally:
+        for process in reversed(processes):
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=60)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Load-test the gunicorn worker profiles (see Cancer_chatbot/gunicorn.conf.py) against a stub Groq
+API with realistic latency: one worker process per profile, many concurrent /question calls.
+
+    python load_test_serving.py --profiles sync gthread gevent --concurrency 200 --latency 2
+"""
+
+import os
+import sys
+import signal
+import argparse
+import subprocess
+from time import perf_counter, sleep
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(ROOT, "Cancer_chatbot")
+
+
+def wait_until_up(process, url, name):
+    for _ in range(600):
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} exited with {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return process
+        except requests.RequestException:
+            sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{name} did not come up")
+
+
+def start_stub(port, latency, rpm=0, throttle_share=0.0):
+    # A process of its own, so the stub and the load generator do not share a GIL
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "stub_groq.py"), "--port", str(port), "--latency", str(latency),
+         "--rpm", str(rpm), "--throttle-share", str(throttle_share)],
+        stdout=subprocess.DEVNULL,
+    )
+    return wait_until_up(process, f"http://127.0.0.1:{port}/", "stub Groq API")
+
+
+def start_app(profile, port, groq_url, workers, overrides=None):
+    env = dict(
+        os.environ,
+        SERVER_PROFILE=profile,
+        WEB_WORKERS=str(workers),
+        PORT=str(port),
+        GROQ_API_KEY="stub-key",
+        GROQ_BASE_URL=groq_url,
+        # Measure the server, not the client-side Groq limits or the relevance judge
+        GROQ_RPM="0",
+        GROQ_TPM="0",
+        GROQ_MAX_CONCURRENCY="0",
+        RATE_LIMIT_MAX_WAITERS="100000",
+        EVAL_SAMPLE_RATE="0",
+        USE_DB="0",
+    )
+    env.update(overrides or {})
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return wait_until_up(process, f"http://127.0.0.1:{port}/cache/stats", f"gunicorn ({profile})")
+
+
+def run_load(port, questions, concurrency):
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def ask(question):
+        t0 = perf_counter()
+        try:
+            response = session.post(f"http://127.0.0.1:{port}/question", json={"question": question}, timeout=300)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return perf_counter() - t0, ok
+
+    t0 = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(ask, questions))
+    wall = perf_counter() - t0
+
+    latencies = pd.Series([latency for latency, ok in results if ok])
+    return {
+        "requests": len(results),
+        "errors": sum(not ok for _, ok in results),
+        "throughput_rps": len(latencies) / wall,
+        "latency_p50_s": latencies.quantile(0.5) if len(latencies) else None,
+        "latency_p95_s": latencies.quantile(0.95) if len(latencies) else None,
+        "wall_s": wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare gunicorn worker profiles under concurrent questions")
+    parser.add_argument("--profiles", nargs="+", default=["sync", "gthread", "gevent"])
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=None, help="total questions (default: 2x concurrency)")
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn worker processes")
+    parser.add_argument("--latency", type=float, default=2.0, help="stub Groq seconds per completion")
+    parser.add_argument("--ground-truth", default=os.path.join(ROOT, "data", "ground-truth-retrieval_v2.csv"))
+    parser.add_argument("--port", type=int, default=18001)
+    args = parser.parse_args()
+
+    # Distinct questions, so the answer cache never short-circuits the LLM call
+    total = args.requests or 2 * args.concurrency
+    questions = pd.read_csv(args.ground_truth)["question"].drop_duplicates().tolist()
+    questions = [f"{questions[n % len(questions)]} ({n})" for n in range(total)]
+
+    stub = start_stub(args.port + 1, args.latency)
+    rows = []
+    try:
+        for profile in args.profiles:
+            print(f"{profile}: {total} questions, {args.concurrency} at a time...")
+            process = start_app(profile, args.port, f"http://127.0.0.1:{args.port + 1}", args.workers)
+            try:
+                rows.append({"profile": profile, **run_load(args.port, questions, args.concurrency)})
+            finally:
+                process.send_signal(signal.SIGTERM)
+                process.wait(timeout=60)
+    finally:
+        stub.terminate()
+
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Stand-in for the Groq chat completions API, for load tests that must not spend real tokens.
+It answers after a configurable delay, streams tokens when asked to and, like Groq, answers 429
+with a retry-after header once an API key goes over its requests per minute.
+
+    python stub_groq.py --port 18080 --latency 2.0 --rpm 300
+    GROQ_BASE_URL=http://127.0.0.1:18080 GROQ_API_KEY=stub gunicorn -c gunicorn.conf.py app:app
+"""
+
+import json
+import random
+import argparse
+import threading
+from collections import deque
+from time import monotonic, sleep, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = (
+    "Leukemia is a cancer of the blood-forming tissues, including the bone marrow. "
+    "Please talk to your doctor about your symptoms and treatment options."
+)
+
+
+class StubGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, delayed ACKs add ~40ms per call
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        # Health check for load tests waiting on the stub to come up
+        self.send_json(200, {"requests": self.server.requests, "rate_limited": self.server.rate_limited})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        wait = server.admit(self.headers.get("Authorization", ""))
+        if wait is not None:
+            self.send_json(429, {"error": {
+                "message": f"Rate limit reached for model `{body.get('model')}` on requests per minute (RPM): "
+                           f"Limit {server.rpm}. Please try again in {wait:.3f}s.",
+                "type": "requests",
+                "code": "rate_limit_exceeded",
+            }}, headers={"retry-after": str(max(round(wait), 1)), "x-ratelimit-limit-requests": str(server.rpm),
+                         "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": f"{wait:.3f}s"})
+            return
+
+        delay = max(random.gauss(server.latency, server.latency * server.jitter), 0.0)
+        words = ANSWER.split(" ")
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                 "total_tokens": prompt_tokens + len(words)}
+
+        if not body.get("stream"):
+            sleep(delay)
+            self.send_json(200, {
+                "id": "stub", "object": "chat.completion", "created": int(time()), "model": body.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": ANSWER}}],
+                "usage": usage,
+            })
+            return
+
+        # Time to first token is a third of the delay; the rest is spread over the tokens
+        sleep(delay / 3)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for n, word in enumerate(words):
+            delta = {"content": word if n == 0 else " " + word}
+            chunk = {"id": "stub", "object": "chat.completion.chunk", "created": int(time()),
+                     "model": body.get("model"), "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            if n == len(words) - 1:
+                chunk["choices"][0]["finish_reason"] = "stop"
+                chunk["x_groq"] = {"usage": usage}
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            sleep(delay * 2 / 3 / len(words))
+        self.write_chunk("data: [DONE]\n\n")
+        self.write_chunk("")
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class StubGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=1.0, jitter=0.2, rpm=0, throttle_share=0.0):
+        super().__init__(address, StubGroqHandler)
+        self.latency = latency
+        self.jitter = jitter
+        # Requests per minute per API key (0: unlimited), over a sliding minute as Groq counts them
+        self.rpm = rpm
+        # Share of requests answered 429 regardless, like Groq shedding load when it is busy
+        self.throttle_share = throttle_share
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self._recent = {}
+
+    def admit(self, key):
+        """Counts a request of key against its budget; returns None or the seconds to wait before retrying."""
+        with self.lock:
+            if self.throttle_share and random.random() < self.throttle_share:
+                self.rate_limited += 1
+                return random.uniform(0.5, 2.0)
+            if not self.rpm:
+                return None
+
+            now = monotonic()
+            recent = self._recent.setdefault(key, deque())
+            while recent and recent[0] <= now - 60:
+                recent.popleft()
+            if len(recent) >= self.rpm:
+                self.rate_limited += 1
+                return recent[0] + 60 - now
+            recent.append(now)
+            return None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serves from a daemon thread; returns self."""
+        threading.Thread(target=self.serve_forever, name="stub-groq", daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a stub Groq chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=1.0, help="mean seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.2, help="standard deviation, as a share of the latency")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute per API key before 429s (0: unlimited)")
+    parser.add_argument("--throttle-share", type=float, default=0.0, help="share of requests answered 429 at random")
+    args = parser.parse_args()
+
+    server = StubGroqServer((args.host, args.port), latency=args.latency, jitter=args.jitter,
+                            rpm=args.rpm, throttle_share=args.throttle_share)
+    print(f"Stub Groq API on {server.url} (GROQ_BASE_URL), {args.latency:g}s per completion")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Tests for the answer cache in front of rag.rag
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Cancer_chatbot"))
+
+import minsearch
+from cache import AnswerCache, LRUCache, RedisCache, RetrievalCache, SQLiteCache, normalize_question
+
+DOCS = [
+    {"id": 0, "question": "What is leukemia?", "answer": "A cancer of the blood."},
+    {"id": 1, "question": "What are the stages of lung cancer?", "answer": "Stages 0 to IV."},
+    {"id": 2, "question": "What are the stages of breast cancer?", "answer": "Stages 0 to IV."},
+]
+
+
+def test_lru_cache_evicts_and_expires():
+    """The LRU cache evicts the least recently used entry and drops expired ones"""
+    cache = LRUCache(max_size=2, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", {"relevance": "PENDING"})
+
+    assert cache.get("b") is None, "b was least recently used"
+    cache.get("c")["relevance"] = "UNKNOWN"
+    assert cache.get("a") == 1 and cache.get("c") == {"relevance": "PENDING"}, "changing a value read does not change the entry"
+
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    stats = cache.stats()
+    print(stats)
+    assert stats["evictions"] == 1 and stats["expirations"] == 1
+
+
+def test_answer_cache_exact_and_near_duplicates():
+    """Normalized questions hit exactly; near duplicates hit only above the threshold with the same unknown words"""
+    assert normalize_question("  What IS   Leukemia?? ") == "what is leukemia"
+
+    index = minsearch.Index(text_fields=["question", "answer"], keyword_fields=["id"]).fit(DOCS)
+    cache = AnswerCache(max_size=10, ttl=60, similarity_threshold=0.8, index=index)
+
+    cache.set("What are the stages of lung cancer?", "gpt-oss", {"answer": "lung"})
+    cache.set("What is leukemia?", "gpt-oss", {"answer": "leukemia"})
+
+    assert cache.get("what are the stages of LUNG cancer", "gpt-oss") == {"answer": "lung"}
+    assert cache.get("What are the stages of lung cancer?", "meditron") is None, "answers are cached per model"
+    assert cache.get("stages of lung cancer", "gpt-oss") == {"answer": "lung"}
+    assert cache.get("What are the stages of breast cancer?", "gpt-oss") is None
+    assert cache.get("What is lymphoma?", "gpt-oss") is None, "unknown words must match for a near hit"
+
+    stats = cache.stats()
+    print(stats)
+    assert (stats["hits"], stats["near_hits"], stats["misses"]) == (1, 1, 3)
+
+    disabled = AnswerCache(max_size=0)
+    disabled.set("What is leukemia?", "gpt-oss", {"answer": "leukemia"})
+    assert disabled.get("What is leukemia?", "gpt-oss") is None
+
+
+def test_sqlite_cache_is_shared_between_instances():
+    """Two SQLiteCache instances on one file (as in two workers) see each other's entries and counters"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.sqlite3")
+        worker_a = SQLiteCache(path, max_size=2, ttl=60, namespace="answers")
+        worker_b = SQLiteCache(path, max_size=2, ttl=60, namespace="answers")
+        other = SQLiteCache(path, max_size=2, ttl=60, namespace="retrieval")
+
+        worker_a.set("a", {"answer": "A"})
+        assert worker_b.get("a") == {"answer": "A"}
+        assert other.get("a") is None, "namespaces do not share entries"
+
+        worker_b.set("b", {"answer": "B"})
+        worker_a.set("c", {"answer": "C"})
+        assert worker_b.get("a") is None, "a was least recently used"
+        assert len(worker_a) == 2
+
+        stats = worker_a.stats()
+        print(stats)
+        assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 1, 1)
+
+        short = SQLiteCache(path, max_size=2, ttl=0.05, namespace="short")
+        short.set("x", 1)
+        time.sleep(0.06)
+        assert short.get("x") is None and short.stats()["expirations"] == 1
+
+
+def test_redis_cache_evicts_and_shares_answers():
+    """RedisCache works against a fakeredis server when fakeredis is installed"""
+    try:
+        import fakeredis
+    except ImportError:
+        print("  fakeredis not installed, skipping")
+        return
+
+    server = fakeredis.FakeServer()
+    worker_a = RedisCache(max_size=2, ttl=60, namespace="answers", client=fakeredis.FakeRedis(server=server))
+    worker_b = RedisCache(max_size=2, ttl=60, namespace="answers", client=fakeredis.FakeRedis(server=server))
+
+    answers = AnswerCache(entries=worker_a)
+    answers.set("What is leukemia?", "gpt-oss", {"answer": "leukemia"})
+    assert AnswerCache(entries=worker_b).get("what is LEUKEMIA", "gpt-oss") == {"answer": "leukemia"}
+
+    worker_a.set("b", 2)
+    worker_b.set("c", 3)
+    assert worker_a.get("b") == 2 and worker_a.get("c") == 3
+    assert len(worker_a) == 2
+
+    stats = worker_b.stats()
+    print(stats)
+    assert stats["evictions"] == 1 and stats["hits"] == 3
+
+
+def test_caches_are_scoped_to_the_knowledge_base_version():
+    """Entries of one knowledge base version are not served for another; rebind forgets the old vectors"""
+    entries = LRUCache(max_size=10, ttl=60)
+    index = minsearch.Index(text_fields=["question", "answer"], keyword_fields=["id"]).fit(DOCS)
+    cache = AnswerCache(similarity_threshold=0.8, index=index, entries=entries, version="v1")
+    cache.set("What is leukemia?", "gpt-oss", {"answer": "old"})
+    assert AnswerCache(entries=entries, version="v1").get("what is leukemia", "gpt-oss") == {"answer": "old"}
+
+    newer = minsearch.Index(text_fields=["question", "answer"], keyword_fields=["id"]).fit(DOCS[:2])
+    cache.rebind(newer, "v2")
+    assert cache.index is newer and not cache._vectors
+    assert cache.get("What is leukemia?", "gpt-oss") is None
+
+    results = RetrievalCache(entries=entries, version="v1")
+    results.set("leukemia", [{"id": 0}])
+    results.version = "v2"
+    assert results.get("leukemia") is None
+
+
+if __name__ == "__main__":
+    test_lru_cache_evicts_and_expires()
+    test_answer_cache_exact_and_near_duplicates()
+    test_sqlite_cache_is_shared_between_instances()
+    test_redis_cache_evicts_and_shares_answers()
+    test_caches_are_scoped_to_the_knowledge_base_version()
+    print("\n✅ SUCCESS: All cache checks passed!")
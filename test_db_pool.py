@@ -0,0 +1,157 @@
+"""
+Tests for the database connection pool.
+
+The live test needs a Postgres server, e.g. the one from docker-compose:
+
+    docker compose up -d postgres
+    TEST_POSTGRES=1 POSTGRES_HOST=localhost python test_db_pool.py
+"""
+
+import os
+import sys
+import threading
+from time import sleep
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Cancer_chatbot"))
+
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query):
+        if self.conn.dead:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.queries.append(query)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.dead = False
+        self.queries = []
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+def test_pool_reuses_connections_and_waits_when_exhausted():
+    """Connections are reused, the pool never exceeds max_size and a full pool waits then times out"""
+    opened = []
+    pool = ConnectionPool(lambda: opened.append(FakeConnection()) or opened[-1],
+                          min_size=1, max_size=2, timeout=0.2, health_check_after=60)
+
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    assert len(opened) == 1, "min_size connections are opened up front and reused"
+
+    a, b = pool.getconn(), pool.getconn()
+    try:
+        pool.getconn()
+        assert False, "the pool is exhausted"
+    except PoolTimeout:
+        pass
+
+    threading.Timer(0.05, pool.putconn, args=(a,)).start()
+    assert pool.getconn() is a, "a waiting checkout gets the returned connection"
+    pool.putconn(a)
+    pool.putconn(b)
+
+    stats = pool.stats()
+    print(stats)
+    assert (stats["size"], stats["idle"], stats["opened"], stats["timeouts"]) == (2, 2, 2, 1)
+    assert stats["checkout_ms_max"] >= 40
+
+
+def test_pool_replaces_dead_and_broken_connections():
+    """Idle connections are pinged and replaced when dead; connection errors discard the connection"""
+    opened = []
+    pool = ConnectionPool(lambda: opened.append(FakeConnection()) or opened[-1],
+                          min_size=0, max_size=2, timeout=1, health_check_after=0.01)
+
+    with pool.connection() as conn:
+        pass
+    conn.dead = True
+    sleep(0.02)
+    with pool.connection() as replacement:
+        assert replacement is not conn and conn.closed
+    assert pool.stats()["failed_health_checks"] == 1
+
+    try:
+        with pool.connection() as conn:
+            raise psycopg2.OperationalError("SSL connection has been closed unexpectedly")
+    except psycopg2.OperationalError:
+        pass
+    assert conn.closed and pool.stats()["size"] == 0
+
+    with pool.connection() as conn:
+        pass
+    pool._pid = -1  # as seen from a forked child
+    with pool.connection() as child_conn:
+        assert child_conn is not conn and not conn.closed, "the parent's connections are left alone"
+
+
+def test_live_postgres_pool():
+    """Concurrent checkouts and a forked child against a real Postgres (TEST_POSTGRES=1)"""
+    if os.getenv("TEST_POSTGRES") != "1":
+        print("  TEST_POSTGRES not set, skipping")
+        return
+
+    import db
+    db.USE_DB = True
+
+    def query():
+        for _ in range(20):
+            with db.db_pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                    assert cur.fetchone()[0] == 1
+
+    threads = [threading.Thread(target=query) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            query()
+            os._exit(0)
+        except BaseException:
+            os._exit(1)
+    assert os.waitpid(pid, 0)[1] == 0
+    query()
+
+    stats = db.db_pool.stats()
+    print(stats)
+    assert stats["size"] <= db.db_pool.max_size and stats["checkouts"] == 180
+
+
+if __name__ == "__main__":
+    test_pool_reuses_connections_and_waits_when_exhausted()
+    test_pool_replaces_dead_and_broken_connections()
+    test_live_postgres_pool()
+    print("\n✅ SUCCESS: All connection pool checks passed!")
@@ -0,0 +1,61 @@
+"""
+Tests for the offline retrieval evaluation (evaluate_retrieval.py)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Cancer_chatbot"))
+
+from evaluate_retrieval import build_index, evaluate, failed_gates, mrr, recall_at
+
+DOCS = [
+    {"id": 0, "question": "What is lung cancer?", "answer": "Lung cancer forms in the tissues of the lung."},
+    {"id": 1, "question": "What are the stages of lung cancer?", "answer": "Stages range from 0 to IV depending on spread."},
+    {"id": 2, "question": "What is leukemia?", "answer": "Leukemia is a cancer of the blood-forming tissues.\n\nIt starts in the bone marrow."},
+    {"id": 3, "question": "How is breast cancer treated?", "answer": "Treatment includes surgery, radiation and chemotherapy."},
+]
+
+GROUND_TRUTH = [
+    {"id": 2, "question": "leukemia bone marrow"},
+    {"id": 1, "question": "stages depending on spread"},
+    {"id": 2, "question": "what is lung cancer"},
+    {"id": 0, "question": "no matching words"},
+]
+
+
+def test_metrics_from_ranks():
+    """MRR, recall@k and the gates follow the rank of the relevant document"""
+    relevance_total = [[True], [False, True], [False, False, True], []]
+    assert mrr(relevance_total) == (1 + 1 / 2 + 1 / 3) / 4
+    assert [recall_at(relevance_total, k) for k in (1, 2, 3)] == [0.25, 0.5, 0.75]
+
+    assert failed_gates({"hit_rate": 0.9, "mrr": 0.5, "latency_ms_p95": 3.0}, min_hit_rate=0.8, max_p95_ms=5) == []
+    assert len(failed_gates({"hit_rate": 0.7, "mrr": 0.5, "latency_ms_p95": 8.0}, min_hit_rate=0.8, min_mrr=0.4, max_p95_ms=5)) == 2
+
+
+def test_evaluate_in_parallel_matches_serial():
+    """Worker processes report the same quality as searching in-process; passages of a document count once"""
+    index = build_index(DOCS, passage_chars=40)
+    assert len(index.docs) > len(DOCS)
+
+    serial = evaluate(index, GROUND_TRUTH, num_results=3)
+    parallel = evaluate(index, GROUND_TRUTH, num_results=3, workers=2, chunk_size=1)
+    print(serial)
+
+    quality = ["hit_rate", "mrr", "recall@1", "recall@3"]
+    assert {k: parallel[k] for k in quality} == {k: serial[k] for k in quality}
+    assert serial["hit_rate"] == 0.75 and serial["recall@1"] == 0.5
+    assert serial["mrr"] == (1 + 1 + 1 / 2) / 4, "all three leukemia passages are one hit at rank 1"
+    assert "recall@5" not in serial, "no cutoffs beyond num_results"
+    assert serial["latency_ms_p50"] <= serial["latency_ms_p99"] and serial["queries_per_s"] > 0
+
+    usage = index.memory_usage()
+    assert usage["total"] == sum(v for k, v in usage.items() if k != "total")
+    assert serial["index_mb"] == usage["total"] / 2**20 and usage["matrices"] > 0
+
+
+if __name__ == "__main__":
+    test_metrics_from_ranks()
+    test_evaluate_in_parallel_matches_serial()
+    print("\n✅ SUCCESS: All retrieval evaluation checks passed!")
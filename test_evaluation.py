@@ -0,0 +1,129 @@
+"""
+Tests for the background relevance evaluation queue
+"""
+
+import os
+import sys
+import threading
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Cancer_chatbot")
+sys.path.insert(0, APP_DIR)
+
+from evaluation import EvaluationQueue
+
+
+def import_app():
+    # rag builds its index at import time from a path relative to Cancer_chatbot/
+    cwd = os.getcwd()
+    os.chdir(APP_DIR)
+    try:
+        import app
+        import rag
+    finally:
+        os.chdir(cwd)
+    return app, rag
+
+
+def test_queue_batches_retries_and_reports_results():
+    """Queued answers are judged in batches, failed judge calls are retried and tokens are split per answer"""
+    release = threading.Event()
+    calls = []
+    stored = []
+
+    def evaluate(items, model="gpt-oss"):
+        release.wait(5)
+        calls.append(len(items))
+        if len(calls) == 2:
+            raise RuntimeError("429 Too Many Requests")
+        evaluations = [{"Relevance": "RELEVANT", "Explanation": q} for q, _ in items]
+        return evaluations, {"prompt_tokens": 10 * len(items) + 1, "completion_tokens": 2 * len(items), "total_tokens": 12 * len(items) + 1}
+
+    evaluation_queue = EvaluationQueue(evaluate, stored.extend, workers=1, max_size=10, batch_size=3,
+                                       max_retries=2, retry_backoff=0.01)
+    for n in range(5):
+        assert evaluation_queue.submit(f"c{n}", f"question {n}", f"answer {n}")
+
+    assert evaluation_queue.stats()["depth"] >= 4
+    release.set()
+    assert evaluation_queue.join(timeout=5)
+
+    stats = evaluation_queue.stats()
+    print(calls, stats)
+    assert sorted(r["conversation_id"] for r in stored) == [f"c{n}" for n in range(5)]
+    assert all(r["relevance"] == "RELEVANT" and r["relevance_explanation"] == f"question {r['conversation_id'][1:]}" for r in stored)
+    assert max(calls) <= 3 and sum(calls) > 5, "batches of at most 3, one of them retried"
+    assert stats["retries"] == 1 and stats["completed"] == 5 and stats["failed"] == 0
+    assert stats["depth"] == 0 and stats["max_lag_seconds"] > 0
+
+    # Two successful batch calls, each reporting 10 prompt tokens per answer plus one
+    assert sum(r["eval_prompt_tokens"] for r in stored) == 10 * 5 + 2
+    assert sum(r["eval_completion_tokens"] for r in stored) == 2 * 5
+
+def test_queue_drops_when_full_and_samples():
+    """A full queue drops new answers instead of blocking, and sample_rate 0 judges nothing"""
+    release = threading.Event()
+
+    def evaluate(items, model="gpt-oss"):
+        release.wait(5)
+        return [{"Relevance": "RELEVANT", "Explanation": ""}] * len(items), {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+    evaluation_queue = EvaluationQueue(evaluate, lambda results: None, workers=1, max_size=1, batch_size=1)
+    accepted = [evaluation_queue.submit(f"c{n}", "q", "a") for n in range(4)]
+    release.set()
+    evaluation_queue.join(timeout=5)
+
+    print(accepted, evaluation_queue.stats())
+    assert accepted[0] and not accepted[-1]
+    assert evaluation_queue.stats()["dropped"] == accepted.count(False) >= 2
+
+    assert not EvaluationQueue(evaluate, None, sample_rate=0).sample()
+    assert EvaluationQueue(evaluate, None, sample_rate=1).sample()
+
+
+def test_cached_answers_reuse_the_original_verdict():
+    """Cache hits are not judged again; once the original answer is judged, hits serve its verdict"""
+    app, rag = import_app()
+    release = threading.Event()
+    calls = []
+
+    def fake_llm(prompt, model="gpt-oss", system=None):
+        calls.append("llm")
+        return "A cancer of the blood.", {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+
+    def evaluate(items, model="gpt-oss"):
+        release.wait(5)
+        calls.append(("eval", len(items)))
+        return [{"Relevance": "RELEVANT", "Explanation": "ok"}] * len(items), {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}
+
+    originals = (rag.llm, app.evaluation_queue.evaluate, app.EVAL_ASYNC)
+    rag.llm = fake_llm
+    app.evaluation_queue.evaluate = evaluate
+    app.EVAL_ASYNC = True
+    submitted = app.evaluation_queue.submitted
+    try:
+        client = app.app.test_client()
+        question = {"question": "What is leukemia judged once test?"}
+        for _ in range(3):
+            assert client.post("/question", json=question).status_code == 200
+        waiting = [c["relevance"] for c in app.in_memory_conversations[-3:]]
+        release.set()
+        assert app.evaluation_queue.join(timeout=5)
+
+        client.post("/question", json=question)
+        cached = app.in_memory_conversations[-1]
+        judged = app.in_memory_conversations[-4]
+    finally:
+        rag.llm, app.evaluation_queue.evaluate, app.EVAL_ASYNC = originals
+
+    print(calls, waiting)
+    assert calls == ["llm", ("eval", 1)], "one answer and one judge call for four identical questions"
+    assert app.evaluation_queue.submitted - submitted == 1
+    assert waiting == ["PENDING", "UNKNOWN", "UNKNOWN"], "hits before the verdict do not wait for it"
+    assert judged["relevance"] == "RELEVANT" and cached["relevance"] == "RELEVANT"
+
+
+if __name__ == "__main__":
+    test_queue_batches_retries_and_reports_results()
+    test_queue_drops_when_full_and_samples()
+    test_cached_answers_reuse_the_original_verdict()
+    print("\n✅ SUCCESS: All evaluation queue checks passed!")
@@ -0,0 +1,128 @@
+"""
+Tests for the pooled Groq clients and per-key health routing
+"""
+
+import os
+import sys
+import json
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Cancer_chatbot")
+sys.path.insert(0, APP_DIR)
+
+import groq_pool
+from groq_pool import GroqClientPool
+from rate_limit import RateLimiter, RateLimitExceeded
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = FakeResponse(status_code, headers)
+
+
+def test_pool_reuses_one_client_per_key():
+    """Every key gets one client for the life of the process"""
+    created = []
+    pool = GroqClientPool(client_factory=lambda key: created.append(key) or object())
+
+    assert pool.client("key-a") is pool.client("key-a")
+    assert pool.client("key-b") is not pool.client("key-a")
+    assert created == ["key-a", "key-b"]
+
+
+def test_rate_limited_and_failing_keys_are_tried_last():
+    """429 honours Retry-After, repeated 5xx opens the circuit, and healthy keys are ranked first"""
+    pool = GroqClientPool(client_factory=lambda key: object())
+    keys = ["primary-1111", "fallback-2222", "third-3333"]
+    assert pool.ranked(keys) == keys
+
+    pool.record_failure("primary-1111", FakeAPIError(429, {"retry-after": "120"}))
+    assert pool.ranked(keys) == ["fallback-2222", "third-3333", "primary-1111"]
+    assert pool.stats()["...1111"]["state"] == "cooldown"
+    assert 100 < pool.stats()["...1111"]["available_in"] <= 120
+
+    for _ in range(groq_pool.GROQ_CIRCUIT_FAILURES):
+        pool.record_failure("fallback-2222", FakeAPIError(503))
+    stats = pool.stats()["...2222"]
+    print(pool.stats())
+    assert stats["state"] == "open" and stats["consecutive_failures"] == groq_pool.GROQ_CIRCUIT_FAILURES
+    assert pool.ranked(keys) == ["third-3333", "fallback-2222", "primary-1111"], "the key back soonest comes first"
+
+    pool.record_failure("third-3333", FakeAPIError(400))
+    assert pool.stats()["...3333"]["state"] == "healthy", "a bad request says nothing about the key"
+
+    pool.record_success("fallback-2222", 0.5)
+    assert pool.stats()["...2222"]["state"] == "healthy"
+    pool.record_success("third-3333", 2.0)
+    assert pool.ranked(keys)[:2] == ["fallback-2222", "third-3333"], "faster keys first"
+
+
+class RateLimitedClient:
+    """A Groq client whose every call is answered with 429."""
+
+    def __init__(self, retry_after):
+        self.chat = self
+        self.completions = self
+        self.retry_after = retry_after
+
+    def create(self, **kwargs):
+        raise FakeAPIError(429, {"retry-after": self.retry_after})
+
+
+def import_app():
+    # rag builds its index at import time from a path relative to Cancer_chatbot/
+    cwd = os.getcwd()
+    os.chdir(APP_DIR)
+    try:
+        import app
+        import rag
+    finally:
+        os.chdir(cwd)
+    return app, rag
+
+
+def test_groq_429_on_every_key_sheds_the_question():
+    """When Groq rate-limits the last key too, /question answers 503 and the stream sends the busy error"""
+    app, rag = import_app()
+    retry_after = {"primary-1111": "30", "fallback-2222": "45"}
+    originals = (rag._groq_api_keys, rag.groq_pool, rag.rate_limiter)
+    rag._groq_api_keys = lambda: list(retry_after)
+    rag.groq_pool = GroqClientPool(client_factory=lambda key: RateLimitedClient(retry_after[key]))
+    rag.rate_limiter = RateLimiter(rpm=0, tpm=0)
+    try:
+        try:
+            rag.llm_groq("What is leukemia?")
+        except RateLimitExceeded as e:
+            print(f"  raised: {e}")
+            assert 25 < e.retry_after <= 30, "retry once the first key has rested"
+            assert e.__cause__.status_code == 429
+        else:
+            raise AssertionError("expected RateLimitExceeded")
+
+        rag.groq_pool = GroqClientPool(client_factory=lambda key: RateLimitedClient(retry_after[key]))
+        client = app.app.test_client()
+        response = client.post("/question", json={"question": "What is leukemia rate limited test?"})
+        assert response.status_code == 503 and response.headers["Retry-After"] == "30"
+        assert response.get_json()["retry_after"] == 30
+
+        rag.groq_pool = GroqClientPool(client_factory=lambda key: RateLimitedClient(retry_after[key]))
+        body = client.post("/question/stream", json={"question": "What is leukemia rate limited test?"}).get_data(as_text=True)
+    finally:
+        rag._groq_api_keys, rag.groq_pool, rag.rate_limiter = originals
+
+    last = body.strip().split("\n\n")[-1].split("\n")
+    assert last[0] == "event: error" and json.loads(last[1][len("data: "):])["error"] == app.BUSY_MESSAGE
+
+
+if __name__ == "__main__":
+    test_pool_reuses_one_client_per_key()
+    test_rate_limited_and_failing_keys_are_tried_last()
+    test_groq_429_on_every_key_sheds_the_question()
+    print("\n✅ SUCCESS: All Groq pool checks passed!")
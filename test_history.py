@@ -0,0 +1,172 @@
+"""
+Tests for keyset (cursor) pagination of /history, served from the in-memory store, and for migrating
+an existing database.
+
+The live test needs a Postgres server, e.g. the one from docker-compose (it recreates the tables):
+
+    docker compose up -d postgres
+    TEST_POSTGRES=1 POSTGRES_HOST=localhost python test_history.py
+"""
+
+import os
+import sys
+import uuid
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(ROOT, "Cancer_chatbot")
+
+
+def import_app():
+    # rag builds its index at import time from a path relative to Cancer_chatbot/
+    sys.path.insert(0, APP_DIR)
+    cwd = os.getcwd()
+    os.chdir(APP_DIR)
+    try:
+        import app
+        import db
+    finally:
+        os.chdir(cwd)
+    return app, db
+
+
+def test_cursor_round_trip():
+    """Cursors decode to the (timestamp, id) they were made from; garbage is rejected"""
+    _, db = import_app()
+    from datetime import datetime, timezone
+
+    stamp = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    assert db.decode_cursor(db.encode_cursor(stamp, "abc")) == (stamp.isoformat(), "abc")
+
+    for bad in ["not-a-cursor", db.encode_cursor("yesterday", "abc")]:
+        try:
+            db.decode_cursor(bad)
+            assert False, f"{bad} should be rejected"
+        except ValueError:
+            pass
+
+
+def test_history_pages_through_every_conversation_once():
+    """Following next_cursor visits all conversations newest first, without gaps or repeats"""
+    app, db = import_app()
+    saved = list(app.in_memory_conversations)
+    app.in_memory_conversations[:] = [
+        {"id": f"c{n:02d}", "question": f"q{n}", "answer": "a", "model_used": "gpt-oss",
+         "relevance": "RELEVANT" if n % 3 == 0 else "UNKNOWN",
+         # pairs of conversations share a timestamp; the id breaks the tie
+         "timestamp": f"2024-05-01T12:00:{n // 2:02d}", "sources": []}
+        for n in range(11)
+    ]
+    try:
+        client = app.app.test_client()
+        seen = []
+        cursor = None
+        pages = 0
+        while True:
+            response = client.get("/history", query_string={"limit": 4, **({"cursor": cursor} if cursor else {})})
+            assert response.status_code == 200
+            body = response.get_json()
+            seen.extend(c["id"] for c in body["conversations"])
+            pages += 1
+            cursor = body["next_cursor"]
+            if cursor is None:
+                break
+
+        print(seen)
+        assert seen == [f"c{n:02d}" for n in reversed(range(11))]
+        assert pages == 3
+
+        relevant = client.get("/history", query_string={"relevance": "RELEVANT"}).get_json()
+        assert [c["id"] for c in relevant["conversations"]] == ["c09", "c06", "c03", "c00"]
+
+        assert client.get("/history", query_string={"cursor": "garbage"}).status_code == 400
+    finally:
+        app.in_memory_conversations[:] = saved
+
+
+def test_database_cursor_pages_the_in_memory_store():
+    """A UTC cursor (as the database issues them) is compared as a time with the naive local in-memory timestamps"""
+    app, db = import_app()
+    from datetime import datetime, timezone
+
+    stamps = [datetime(2024, 5, 1, 12, 0, n, tzinfo=timezone.utc) for n in range(6)]
+    saved = list(app.in_memory_conversations)
+    app.in_memory_conversations[:] = [
+        {"id": f"c{n}", "question": f"q{n}", "answer": "a", "model_used": "gpt-oss", "relevance": "UNKNOWN",
+         "timestamp": stamp.astimezone().replace(tzinfo=None).isoformat(), "sources": []}
+        for n, stamp in enumerate(stamps)
+    ]
+    try:
+        client = app.app.test_client()
+        cursor = db.encode_cursor(stamps[3], "c3")
+        body = client.get("/history", query_string={"cursor": cursor}).get_json()
+        assert [c["id"] for c in body["conversations"]] == ["c2", "c1", "c0"]
+    finally:
+        app.in_memory_conversations[:] = saved
+
+
+def test_live_postgres_migrates_the_original_schema():
+    """migrate() upgrades the tables of the first release so conversations can be saved again (TEST_POSTGRES=1)"""
+    if os.getenv("TEST_POSTGRES") != "1":
+        print("  TEST_POSTGRES not set, skipping")
+        return
+
+    _, db = import_app()
+    db.USE_DB = True
+    db.DB_WRITE_BEHIND = False
+    with db.db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS feedback, conversations, schema_migrations, metrics_minute, metrics_hour, metrics_dirty")
+            cur.execute("""
+                CREATE TABLE conversations (
+                    id TEXT PRIMARY KEY,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    model_used TEXT NOT NULL,
+                    response_time FLOAT NOT NULL,
+                    relevance TEXT NOT NULL,
+                    relevance_explanation TEXT NOT NULL,
+                    prompt_tokens INTEGER NOT NULL,
+                    completion_tokens INTEGER NOT NULL,
+                    total_tokens INTEGER NOT NULL,
+                    eval_prompt_tokens INTEGER NOT NULL,
+                    eval_completion_tokens INTEGER NOT NULL,
+                    eval_total_tokens INTEGER NOT NULL,
+                    openai_cost FLOAT NOT NULL,
+                    timestamp TIMESTAMP WITH TIME ZONE NOT NULL
+                )
+            """)
+            cur.execute("""
+                CREATE TABLE feedback (
+                    id SERIAL PRIMARY KEY,
+                    conversation_id TEXT REFERENCES conversations(id),
+                    feedback INTEGER NOT NULL,
+                    timestamp TIMESTAMP WITH TIME ZONE NOT NULL
+                )
+            """)
+        conn.commit()
+
+    db.migrate()
+    db.migrate()  # a second run applies nothing
+
+    conversation_id = str(uuid.uuid4())
+    db.save_conversation(conversation_id, "q", {
+        "answer": "a", "model_used": "gpt-oss", "response_time": 1.5, "first_token_time": 0.25,
+        "relevance": "RELEVANT", "relevance_explanation": "", "prompt_tokens": 10, "completion_tokens": 5,
+        "total_tokens": 15, "eval_prompt_tokens": 0, "eval_completion_tokens": 0, "eval_total_tokens": 0,
+        "openai_cost": 0.0,
+    })
+    with db.db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT first_token_time FROM conversations WHERE id = %s", (conversation_id,))
+            assert cur.fetchone() == (0.25,)
+            cur.execute("SELECT version FROM schema_migrations ORDER BY version")
+            assert [row[0] for row in cur.fetchall()] == [version for version, _, _ in db.MIGRATIONS]
+    assert db.refresh_rollups() == 1
+
+
+if __name__ == "__main__":
+    test_cursor_round_trip()
+    test_database_cursor_pages_the_in_memory_store()
+    test_history_pages_through_every_conversation_once()
+    test_live_postgres_migrates_the_original_schema()
+    print("\n✅ SUCCESS: All history pagination checks passed!")
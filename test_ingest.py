@@ -0,0 +1,111 @@
+"""
+Tests for splitting long knowledge base answers into passages at ingest
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Cancer_chatbot"))
+
+from ingest import split_passages, chunk_documents, top_documents, search_documents, build_index_in_subprocess
+
+ANSWER = """Key Points
+                    - Lung cancer forms in the tissues of the lung.    - Smoking is the major risk factor.
+
+
+                    Stage I lung cancer is found only in the lung. It has not spread to lymph nodes. Surgery may be used. Radiation therapy may follow surgery. Chemotherapy is sometimes given.
+
+
+                    Stage IV lung cancer has spread to other organs. Treatment aims to control the disease. Clinical trials may be an option.
+                """
+
+
+def test_split_passages_respects_sections_and_budget():
+    """Passages stay under the budget, keep whole sections together and overlap when a section is cut"""
+    passages = split_passages(ANSWER, max_chars=150, overlap_chars=60)
+
+    for passage in passages:
+        print(f"  [{len(passage)}] {passage}")
+        assert len(passage) <= 150
+        assert "  " not in passage and "\n" not in passage
+
+    assert passages[0].startswith("Key Points")
+    assert any(p.startswith("Stage IV") for p in passages), "short sections should start a fresh passage"
+
+    overlapping = [p for p in passages if "Radiation therapy may follow surgery." in p]
+    assert len(overlapping) == 2, "a section cut mid-way should repeat its trailing sentences"
+
+    assert split_passages(ANSWER, max_chars=10_000, overlap_chars=60) == [" ".join(ANSWER.split())]
+    assert split_passages("", max_chars=150) == []
+
+
+def test_chunk_documents_keeps_parent_id():
+    """Every passage keeps the parent's fields and id and gets its own passage_id"""
+    docs = [{"id": 7, "question": "What is lung cancer?", "answer": ANSWER, "topic": "cancer"}]
+    passages = chunk_documents(docs, max_chars=150, overlap_chars=60)
+
+    assert len(passages) > 1
+    assert [p["passage_id"] for p in passages] == [f"7-{n}" for n in range(len(passages))]
+    assert all(p["id"] == 7 and p["question"] == "What is lung cancer?" for p in passages)
+
+
+def test_split_passages_without_budget_keeps_whole_answer():
+    """max_chars <= 0 makes the whole answer one passage instead of splitting it word by word"""
+    assert split_passages("Hello there world. This is a test.", max_chars=0) == ["Hello there world. This is a test."]
+    assert split_passages(ANSWER, max_chars=-1) == [ANSWER]
+    assert split_passages("  ", max_chars=0) == []
+
+    docs = [{"id": 7, "question": "What is lung cancer?", "answer": ANSWER}]
+    assert chunk_documents(docs, max_chars=0) == [{**docs[0], "passage_id": "7-0"}]
+
+
+class FakeIndex:
+    def __init__(self, passages):
+        self.passages = passages
+        self.calls = []
+
+    def search(self, query, num_results=10, **options):
+        self.calls.append((query, num_results, options))
+        return self.passages[:num_results]
+
+
+def test_search_documents_ranks_documents_by_best_passage():
+    """Passages of one answer do not crowd out other answers: the cut is on documents, not passages"""
+    passages = [{"id": doc_id, "passage_id": f"{doc_id}-{n}"}
+                for doc_id, n in [(1, 0), (1, 1), (1, 2), (2, 0), (1, 3), (3, 0), (2, 1), (4, 0)]]
+    assert [p["passage_id"] for p in top_documents(passages, 2)] == ["1-0", "1-1", "1-2", "2-0", "1-3", "2-1"]
+
+    index = FakeIndex(passages)
+    results = search_documents(index, "lung", num_results=3, depth=4, boost_dict={"question": 2})
+    assert index.calls == [("lung", 12, {"boost_dict": {"question": 2}})]
+    assert list(dict.fromkeys(p["id"] for p in results)) == [1, 2, 3]
+
+
+def test_subprocess_build_writes_the_snapshot():
+    """A rebuild in a subprocess replaces the snapshot in place; an index mapped from the old one stays readable"""
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path, snapshot_path = os.path.join(tmp, "data.csv"), os.path.join(tmp, "snapshot")
+        with open(data_path, "w") as f:
+            f.write("id,question,answer\n0,What is lung cancer?,Lung cancer forms in the lung.\n")
+
+        first = build_index_in_subprocess(data_path, snapshot_path)
+        assert os.path.exists(os.path.join(snapshot_path, "meta.json"))
+        assert [d["id"] for d in first.search("lung")] == [0]
+
+        with open(data_path, "a") as f:
+            f.write("1,What is leukemia?,A cancer of the blood.\n")
+        second = build_index_in_subprocess(data_path, snapshot_path)
+
+        assert [d["id"] for d in second.search("leukemia")] == [1]
+        assert [d["id"] for d in first.search("lung")] == [0], "the replaced snapshot's mapped files are still readable"
+        assert sorted(os.listdir(tmp)) == ["data.csv", "snapshot"], "no temporary or old snapshot is left behind"
+
+
+if __name__ == "__main__":
+    test_split_passages_respects_sections_and_budget()
+    test_chunk_documents_keeps_parent_id()
+    test_split_passages_without_budget_keeps_whole_answer()
+    test_search_documents_ranks_documents_by_best_passage()
+    test_subprocess_build_writes_the_snapshot()
+    print("\n✅ SUCCESS: All ingest checks passed!")
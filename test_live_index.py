@@ -0,0 +1,119 @@
+"""
+Tests for the live search index holder (Cancer_chatbot/live_index.py)
+"""
+
+import os
+import gc
+import sys
+import weakref
+import tempfile
+from time import sleep
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Cancer_chatbot"))
+
+import minsearch
+from cache import LRUCache, RetrievalCache
+from ingest import apply_changes
+from live_index import IndexReloader, LiveIndex
+
+DOCS = [
+    {"id": 0, "question": "What is lung cancer?", "answer": "Lung cancer forms in the tissues of the lung."},
+    {"id": 1, "question": "What are the stages of lung cancer?", "answer": "Stages range from 0 to IV depending on spread."},
+    {"id": 2, "question": "What is leukemia?", "answer": "Leukemia is a cancer of the blood-forming tissues."},
+]
+SKIN = {"id": 3, "question": "What causes skin cancer?", "answer": "Ultraviolet radiation from the sun is the main cause."}
+
+
+def build_index():
+    return minsearch.Index(text_fields=["question", "answer"], keyword_fields=["id"]).fit(DOCS)
+
+
+def result_ids(results):
+    return [doc["id"] for doc in results]
+
+
+def test_reloader_swaps_in_a_changed_knowledge_base():
+    """A settled change to the watched file is loaded and swapped in; the old index is freed after its last search"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "data.csv")
+        with open(path, "w") as f:
+            f.write("id,question,answer\n0,What is lung cancer?,Lung cancer forms in the lung.\n")
+
+        def load():
+            if "fail" in open(path).read():
+                raise ValueError("bad CSV")
+            return minsearch.Index(text_fields=["question", "answer"], keyword_fields=["id"]).fit(
+                pd.read_csv(path).to_dict(orient="records"))
+
+        live = LiveIndex(load())
+        reloader = IndexReloader(live, load, [path], interval=0)
+        swaps = []
+        live.on_swap.append(lambda index, version: swaps.append(version))
+        first_version = live.version
+        in_flight = live.current
+        old = weakref.ref(live.current)
+        assert reloader.check() is False, "nothing changed"
+
+        with open(path, "w") as f:
+            f.write("id,question,answer\n0,What is leukemia?,A cancer of the blood.\n")
+        assert reloader.check() is False, "changed since the last check, may still be being written"
+        assert reloader.check() is True
+
+        assert result_ids(live.search("leukemia")) == [0] and live.search("lung") == []
+        assert result_ids(in_flight.search("lung")) == [0], "a search holding the old index finishes on it"
+        assert live.version != first_version and swaps == [live.version]
+        del in_flight
+        gc.collect()
+        assert old() is None, "nothing else keeps the old index alive"
+
+        with open(path, "a") as f:
+            f.write("1,fail,fail\n")
+        reloader.check()
+        assert reloader.check() is False and reloader.check() is False, "a failed load is not retried"
+        stats = reloader.stats()
+        print(stats)
+        assert stats["reloads"] == 1 and stats["failures"] == 1 and "bad CSV" in stats["last_error"]
+        assert result_ids(live.search("leukemia")) == [0]
+
+
+def test_corrections_reach_the_live_index_through_the_snapshot():
+    """ingest --upsert/--delete style corrections saved to the snapshot are swapped in with a new version"""
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = os.path.join(tmp, "snapshot")
+        build_index().save(snapshot)
+        load = lambda: minsearch.Index.load(snapshot, mmap=False)
+
+        live = LiveIndex(load())
+        reloader = IndexReloader(live, load, [os.path.join(snapshot, "meta.json")], interval=0)
+        results = RetrievalCache(entries=LRUCache(max_size=10, ttl=3600), version=live.version)
+        live.on_swap.append(lambda index, version: setattr(results, "version", version))
+        results.set("lung", live.search("lung"))
+
+        corrected = apply_changes(load(), [SKIN], [0, 1], refit_after=0)
+        assert corrected.changes_since_fit == 3
+        sleep(0.01)
+        corrected.save(snapshot)
+        reloader.check()
+        assert reloader.check() is True
+
+        assert results.get("lung") is None, "the new version made the cached results stale"
+        assert live.search("lung") == [] and result_ids(live.search("leukemia")) == [2]
+        assert live.stats()["replacements"] == 1 and live.stats()["docs"] == 2
+
+
+def test_apply_changes_refits_after_enough_changes():
+    """Corrections only use the fitted vocabulary until enough of them pile up to refit"""
+    index = apply_changes(build_index(), [SKIN], refit_after=2)
+    assert index.changes_since_fit == 1 and index.search("sun") == []
+
+    index = apply_changes(index, delete_ids=[0], refit_after=2)
+    assert index.changes_since_fit == 0 and len(index.docs) == 3
+    assert result_ids(index.search("sun")) == [3], "the refit learned the words of the added entry"
+
+
+if __name__ == "__main__":
+    test_reloader_swaps_in_a_changed_knowledge_base()
+    test_corrections_reach_the_live_index_through_the_snapshot()
+    test_apply_changes_refits_after_enough_changes()
@@ -0,0 +1,89 @@
+"""
+Tests for the load generator (load_test.py) and the stub Groq API it runs against
+"""
+
+import os
+import json
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from load_test import LoadTest, load_sessions
+from stub_groq import StubGroqServer
+
+
+class FakeQuestionHandler(BaseHTTPRequestHandler):
+    """Answers /question with the number of earlier turns it was sent, or 503 for questions about lymphoma."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.histories.append(len(body.get("conversation_history", [])))
+        status = 503 if "lymphoma" in body["question"] else 200
+        data = json.dumps({"answer": "ok"}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def test_stub_groq_answers_429_over_the_rpm():
+    """Each API key gets rpm requests per sliding minute; the next one is a 429 with retry-after"""
+    stub = StubGroqServer(("127.0.0.1", 0), latency=0, rpm=2).start()
+    try:
+        def ask(key):
+            return requests.post(f"{stub.url}/openai/v1/chat/completions", headers={"Authorization": f"Bearer {key}"},
+                                 json={"model": "m", "messages": [{"role": "user", "content": "hi"}]}, timeout=5)
+
+        statuses = [ask("a").status_code for _ in range(3)]
+        limited = ask("a")
+        other = ask("b")
+    finally:
+        stub.shutdown()
+
+    print(statuses, limited.headers.get("retry-after"))
+    assert statuses == [200, 200, 429]
+    assert limited.json()["error"]["code"] == "rate_limit_exceeded" and int(limited.headers["retry-after"]) >= 1
+    assert other.status_code == 200, "limits are per API key"
+    assert stub.rate_limited == 2
+
+
+def test_open_loop_sessions_report():
+    """Open-loop sessions send their earlier turns, stop at the first error and are reported per turn"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ground-truth.csv")
+        with open(path, "w") as f:
+            f.write("id,question\n1,what is leukemia\n1,how is leukemia treated\n1,is leukemia inherited\n"
+                    "2,what is lymphoma\n2,how is lymphoma treated\n")
+        sessions = load_sessions(path, turns=2, seed=0)
+
+    assert sorted(len(s) for s in sessions) == [2, 2]
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeQuestionHandler)
+    server.histories = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        test = LoadTest(f"http://127.0.0.1:{server.server_address[1]}", sessions, seed=0)
+        wall = test.open_loop(rate=40, duration=0.5, max_in_flight=8)
+    finally:
+        server.shutdown()
+
+    report = test.report(wall)
+    print(json.dumps(report, indent=2))
+    assert report["sessions"] > 5
+    assert report["errors_by_status"] == {"503": report["errors"]}
+    assert report["requests"] == report["ok"] + report["errors"]
+    assert report["ok"] == 2 * (report["sessions"] - report["errors"]), "a failed first turn ends the session"
+    assert set(report["latency_by_turn_s"]) == {"1", "2"}
+    assert sorted(set(server.histories)) == [0, 2], "the second turn carries the first question and answer"
+    assert report["latency_s"]["p50"] <= report["latency_s"]["p99"] <= report["latency_s"]["max"]
+
+
+if __name__ == "__main__":
+    test_stub_groq_answers_429_over_the_rpm()
+    test_open_loop_sessions_report()
+    print("\n✅ SUCCESS: All load test checks passed!")
@@ -0,0 +1,308 @@
+"""
+Tests for the minsearch index used by the RAG pipeline
+"""
+
+import os
+import sys
+import math
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Cancer_chatbot"))
+
+import minsearch
+
+DOCS = [
+    {"id": 0, "question": "What is lung cancer?", "answer": "Lung cancer forms in the tissues of the lung.", "topic": "lung"},
+    {"id": 1, "question": "What are the stages of lung cancer?", "answer": "Stages range from 0 to IV depending on spread.", "topic": "lung"},
+    {"id": 2, "question": "What is leukemia?", "answer": "Leukemia is a cancer of the blood-forming tissues.", "topic": "blood"},
+    {"id": 3, "question": "How is breast cancer treated?", "answer": "Treatment includes surgery, radiation and chemotherapy.", "topic": "breast"},
+    {"id": 4, "question": "What causes skin cancer?", "answer": "Ultraviolet radiation from the sun is the main cause.", "topic": "skin"},
+]
+
+QUERIES = [
+    "lung cancer stages",
+    "blood cancer",
+    "radiation treatment for breast cancer",
+    "what causes cancer",
+    "unrelated words only",
+]
+
+
+def build_index(**kwargs):
+    return minsearch.Index(text_fields=["question", "answer"], keyword_fields=["id", "topic"], **kwargs).fit(DOCS)
+
+
+def result_ids(results):
+    return [doc["id"] for doc in results]
+
+
+def test_snapshot_roundtrip():
+    """A saved and memory-mapped snapshot returns the same results as the fitted index"""
+    index = build_index()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snapshot")
+        index.save(path)
+        loaded = minsearch.Index.load(path)
+
+        for query in QUERIES:
+            expected = result_ids(index.search(query, num_results=3))
+            actual = result_ids(loaded.search(query, num_results=3))
+            print(f"  {query!r}: {actual}")
+            assert actual == expected
+
+        assert result_ids(loaded.search("cancer", filter_dict={"topic": "lung"}, num_results=3)) == [0, 1]
+
+
+def test_inverted_engine_matches_dense():
+    """The posting-list engine ranks documents exactly like the dense cosine engine"""
+    dense = build_index()
+    inverted = build_index(engine="inverted")
+
+    for query in QUERIES:
+        for boost in ({}, {"question": 3.0, "answer": 0.5}):
+            expected = result_ids(dense.search(query, boost_dict=boost, num_results=3))
+            actual = result_ids(inverted.search(query, boost_dict=boost, num_results=3))
+            assert actual == expected, (query, boost, actual, expected)
+
+    assert result_ids(inverted.search("cancer", filter_dict={"topic": "lung"}, num_results=3)) == [0, 1]
+    assert inverted.search("unrelated words only", num_results=3) == []
+
+
+def test_search_batch_matches_search():
+    """Batched search returns the same ranked documents as looping over search"""
+    for engine in ("dense", "inverted"):
+        index = build_index(engine=engine)
+        boost = {"question": 2.0}
+
+        batched = index.search_batch(QUERIES, boost_dict=boost, num_results=3, chunk_size=2)
+        assert len(batched) == len(QUERIES)
+        for query, results in zip(QUERIES, batched):
+            assert result_ids(results) == result_ids(index.search(query, boost_dict=boost, num_results=3))
+
+        filtered = index.search_batch(QUERIES, filter_dict={"topic": "lung"}, num_results=3)
+        for query, results in zip(QUERIES, filtered):
+            assert result_ids(results) == result_ids(index.search(query, filter_dict={"topic": "lung"}, num_results=3))
+
+
+def test_ranked_rows_batch_matches_ranked_rows():
+    """Batched ranked rows hold the same rows and scores as ranked_rows query by query"""
+    for engine in ("dense", "inverted"):
+        index = build_index(engine=engine, retrieval="hybrid", lsa_params={"dims": 3})
+        index.delete([2])
+        for filter_dict in ({}, {"topic": "lung"}):
+            batched = index.ranked_rows_batch(QUERIES, filter_dict, {"question": 2.0}, 3, ("lexical", "lsa"), chunk_size=2)
+            assert len(batched) == len(QUERIES)
+            for query, ranked in zip(QUERIES, batched):
+                expected = index.ranked_rows(query, filter_dict, {"question": 2.0}, 3, ("lexical", "lsa"))
+                for ranking, (rows, scores) in expected.items():
+                    assert ranked[ranking][0].tolist() == rows.tolist()
+                    assert np.allclose(ranked[ranking][1], scores, atol=1e-6)
+
+    assert build_index().ranked_rows_batch(QUERIES[:2], {"topic": "none"}, rankings=("lexical",))[0]["lexical"][0].size == 0
+
+
+def test_keyword_filters():
+    """Single-value, multi-value (IN) and negated keyword filters select the right candidate rows"""
+    for engine in ("dense", "inverted"):
+        index = build_index(engine=engine)
+
+        in_filter = {"topic": ["lung", "blood"]}
+        assert sorted(result_ids(index.search("cancer", filter_dict=in_filter, num_results=5))) == [0, 1, 2]
+
+        not_filter = {"topic": minsearch.Not(["lung", "blood"])}
+        assert sorted(result_ids(index.search("cancer", filter_dict=not_filter, num_results=5))) == [3, 4]
+
+        combined = {"topic": "lung", "id": minsearch.Not(0)}
+        assert result_ids(index.search("lung cancer", filter_dict=combined, num_results=5)) == [1]
+
+        assert index.search("cancer", filter_dict={"topic": "missing"}, num_results=5) == []
+        assert index.search_batch(["cancer", "lung"], filter_dict={"topic": "missing"}) == [[], []]
+
+        batched = index.search_batch(QUERIES, filter_dict=not_filter, num_results=3)
+        for query, results in zip(QUERIES, batched):
+            assert result_ids(results) == result_ids(index.search(query, filter_dict=not_filter, num_results=3))
+
+
+def test_bm25_scorer():
+    """BM25 ranks like a hand-computed Okapi BM25 and behaves the same across engines, batches and snapshots"""
+    k1, b = 1.2, 0.75
+    index = minsearch.Index(text_fields=["answer"], keyword_fields=["id"], scorer="bm25").fit(DOCS)
+
+    analyzer = index.vectorizers["answer"].build_analyzer()
+    tokens = [analyzer(doc["answer"]) for doc in DOCS]
+    avg_length = sum(len(t) for t in tokens) / len(tokens)
+
+    def bm25(query):
+        scores = []
+        for doc_tokens in tokens:
+            score = 0.0
+            for term in set(analyzer(query)):
+                tf = doc_tokens.count(term)
+                n = sum(term in t for t in tokens)
+                idf = math.log(1 + (len(tokens) - n + 0.5) / (n + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc_tokens) / avg_length))
+            scores.append(score)
+        return scores
+
+    for query in QUERIES:
+        expected = bm25(query)
+        best = sorted((round(score, 5) for score in expected if score > 0), reverse=True)
+        returned = [round(expected[i], 5) for i in result_ids(index.search(query, num_results=5))]
+        assert returned == best[:5], query
+
+    dense = build_index(scorer="bm25")
+    inverted = build_index(scorer="bm25", engine="inverted")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snapshot")
+        inverted.save(path)
+        loaded = minsearch.Index.load(path)
+        assert loaded.scorer == "bm25"
+
+        batched = dense.search_batch(QUERIES, boost_dict={"question": 2.0}, num_results=3)
+        for query, results in zip(QUERIES, batched):
+            expected = result_ids(dense.search(query, boost_dict={"question": 2.0}, num_results=3))
+            assert result_ids(inverted.search(query, boost_dict={"question": 2.0}, num_results=3)) == expected
+            assert result_ids(loaded.search(query, boost_dict={"question": 2.0}, num_results=3)) == expected
+            assert result_ids(results) == expected
+
+
+def test_lsa_and_hybrid_retrieval():
+    """LSA vectors are contiguous unit rows, honour filters, survive int8 and snapshots, and fuse with lexical ranks"""
+    index = build_index(retrieval="hybrid", lsa_params={"dims": 3})
+    vectors = index.lsa_vectors["answer"]
+    assert vectors.dtype == np.float32 and vectors.flags["C_CONTIGUOUS"] and vectors.shape == (len(DOCS), 3)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1, atol=1e-5)
+
+    for query in QUERIES[:4]:
+        lexical = result_ids(index.search(query, num_results=5, retrieval="lexical"))
+        lsa = result_ids(index.search(query, num_results=5, retrieval="lsa"))
+        hybrid = result_ids(index.search(query, num_results=3))
+        print(f"  {query!r}: lexical {lexical}, lsa {lsa}, hybrid {hybrid}")
+        assert hybrid == result_ids(index.search(query, num_results=3, retrieval="hybrid"))
+        assert set(hybrid) <= set(lexical) | set(lsa)
+        if lexical[0] == lsa[0]:
+            assert hybrid[0] == lexical[0], "a document ranked first by both is first after fusion"
+
+    filtered = index.search("cancer", filter_dict={"topic": "lung"}, num_results=3, retrieval="lsa")
+    assert set(result_ids(filtered)) <= {0, 1}
+
+    quantized = build_index(retrieval="hybrid", lsa_params={"dims": 3, "quantize": True})
+    assert quantized.lsa_vectors["answer"].dtype == np.int8
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snapshot")
+        quantized.save(path)
+        loaded = minsearch.Index.load(path)
+    for query in QUERIES[:4]:
+        expected = result_ids(index.search(query, num_results=3, retrieval="lsa"))
+        assert result_ids(quantized.search(query, num_results=3, retrieval="lsa")) == expected
+        assert result_ids(loaded.search(query, num_results=3)) == result_ids(quantized.search(query, num_results=3))
+
+    try:
+        build_index().search("cancer", retrieval="lsa")
+    except ValueError as e:
+        print(f"  rejected: {e}")
+    else:
+        raise AssertionError("expected ValueError for LSA retrieval without LSA vectors")
+
+
+def test_snapshot_rejects_other_format_version():
+    """Snapshots written by a different format version are refused"""
+    index = build_index()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snapshot")
+        index.save(path)
+
+        meta_path = os.path.join(path, "meta.json")
+        with open(meta_path) as f:
+            meta = f.read()
+        with open(meta_path, "w") as f:
+            f.write(meta.replace(f'"format_version": {minsearch.SNAPSHOT_FORMAT_VERSION}', '"format_version": -1'))
+
+        try:
+            minsearch.Index.load(path)
+        except ValueError as e:
+            print(f"  rejected: {e}")
+        else:
+            raise AssertionError("expected ValueError for mismatched format version")
+
+
+def test_add_delete_update_without_refit():
+    """Changes apply without refitting, with the vocabulary of the fit, identically across engines and merges"""
+    corrected = {**DOCS[2], "answer": "Leukemia starts in the bone marrow and is treated with radiation."}
+    for scorer in minsearch.SCORERS:
+        indexes = {}
+        for engine in minsearch.SEARCH_ENGINES:
+            fitted = minsearch.Index(text_fields=["question", "answer"], keyword_fields=["id", "topic"],
+                                     engine=engine, scorer=scorer, retrieval="hybrid").fit(DOCS[:4])
+            index = fitted.copy().add(DOCS[4:])
+            assert index.delete([3]) == 1 and index.delete(3) == 0
+            index.update([corrected])
+            assert len(fitted.docs) == 4 and fitted.deleted is None, "copies leave the original alone"
+            indexes[engine] = index
+
+        dense, inverted = indexes["dense"], indexes["inverted"]
+        assert len(dense.docs) == 6 and int(dense.deleted.sum()) == 2 and dense.changes_since_fit == 4
+        assert inverted.postings_delta["answer"].shape[0] == 2, "the added and the updated entry"
+
+        for mode in minsearch.RETRIEVAL_MODES:
+            assert 3 not in result_ids(dense.search("breast cancer treated with radiation", retrieval=mode))
+        def search(index, query):
+            return result_ids(index.search(query, retrieval="lexical"))
+
+        assert search(dense, "radiation") == search(inverted, "radiation")
+        assert sorted(search(dense, "radiation")) == [2, 4]
+        assert search(dense, "blood") == [], "the old passage of an updated entry is gone"
+        assert search(dense, "skin") == [], "words unseen at fit are not searchable until refit"
+
+        queries = QUERIES + ["radiation"]
+        batch = inverted.search_batch(queries, retrieval="lexical")
+        assert [result_ids(r) for r in batch] == [search(inverted, q) for q in queries]
+
+        merged = inverted.copy().merge()
+        assert len(merged.docs) == 4 and merged.deleted is None and not merged.postings_delta
+        for query in queries:
+            for mode in minsearch.RETRIEVAL_MODES:
+                assert merged.search(query, retrieval=mode) == inverted.search(query, retrieval=mode), (scorer, query)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "snapshot")
+            inverted.save(path)
+            loaded = minsearch.Index.load(path)
+        assert len(loaded.docs) == 4 and loaded.changes_since_fit == 4
+        assert search(loaded, "radiation") == search(inverted, "radiation")
+
+        refitted = dense.refit()
+        assert refitted.changes_since_fit == 0 and len(refitted.docs) == 4
+        assert search(refitted, "skin") == [4]
+
+
+def test_merge_after_merge_rows_changes():
+    """Enough added or deleted rows merge on their own, dropping the deleted ones"""
+    index = build_index(engine="inverted")
+    index.merge_rows = 2
+    index.delete([0])
+    assert index.deleted is not None and len(index.docs) == 5
+    index.add([{**DOCS[0], "id": 5}])
+    assert index.deleted is not None and "question" in index.postings_delta
+    index.delete([1])
+    assert index.deleted is None and len(index.docs) == 4 and not index.postings_delta
+    assert result_ids(index.search("lung")) == [5]
+    assert result_ids(index.search("cancer", filter_dict={"id": [0, 1, 5]})) == [5]
+
+
+if __name__ == "__main__":
+    test_snapshot_roundtrip()
+    test_inverted_engine_matches_dense()
+    test_search_batch_matches_search()
+    test_ranked_rows_batch_matches_ranked_rows()
+    test_keyword_filters()
+    test_bm25_scorer()
+    test_lsa_and_hybrid_retrieval()
+    test_add_delete_update_without_refit()
+    test_merge_after_merge_rows_changes()
+    test_snapshot_rejects_other_format_version()
+    print("\n✅ SUCCESS: All minsearch checks passed!")
@@ -2,6 +2,11 @@
 Simple test to verify the build_prompt function correctly includes conversation history
 """
 
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
 def test_build_prompt_with_history():
     """Test that build_prompt properly formats conversation history"""
     
@@ -98,5 +103,43 @@ CONTEXT:
     
     return prompt
 
+def test_pack_context_respects_token_budget():
+    """pack_context fills CONTEXT greedily within the token budget and drops repeated passages"""
+    # rag builds its index at import time from a path relative to Cancer_chatbot/
+    app_dir = os.path.join(ROOT, "Cancer_chatbot")
+    sys.path.insert(0, app_dir)
+    cwd = os.getcwd()
+    os.chdir(app_dir)
+    try:
+        import rag
+    finally:
+        os.chdir(cwd)
+
+    passages = [
+        {"id": 1, "question": "What is stage 4 lung cancer?", "topic": "cancer",
+         "answer": "Stage 4 is the most advanced stage. Cancer has spread to distant organs."},
+        {"id": 2, "question": "What is lung cancer?", "topic": "cancer",
+         "answer": "Lung cancer forms in the tissues of the lung. " * 40},
+        {"id": 1, "question": "What is stage 4 lung cancer?", "topic": "cancer",
+         "answer": "Cancer has spread to distant organs. Treatment aims to control symptoms."},
+        {"id": 3, "question": "What is lung cancer? (duplicate)", "topic": "cancer",
+         "answer": "Lung cancer forms in the tissues of the lung. " * 40},
+    ]
+
+    context, stats = rag.pack_context(passages, token_budget=200)
+    print(context)
+    print(stats)
+
+    assert stats["context_tokens"] <= 200
+    assert stats["context_candidates"] == 2, "passages of one document merge and duplicate answers are dropped"
+    assert context.count("Cancer has spread to distant organs.") == 1
+    assert "Treatment aims to control symptoms." in context
+    assert "What is lung cancer?" in context and " ...\ntopic: cancer" in context, "the long entry is truncated"
+
+    prompt, prompt_stats = rag.build_prompt("What is stage 4?", passages, token_budget=200, return_stats=True)
+    assert prompt_stats == stats and context.strip() in prompt
+
+
 if __name__ == "__main__":
     test_build_prompt_with_history()
+    test_pack_context_respects_token_budget()
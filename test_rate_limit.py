@@ -0,0 +1,99 @@
+"""
+Tests for the client-side LLM rate limiter
+"""
+
+import os
+import sys
+import threading
+from time import monotonic
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Cancer_chatbot"))
+
+from rate_limit import RateLimiter, RateLimitExceeded, quota_limits
+
+
+def test_requests_per_minute_spill_over_to_the_next_key():
+    """A key out of requests hands calls to the next key, and a call that cannot be served in time is shed"""
+    limiter = RateLimiter(rpm=2, tpm=0, max_concurrency=0, max_waiters=4, max_wait=0.5)
+    keys = ["key-a", "key-b"]
+
+    chosen = []
+    for _ in range(4):
+        reservation = limiter.acquire(keys, "llama", tokens=100)
+        chosen.append(reservation.key)
+        reservation.release(used_tokens=100)
+    assert chosen == ["key-a", "key-a", "key-b", "key-b"]
+
+    t0 = monotonic()
+    try:
+        limiter.acquire(keys, "llama", tokens=100)
+        assert False, "both keys are out of requests for ~30s"
+    except RateLimitExceeded as e:
+        print(e, e.retry_after)
+        assert monotonic() - t0 < 0.1, "a wait longer than the deadline is shed without waiting"
+        assert 25 < e.retry_after <= 30
+
+    assert limiter.acquire(keys, "other-model", tokens=100).key == "key-a", "limits are per model"
+    assert limiter.stats()["shed"] == 1
+
+
+def test_token_usage_is_reconciled_and_waiters_are_bounded():
+    """Actual usage replaces the estimate, callers wait for refill within the deadline, and excess waiters are shed"""
+    limiter = RateLimiter(rpm=0, tpm=600, max_concurrency=0, max_waiters=1, max_wait=2)
+
+    reservation = limiter.acquire(["key-a"], "llama", tokens=500)
+    reservation.release(used_tokens=590)
+    assert limiter.stats()["buckets"]["...ey-a/llama"]["tokens_available"] < 11
+
+    # 600 tokens per minute refill at 10/s: 20 tokens need about a second
+    results = []
+
+    def call():
+        try:
+            limiter.acquire(["key-a"], "llama", tokens=20).release(used_tokens=20)
+            results.append("ok")
+        except RateLimitExceeded:
+            results.append("shed")
+
+    t0 = monotonic()
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(results, limiter.stats())
+    assert results.count("ok") >= 1 and results.count("shed") >= 1
+    assert 0.5 < monotonic() - t0 < 3
+    assert limiter.stats()["waited"] >= 1
+
+
+def test_concurrency_limit_waits_for_a_release():
+    """With every slot in use, a call waits until one is released"""
+    limiter = RateLimiter(rpm=0, tpm=0, max_concurrency=1, max_waiters=2, max_wait=2)
+    held = limiter.acquire(["key-a"], "llama", tokens=10)
+    threading.Timer(0.2, held.release).start()
+
+    t0 = monotonic()
+    limiter.acquire(["key-a"], "llama", tokens=10).release()
+    assert 0.15 < monotonic() - t0 < 1
+
+
+def test_unset_caps_follow_from_the_key_quotas():
+    """Without explicit caps, concurrency and waiters grow with the quotas and the number of keys"""
+    assert quota_limits(2, rpm=15, tpm=6000, max_wait=20, call_tokens=2500) == (3, 2), "the free tier, bound by tokens"
+    assert quota_limits(4, rpm=1000, tpm=0, max_wait=20) == (1000, 1334)
+    assert quota_limits(2, rpm=0, tpm=0) == (0, 0), "no quota, no caps"
+
+    limiter = RateLimiter(rpm=600, tpm=0, max_wait=10, num_keys=3, max_concurrency=None, max_waiters=None)
+    assert (limiter.max_concurrency, limiter.max_waiters) == (600, 300)
+    limiter = RateLimiter(rpm=600, tpm=0, max_concurrency=4, max_waiters=16)
+    assert (limiter.max_concurrency, limiter.max_waiters) == (4, 16), "explicit caps win"
+
+
+if __name__ == "__main__":
+    test_requests_per_minute_spill_over_to_the_next_key()
+    test_token_usage_is_reconciled_and_waiters_are_bounded()
+    test_concurrency_limit_waits_for_a_release()
+    test_unset_caps_follow_from_the_key_quotas()
+    print("\n✅ SUCCESS: All rate limiter checks passed!")
@@ -0,0 +1,98 @@
+"""
+Tests for the Grafana metrics rollups.
+
+The live test needs a Postgres server, e.g. the one from docker-compose (it recreates the tables):
+
+    docker compose up -d postgres
+    TEST_POSTGRES=1 POSTGRES_HOST=localhost python test_rollups.py
+"""
+
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from time import sleep
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Cancer_chatbot"))
+
+from rollups import RollupRefresher
+
+
+def test_refresher_runs_periodically_and_survives_failures():
+    """The refresher calls refresh on its interval, counts minutes and keeps going after an error"""
+    calls = []
+
+    def refresh(batch_size):
+        calls.append(batch_size)
+        if len(calls) == 2:
+            raise ConnectionError("database is down")
+        return 3
+
+    refresher = RollupRefresher(refresh=refresh, interval=0.02, batch_size=7).ensure_started()
+    for _ in range(200):
+        if len(calls) >= 3:
+            break
+        sleep(0.01)
+    refresher.stop()
+
+    stats = refresher.stats()
+    print(stats)
+    assert calls[:3] == [7, 7, 7]
+    assert stats["failures"] == 1 and stats["runs"] >= 2
+    assert stats["minutes_refreshed"] == 3 * stats["runs"]
+    assert "database is down" in stats["last_error"]
+
+
+def test_live_postgres_rollups():
+    """Rollups match the raw rows, per model and for 'all', and pick up late relevance updates (TEST_POSTGRES=1)"""
+    if os.getenv("TEST_POSTGRES") != "1":
+        print("  TEST_POSTGRES not set, skipping")
+        return
+
+    import db
+    db.USE_DB = True
+    db.DB_WRITE_BEHIND = False
+    db.init_db()
+
+    start = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+    ids = []
+    for n in range(10):
+        ids.append(str(uuid.uuid4()))
+        db.save_conversation(ids[-1], "q", {
+            "answer": "a", "model_used": "gpt-oss" if n % 2 else "llama", "response_time": float(n),
+            "relevance": "PENDING", "relevance_explanation": "", "prompt_tokens": 10, "completion_tokens": 5,
+            "total_tokens": 15, "eval_prompt_tokens": 0, "eval_completion_tokens": 0, "eval_total_tokens": 0,
+            "openai_cost": 0.0,
+        }, timestamp=start + timedelta(seconds=20 * n))
+    db.save_feedback(ids[0], 1, timestamp=start + timedelta(minutes=5))
+    assert db.refresh_rollups() == 5
+
+    db.update_relevance([{
+        "conversation_id": ids[1], "relevance": "RELEVANT", "relevance_explanation": "ok",
+        "eval_prompt_tokens": 3, "eval_completion_tokens": 2, "eval_total_tokens": 5,
+    }])
+    assert db.refresh_rollups() == 1, "only the minute of the updated conversation is recomputed"
+
+    with db.db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT model_used, conversations, response_time_p50, total_tokens, relevant, thumbs_up
+                FROM metrics_hour ORDER BY model_used
+            """)
+            rows = cur.fetchall()
+            cur.execute("SELECT SUM(conversations), SUM(thumbs_up) FROM metrics_minute WHERE model_used = 'all'")
+            minute_totals = cur.fetchone()
+
+    print(rows)
+    assert rows == [
+        ("all", 10, 4.5, 150, 1, 1),
+        ("gpt-oss", 5, 5.0, 75, 1, 0),
+        ("llama", 5, 4.0, 75, 0, 1),
+    ]
+    assert minute_totals == (10, 1)
+
+
+if __name__ == "__main__":
+    test_refresher_runs_periodically_and_survives_failures()
+    test_live_postgres_rollups()
+    print("\n✅ SUCCESS: All rollup checks passed!")
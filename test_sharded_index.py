@@ -0,0 +1,79 @@
+"""
+Tests for sharded search over shard processes (Cancer_chatbot/sharded_index.py)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Cancer_chatbot"))
+
+import minsearch
+from sharded_index import ShardedIndex
+
+DOCS = [
+    {"id": 0, "question": "What is lung cancer?", "answer": "Lung cancer forms in the tissues of the lung.", "topic": "lung"},
+    {"id": 1, "question": "What are the stages of lung cancer?", "answer": "Stages range from 0 to IV depending on spread.", "topic": "lung"},
+    {"id": 2, "question": "What is leukemia?", "answer": "Leukemia is a cancer of the blood-forming tissues.", "topic": "blood"},
+    {"id": 3, "question": "How is breast cancer treated?", "answer": "Treatment includes surgery, radiation and chemotherapy.", "topic": "breast"},
+    {"id": 4, "question": "What causes skin cancer?", "answer": "Ultraviolet radiation from the sun is the main cause.", "topic": "skin"},
+    {"id": 5, "question": "Is lung cancer treated with radiation?", "answer": "Radiation therapy treats some lung tumors.", "topic": "lung"},
+    {"id": 6, "question": "What are leukemia symptoms?", "answer": "Fatigue, infections and easy bleeding of the blood.", "topic": "blood"},
+]
+
+QUERIES = [
+    "lung cancer stages",
+    "blood cancer",
+    "radiation treatment for breast cancer",
+    "what causes skin cancer",
+    "unrelated words only",
+]
+
+
+def result_ids(results):
+    return [doc["id"] for doc in results]
+
+
+def test_shards_return_the_global_top_k():
+    """Merged shard rankings equal the whole index's for every retrieval mode, filter and batch"""
+    for engine, scorer in (("dense", "tfidf"), ("inverted", "bm25")):
+        index = minsearch.Index(text_fields=["question", "answer"], keyword_fields=["id", "topic"], engine=engine,
+                                scorer=scorer, retrieval="hybrid", lsa_params={"dims": 4}).fit(DOCS)
+        index.delete([6])
+        with ShardedIndex(index, 3) as sharded:
+            assert sharded.num_docs == 6
+            for mode in minsearch.RETRIEVAL_MODES:
+                batched = sharded.search_batch(QUERIES, num_results=4, retrieval=mode)
+                for query, results in zip(QUERIES, batched):
+                    expected = result_ids(index.search(query, num_results=4, retrieval=mode))
+                    assert result_ids(results) == expected, (engine, mode, query)
+                    assert result_ids(sharded.search(query, num_results=4, retrieval=mode)) == expected
+
+            lung = {"topic": "lung"}
+            expected = result_ids(index.search("radiation", filter_dict=lung, retrieval="lexical"))
+            assert result_ids(sharded.search("radiation", filter_dict=lung, retrieval="lexical")) == expected == [5]
+
+
+def test_in_process_shards_and_errors():
+    """processes=False searches the same shards in-process; a shard's error reaches the caller"""
+    index = minsearch.Index(text_fields=["question", "answer"], keyword_fields=["id"]).fit(DOCS)
+    shard = index.subset([2, 3])
+    assert result_ids(shard.docs) == [2, 3] and shard.vectorizers is not index.vectorizers
+    assert shard.vectorizers["answer"] is index.vectorizers["answer"], "shards share the fitted vocabulary"
+
+    in_process = ShardedIndex(index, 2, processes=False)
+    assert [result_ids(r) for r in in_process.search_batch(QUERIES)] == [result_ids(index.search(q)) for q in QUERIES]
+
+    with ShardedIndex(index, 2) as sharded:
+        try:
+            sharded.search("lung", retrieval="lsa")
+        except ValueError as e:
+            print(f"  raised: {e}")
+        else:
+            raise AssertionError("expected ValueError for LSA retrieval without LSA vectors")
+        assert result_ids(sharded.search("leukemia")) == [2, 6], "shard processes keep serving after an error"
+
+
+if __name__ == "__main__":
+    test_shards_return_the_global_top_k()
+    test_in_process_shards_and_errors()
+    print("\n✅ SUCCESS: All sharded search checks passed!")
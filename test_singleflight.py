@@ -0,0 +1,119 @@
+"""
+Tests for coalescing identical in-flight questions in front of rag.rag, with the LLM calls replaced
+"""
+
+import os
+import sys
+import threading
+from time import sleep
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(ROOT, "Cancer_chatbot")
+sys.path.insert(0, APP_DIR)
+
+from singleflight import SingleFlight
+
+
+def import_rag():
+    # rag builds its index at import time from a path relative to Cancer_chatbot/
+    cwd = os.getcwd()
+    os.chdir(APP_DIR)
+    try:
+        import rag
+    finally:
+        os.chdir(cwd)
+    return rag
+
+
+def run_together(count, target):
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(n):
+        barrier.wait()
+        try:
+            results[n] = target(n)
+        except Exception as e:
+            results[n] = e
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_single_flight_shares_results_and_errors():
+    """Concurrent callers of a key share one call's result or exception; nothing is kept afterwards"""
+    flight = SingleFlight()
+    runs = []
+
+    def slow(value):
+        runs.append(value)
+        sleep(0.2)
+        if value == "boom":
+            raise ValueError("boom")
+        return value
+
+    results = run_together(5, lambda n: flight.do("a", lambda: slow(n)))
+    print(results)
+    assert len(runs) == 1
+    assert [value for value, _ in results] == [runs[0]] * 5
+    assert sorted(shared for _, shared in results) == [False] + [True] * 4
+
+    results = run_together(3, lambda n: flight.do("b", lambda: slow("boom")))
+    assert all(isinstance(result, ValueError) for result in results), "waiters raise the caller's exception"
+
+    assert flight.do("a", lambda: "again") == ("again", False)
+    stats = flight.stats()
+    print(stats)
+    assert stats == {"in_flight": 0, "calls": 3, "shared": 6, "failures": 1, "max_waiters": 4}
+
+
+def test_rag_coalesces_identical_questions():
+    """Identically normalized questions share one search + LLM + judge chain; history-dependent ones do not"""
+    rag = import_rag()
+    calls = []
+
+    def fake_llm(prompt, model="gpt-oss", system=None):
+        calls.append("llm")
+        sleep(0.3)
+        return "A cancer of the blood.", {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+
+    def fake_evaluate_relevance(question, answer, model="gpt-oss"):
+        calls.append("eval")
+        return {"Relevance": "RELEVANT", "Explanation": "ok"}, {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}
+
+    originals = (rag.llm, rag.evaluate_relevance, rag.question_flight)
+    rag.llm = fake_llm
+    rag.evaluate_relevance = fake_evaluate_relevance
+    rag.question_flight = SingleFlight()
+    try:
+        questions = ["What is leukemia coalescing test?", "what is LEUKEMIA coalescing test", "What is leukemia coalescing test??"]
+        results = run_together(6, lambda n: rag.rag(questions[n % 3]))
+        assert calls == ["llm", "eval"], calls
+
+        calls.clear()
+        history = [{"role": "user", "content": "I have leukemia"}, {"role": "assistant", "content": "I see."}]
+        run_together(2, lambda n: rag.rag("What about its treatment coalescing test?", conversation_history=history))
+        assert calls.count("llm") == 2, "answers that depend on the conversation are never shared"
+        stats = rag.question_flight.stats()
+    finally:
+        rag.llm, rag.evaluate_relevance, rag.question_flight = originals
+
+    print(stats)
+    assert stats["calls"] == 1 and stats["shared"] == 5
+
+    owner = [r for r in results if not r.get("coalesced")]
+    shared = [r for r in results if r.get("coalesced")]
+    assert len(owner) == 1 and len(shared) == 5
+    assert owner[0]["total_tokens"] == 15 and owner[0]["eval_total_tokens"] == 7
+    assert all(r["answer"] == "A cancer of the blood." and r["total_tokens"] == 0 for r in shared)
+    assert all(r["relevance"] == "RELEVANT" and not r["cache_hit"] for r in shared)
+
+
+if __name__ == "__main__":
+    test_single_flight_shares_results_and_errors()
+    test_rag_coalesces_identical_questions()
+    print("\n✅ SUCCESS: All coalescing checks passed!")
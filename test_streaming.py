@@ -0,0 +1,80 @@
+"""
+Tests for the server-sent events /question/stream endpoint, with the LLM calls replaced
+"""
+
+import os
+import sys
+import json
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(ROOT, "Cancer_chatbot")
+
+
+def import_app():
+    # rag builds its index at import time from a path relative to Cancer_chatbot/
+    sys.path.insert(0, APP_DIR)
+    cwd = os.getcwd()
+    os.chdir(APP_DIR)
+    try:
+        import app
+        import rag
+    finally:
+        os.chdir(cwd)
+    return app, rag
+
+
+def parse_events(body):
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_question_stream_sends_sources_then_tokens_and_saves_after():
+    """Sources come first, tokens follow, and the relevance eval and save happen once the stream is done"""
+    app, rag = import_app()
+    calls = []
+
+    def fake_llm_stream(prompt, model="gpt-oss", system=None):
+        for token in ["Leukemia ", "is a ", "blood cancer."]:
+            calls.append("token")
+            yield "token", token
+        yield "usage", {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13}
+
+    def fake_evaluate_relevance(question, answer, model="gpt-oss"):
+        calls.append("eval")
+        return {"Relevance": "RELEVANT", "Explanation": "ok"}, {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}
+
+    saved = []
+    originals = (rag.llm_stream, rag.evaluate_relevance, app.store_conversation, app.EVAL_ASYNC)
+    rag.llm_stream = fake_llm_stream
+    rag.evaluate_relevance = fake_evaluate_relevance
+    app.store_conversation = lambda conversation_id, question, answer_data: saved.append(answer_data)
+    app.EVAL_ASYNC = False  # judge inline rather than in the background queue
+    try:
+        client = app.app.test_client()
+        response = client.post("/question/stream", json={"question": "What is leukemia streaming test?"})
+        body = response.get_data(as_text=True)
+        response.close()
+    finally:
+        rag.llm_stream, rag.evaluate_relevance, app.store_conversation, app.EVAL_ASYNC = originals
+
+    assert response.mimetype == "text/event-stream"
+    events = parse_events(body)
+    print([event for event, _ in events])
+
+    assert events[0][0] == "sources" and events[0][1], "retrieval sources are sent before any token"
+    assert {"id", "title", "snippet"} <= set(events[0][1][0])
+    assert "".join(data for event, data in events if event == "token") == "Leukemia is a blood cancer."
+    assert events[-1][0] == "done"
+    assert 0 <= events[-1][1]["first_token_time"] <= events[-1][1]["response_time"]
+
+    assert calls == ["token", "token", "token", "eval"], "relevance is evaluated after the last token"
+    assert len(saved) == 1 and saved[0]["relevance"] == "RELEVANT" and saved[0]["eval_total_tokens"] == 7
+    assert saved[0]["total_tokens"] == 13 and "cacheable" not in saved[0]
+
+
+if __name__ == "__main__":
+    test_question_stream_sends_sources_then_tokens_and_saves_after()
+    print("\n✅ SUCCESS: All streaming checks passed!")
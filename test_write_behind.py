@@ -0,0 +1,199 @@
+"""
+Tests for the write-behind buffer that batches conversation, feedback and relevance writes.
+"""
+
+import os
+import sys
+import glob
+import tempfile
+import threading
+from datetime import datetime, timezone
+from time import sleep
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Cancer_chatbot"))
+
+from write_behind import WriteBehindBuffer
+
+
+class ConnectionLost(Exception):
+    pass
+
+
+class FakeDatabase:
+    """Records flushed batches; raises ConnectionLost while down and ValueError for rows marked bad."""
+
+    def __init__(self):
+        self.batches = []
+        self.down = False
+        self.lock = threading.Lock()
+
+    def flush(self, writes):
+        if self.down:
+            raise ConnectionLost("could not connect to server")
+        if any(row.get("bad") for _, row in writes):
+            raise ValueError("violates foreign key constraint")
+        with self.lock:
+            self.batches.append(list(writes))
+
+    @property
+    def rows(self):
+        return [write for batch in self.batches for write in batch]
+
+
+def make_buffer(database, journal_dir, **kwargs):
+    kwargs.setdefault("batch_size", 3)
+    kwargs.setdefault("flush_interval", 0.05)
+    return WriteBehindBuffer(database.flush, retryable=lambda e: isinstance(e, ConnectionLost),
+                             journal_dir=journal_dir, **kwargs)
+
+
+def wait_for(condition, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return True
+        sleep(0.01)
+    return condition()
+
+
+def test_batches_by_size_and_time():
+    """Full batches are flushed at batch_size, a partial one after flush_interval, in order"""
+    database = FakeDatabase()
+    with tempfile.TemporaryDirectory() as journal_dir:
+        buffer = make_buffer(database, journal_dir, flush_interval=0.3)
+        for n in range(4):
+            buffer.add("conversation", {"id": str(n)})
+
+        assert wait_for(lambda: len(database.batches) == 2)
+        assert [len(batch) for batch in database.batches] == [3, 1]
+        assert [row["id"] for _, row in database.rows] == ["0", "1", "2", "3"]
+
+        stats = buffer.stats()
+        print(stats)
+        assert (stats["added"], stats["written"], stats["batches"], stats["depth"]) == (4, 4, 2, 0)
+        buffer.close()
+
+
+def test_journals_while_down_and_replays_in_order():
+    """Batches that fail with a connection error are journaled and written first once the database is back"""
+    database = FakeDatabase()
+    database.down = True
+    with tempfile.TemporaryDirectory() as journal_dir:
+        buffer = make_buffer(database, journal_dir)
+        stamp = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+        buffer.add("conversation", {"id": "a", "timestamp": stamp})
+        buffer.add("relevance", {"conversation_id": "a", "relevance": "RELEVANT"})
+
+        assert wait_for(lambda: buffer.stats()["journal_rows"] == 2)
+        assert buffer.stats()["failed_batches"] >= 1
+
+        database.down = False
+        buffer.add("feedback", {"conversation_id": "a", "feedback": 1})
+        assert wait_for(lambda: len(database.rows) == 3)
+
+        assert [kind for kind, _ in database.rows] == ["conversation", "relevance", "feedback"]
+        assert database.rows[0][1]["timestamp"] == stamp.isoformat(), "datetimes are journaled as ISO strings"
+        stats = buffer.stats()
+        print(stats)
+        assert stats["replayed"] == 2 and stats["journal_rows"] == 0
+        buffer.close()
+
+
+def test_bad_rows_are_rejected_without_blocking_others():
+    """A row the database refuses is set aside; the rest of its batch is still written"""
+    database = FakeDatabase()
+    with tempfile.TemporaryDirectory() as journal_dir:
+        buffer = make_buffer(database, journal_dir)
+        buffer.add("conversation", {"id": "a"})
+        buffer.add("feedback", {"conversation_id": "missing", "bad": True})
+        buffer.add("conversation", {"id": "b"})
+
+        assert wait_for(lambda: len(database.rows) == 2)
+        assert [row["id"] for _, row in database.rows] == ["a", "b"]
+        assert (buffer.stats()["rejected"], buffer.stats()["written"]) == (1, 2)
+        assert len(glob.glob(os.path.join(journal_dir, "rejected-*.jsonl"))) == 1
+        buffer.close()
+
+
+def test_full_queue_spills_and_close_flushes():
+    """Writes beyond max_size go to the journal and close() writes out everything still pending"""
+    database = FakeDatabase()
+    with tempfile.TemporaryDirectory() as journal_dir:
+        buffer = make_buffer(database, journal_dir, max_size=2)
+        buffer._pid = os.getpid()  # no flusher thread, as if it had fallen behind
+        for n in range(5):
+            buffer.add("conversation", {"id": str(n)})
+        assert buffer.stats()["journaled"] == 3
+
+        buffer.close(timeout=0.1)
+        print(buffer.stats())
+        assert sorted(row["id"] for _, row in database.rows) == ["0", "1", "2", "3", "4"]
+        assert buffer.stats()["journal_rows"] == 0
+
+
+class MissingConversation(Exception):
+    pass
+
+
+def test_rows_missing_their_conversation_are_deferred():
+    """Feedback that arrives before its conversation is retried a few times, then rejected"""
+    database = FakeDatabase()
+    conversations = set()
+
+    def flush(writes):
+        for kind, row in writes:
+            if kind == "feedback" and row["conversation_id"] not in conversations:
+                raise MissingConversation("violates foreign key constraint")
+        database.flush(writes)
+
+    with tempfile.TemporaryDirectory() as journal_dir:
+        buffer = WriteBehindBuffer(flush, retryable=lambda e: isinstance(e, ConnectionLost),
+                                   deferrable=lambda e: isinstance(e, MissingConversation),
+                                   batch_size=3, flush_interval=0.1, journal_dir=journal_dir, max_deferrals=3)
+        buffer.add("feedback", {"conversation_id": "late", "feedback": 1})
+        buffer.add("feedback", {"conversation_id": "never", "feedback": -1})
+        assert wait_for(lambda: buffer.stats()["deferred"] == 2)
+
+        conversations.add("late")  # written meanwhile by another worker
+        assert wait_for(lambda: buffer.stats()["rejected"] == 1)
+        stats = buffer.stats()
+        print(stats)
+        assert [row["conversation_id"] for _, row in database.rows] == ["late"]
+        assert (stats["written"], stats["deferred"]) == (1, 0)
+        buffer.close()
+
+
+def test_flusher_survives_errors_and_torn_journal_lines():
+    """An unexpected error does not stop the flusher, and a torn journal line does not block the rest"""
+    database = FakeDatabase()
+    with tempfile.TemporaryDirectory() as journal_dir:
+        with open(os.path.join(journal_dir, "writes-1.jsonl"), "w") as f:
+            f.write('["conversation", {"id": "journaled"}]\n["conversation", {"id": "to')
+
+        buffer = make_buffer(database, journal_dir)
+        collect = buffer._collect
+        failures = []
+
+        def failing_collect():
+            if not failures:
+                failures.append(True)
+                raise OSError("No space left on device")
+            return collect()
+
+        buffer._collect = failing_collect
+        buffer.add("conversation", {"id": "a"})
+        assert wait_for(lambda: len(database.rows) == 2)
+
+        print(buffer.stats())
+        assert [row["id"] for _, row in database.rows] == ["journaled", "a"]
+        assert buffer.stats()["errors"] == 1 and buffer.stats()["journal_rows"] == 0
+        buffer.close()
+
+
+if __name__ == "__main__":
+    test_batches_by_size_and_time()
+    test_journals_while_down_and_replays_in_order()
+    test_bad_rows_are_rejected_without_blocking_others()
+    test_full_queue_spills_and_close_flushes()
+    test_rows_missing_their_conversation_are_deferred()
+    test_flusher_survives_errors_and_torn_journal_lines()
+    print("\n✅ SUCCESS: All write-behind checks passed!")